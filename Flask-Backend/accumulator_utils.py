@@ -0,0 +1,136 @@
+from typing import Dict, Iterable, Optional
+import numpy as np
+
+# What WalkAccumulator counts: the final state of every walker, or every state visited up to the hitting time
+ACCUMULATOR_MODES = ('final', 'all_steps')
+
+
+class WalkAccumulator:
+    """
+    Collects the statistics of a batch of walkers as they are simulated, in memory independent of the number of walkers.
+
+    Simulators push the states of their walkers into it step by step (or all at once), the accumulator keeps only
+    int64 arrays: the occupancy of the states, the histogram of the hitting times and the occupancy at the
+    snapshot steps. Accumulators of separate batches are combined with merge.
+
+    Args:
+        n_states: The number of states of the walk.
+        mode: 'final' to count the final state of every walker, 'all_steps' to count every state visited up to
+              the hitting time, the target being counted once.
+        snapshot_steps: The steps after which the occupancy of all walkers is also kept, absorbed walkers
+                        counted on the target.
+    """
+
+    def __init__(self, n_states: int, mode: str = 'final', snapshot_steps: Iterable[int] = ()):
+        if mode not in ACCUMULATOR_MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {list(ACCUMULATOR_MODES)}")
+        self.n_states = int(n_states)
+        self.mode = mode
+        self.snapshot_steps = frozenset(int(step) for step in snapshot_steps)
+        self.occupancy = np.zeros(self.n_states, dtype=np.int64)
+        self.snapshots: Dict[int, np.ndarray] = {}
+        self.hitting_time_counts = np.zeros(0, dtype=np.int64)
+        self.walkers = 0
+
+    @property
+    def all_steps(self) -> bool:
+        return self.mode == 'all_steps'
+
+    def _count(self, states: np.ndarray) -> np.ndarray:
+        return np.bincount(np.asarray(states).ravel(), minlength=self.n_states)
+
+    def add_visits(self, states: np.ndarray):
+        """
+        Counts states visited in one step, in 'all_steps' mode.
+        """
+        if self.all_steps:
+            self.occupancy += self._count(states)
+
+    def add_snapshot(self, step: int, states: np.ndarray):
+        """
+        Counts the states of all walkers after a step, if it is one of the snapshot steps.
+        """
+        if step in self.snapshot_steps:
+            counts = self._count(states)
+            if step in self.snapshots:
+                self.snapshots[step] += counts
+            else:
+                self.snapshots[step] = counts
+
+    def add_final(self, states: np.ndarray):
+        """
+        Counts the final states of the walkers, in 'final' mode.
+        """
+        if not self.all_steps:
+            self.occupancy += self._count(states)
+
+    def add_hitting_times(self, hitting_times: np.ndarray):
+        """
+        Counts the walkers and their hitting times, -1 for walkers that did not reach the target.
+        """
+        hitting_times = np.asarray(hitting_times)
+        self.walkers += hitting_times.size
+        self._add_hitting_time_counts(np.bincount(hitting_times[hitting_times >= 0]))
+
+    def _add_hitting_time_counts(self, counts: np.ndarray):
+        if len(counts) > len(self.hitting_time_counts):
+            counts, self.hitting_time_counts = self.hitting_time_counts, counts.astype(np.int64)
+        self.hitting_time_counts[:len(counts)] += counts
+
+    def add_walks(self, walks: np.ndarray, hitting_times: np.ndarray):
+        """
+        Counts recorded walks, an (n_sims, n + 1) array where absorbed walkers stay on the target, in every mode.
+        """
+        walks = np.asarray(walks)
+        hitting_times = np.asarray(hitting_times)
+        if self.all_steps:
+            lengths = np.where(hitting_times >= 0, hitting_times + 1, walks.shape[1])
+            self.occupancy += self._count(walks[np.arange(walks.shape[1]) < lengths[:, None]])
+        else:
+            self.occupancy += self._count(walks[:, -1])
+        for step in self.snapshot_steps:
+            if step < walks.shape[1]:
+                self.add_snapshot(step, walks[:, step])
+        self.add_hitting_times(hitting_times)
+
+    def merge(self, other: 'WalkAccumulator') -> 'WalkAccumulator':
+        """
+        Adds the counts of an accumulator of another batch of walkers of the same walk and mode.
+
+        Returns:
+            WalkAccumulator: This accumulator.
+        """
+        if (other.n_states, other.mode) != (self.n_states, self.mode):
+            raise ValueError("Cannot merge accumulators of different walks or modes")
+        self.occupancy += other.occupancy
+        for step, counts in other.snapshots.items():
+            self.snapshots[step] = self.snapshots[step] + counts if step in self.snapshots else counts.copy()
+        self._add_hitting_time_counts(other.hitting_time_counts)
+        self.walkers += other.walkers
+        return self
+
+    def probabilities(self) -> np.ndarray:
+        """
+        Returns the occupancy normalized to a distribution, zeros if nothing was counted.
+        """
+        total = self.occupancy.sum()
+        return self.occupancy / total if total else np.zeros(self.n_states)
+
+    def hitting_time_summary(self) -> Dict[str, Optional[float]]:
+        """
+        Summarizes the hitting times of the walkers that reached the target.
+
+        Returns:
+            dict: The number of walkers, of walkers that reached the target, the fraction that did, and the mean,
+                  standard deviation, minimum and maximum of their hitting times (None if none reached it).
+        """
+        hits = int(self.hitting_time_counts.sum())
+        summary = {'walkers': self.walkers, 'hits': hits, 'hit_fraction': hits / self.walkers if self.walkers else None,
+                   'mean': None, 'std': None, 'min': None, 'max': None}
+        if hits:
+            times = np.arange(len(self.hitting_time_counts))
+            mean = float(times @ self.hitting_time_counts / hits)
+            reached = np.flatnonzero(self.hitting_time_counts)
+            summary.update(mean=mean, std=float(np.sqrt(((times - mean) ** 2) @ self.hitting_time_counts / hits)),
+                           min=int(reached[0]), max=int(reached[-1]))
+        return summary
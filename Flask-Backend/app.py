@@ -1,30 +1,81 @@
+import os
+import numpy as np
 from flask import Flask, request
 from flask_cors import CORS
-from classical_utils import *
-from quantum_utils import *
+from cache_utils import ARTIFACT_CACHE
+from classical_utils import (
+    analyze_state_counts, bar_plot_1d, compute_theoretical_distribution, convert_states_to_coordinates,
+    generate_initial_distribution, get_target_index, heatmap_1d, load_walk_artifacts, load_walk_chain, walk_step_by_step,
+)
+from quantum_utils import bar_quantum, generate_walk, heatmap_quantum, norm_drift, position_probabilities, precision_dtype, results_2_df
+from hitting_utils import expected_hitting_times
+from spectral_utils import assign_mixing_time, spectral_analysis
+from lazy_utils import preload_modules
+from shared_store_utils import SHARED_STORE
+from render_utils import start_frame_pool
+from response_utils import raw_response, requested_raw_format, to_response
+from job_utils import JOB_QUEUE
+from monte_carlo_utils import sharded_simulation, start_simulation_pool
+from trajectory_utils import decode_states
+from task_utils import JOB_PARAMETER_CHECKS, JOB_TASKS, classical_animation_task, multiple_runs_task, quantum_2d_task, sweep_task
+from validation_utils import InvalidParameter
 
 app = Flask(__name__)
 CORS(app)
 
+
+@app.errorhandler(InvalidParameter)
+def invalid_parameter(error):
+    # Parameters are checked where they are used, other errors are answered with 500
+    return {'error': str(error)}, 400
+
+
+def preload():
+    """
+    Imports the plotting and quantum libraries every route may need, which are otherwise imported on first use.
+
+    Meant for pre-fork servers that import the app once and fork their workers from it (gunicorn --preload), the
+    workers then share the imported modules copy-on-write instead of each importing them on its first request.
+    The server process also attaches to SHARED_STORE if it is set, so that the store outlives restarting workers.
+    """
+    if SHARED_STORE is not None:
+        SHARED_STORE.attach()
+    preload_modules()
+
+
+# Set RANDOMWALK_PRELOAD=1 to import everything when the app is loaded
+if os.environ.get('RANDOMWALK_PRELOAD') == '1':
+    preload()
+
+# Set RANDOMWALK_FRAME_WORKERS and RANDOMWALK_SIMULATION_WORKERS to render long animations and simulate large runs
+# in pools of processes
+start_frame_pool()
+start_simulation_pool()
+JOB_QUEUE.start()
+
 @app.route('/classical_1d', methods=['POST'])
 def classical_1d():
     data = request.get_json()
     n = data.get('n')
     n_states = data.get('n_states')
     n_sims = data.get('n_sims')
+    raw_format = requested_raw_format()
 
-    trans = circular_1d_transition_matrix(n_states)
-    states = [str(i) for i in range(n_states)]
-    mc = dtmc.MarkovChain(trans, states)
+    artifacts = load_walk_artifacts('ring', (n_states,))
 
-    all_walks = simulate_multiple_walks_1d(mc, n, n_sims, n_states, states)
+    # Walkers start from the middle of the ring
+    summary = sharded_simulation(artifacts.lattice, n, n_sims, n_states // 2, seed=data.get('seed'))
 
-    df_state_analysis = analyze_walk_data_1d(all_walks, n_states, only_final_steps=True)
+    if raw_format:
+        return raw_response(raw_format, {'occupancy': summary.occupancy.astype(np.int32)}, n=n, n_states=n_states, n_sims=n_sims,
+                            seed=str(summary.seed))
+
+    df_state_analysis = analyze_state_counts(summary.occupancy)
 
     bar_plot_1d_base64 = bar_plot_1d(df_state_analysis)
     heatmap_1d_base64 = heatmap_1d(df_state_analysis)
 
-    result = {"bar_plot_1d": bar_plot_1d_base64, "heat_map_1d": heatmap_1d_base64}
+    result = {"bar_plot_1d": bar_plot_1d_base64, "heat_map_1d": heatmap_1d_base64, "seed": str(summary.seed)}
     return result
 
 @app.route('/process', methods=['POST'])
@@ -34,42 +85,80 @@ def process():
     grid_size = (data.get('grid_x'), data.get('grid_y'))
     target_state = (data.get('target_x'), data.get('target_y'))
 
-    states, initial_dist, mc = initialize_processing(grid_size)
+    artifacts = load_walk_artifacts('torus', grid_size)
 
-    walk, hitting_time = walk_step_by_step(mc, n, target_state, grid_size, states, True)
+    walk, hitting_time = walk_step_by_step(artifacts.lattice, n, target_state, grid_size, True)
 
     x, y = convert_states_to_coordinates(walk, grid_size)
 
-    mixing_time = assign_mixing_time(mc, initial_dist)
+    mixing_time = assign_mixing_time(grid_size)
+    spectrum = spectral_analysis('torus', grid_size)
 
     # Convert the x and y arrays to lists and return as a JSON object
-    result = {'x': x, 'y': y, 'walk': walk, 'grid_x': grid_size[0],
-            'grid_y': grid_size[1], 'hitting_time': hitting_time, 'mixing_time': mixing_time}
+    result = {'x': x, 'y': y, 'walk': walk.labels(), 'grid_x': grid_size[0],
+            'grid_y': grid_size[1], 'hitting_time': hitting_time, 'mixing_time': mixing_time,
+            'spectral_gap': spectrum.spectral_gap, 'relaxation_time': spectrum.relaxation_time if spectrum.ergodic else None,
+            'mixing_time_bounds': list(spectrum.mixing_time_bounds) if spectrum.ergodic else None}
     return result
 
 
 @app.route('/multiple_runs', methods=['POST'])
 def multiple_runs():
+    return to_response(multiple_runs_task(request.get_json(), requested_raw_format()))
+
+
+@app.route('/classical_animation', methods=['POST'])
+def classical_animation():
+    return to_response(classical_animation_task(request.get_json(), requested_raw_format()))
+
+
+@app.route('/sweep', methods=['POST'])
+def sweep():
+    return to_response(sweep_task(request.get_json(), requested_raw_format()))
+
+
+@app.route('/theoretical_distribution', methods=['POST'])
+def theoretical_distribution():
     data = request.get_json()
     n = data.get('n')
     grid_size = (data.get('grid_x'), data.get('grid_y'))
-    target_state = (data.get('target_x'), data.get('target_y'))
     n_sims = data.get('n_sims')
 
-    states, initial_dist, mc = initialize_processing(grid_size)
+    artifacts = load_walk_artifacts('torus', grid_size)
+
+    # The walks start from state 0, as in /process and /multiple_runs
+    initial_dist = generate_initial_distribution(grid_size, 0, is_random=False)
+    df_theoretical = compute_theoretical_distribution(np.arange(artifacts.lattice.size), artifacts.lattice, grid_size, n, initial_dist)
+
+    final_states, _ = artifacts.lattice.simulate(n, n_sims)
+    occurrences = np.bincount(final_states, minlength=artifacts.lattice.size)
+
+    result = {'x': df_theoretical["X"].tolist(), 'y': df_theoretical["Y"].tolist(), 'grid_x': grid_size[0], 'grid_y': grid_size[1],
+              'theoretical': df_theoretical["Probability"].tolist(), 'occurrences': occurrences.tolist(),
+              'sampled': (occurrences / n_sims).tolist()}
+    return result
+
 
-    # Simulate multiple walks
-    all_walks, hitting_times = simulate_multiple_walks(mc, n, n_sims, target_state, grid_size, states, False)
+@app.route('/hitting_times', methods=['POST'])
+def hitting_times():
+    data = request.get_json()
+    grid_size = (data.get('grid_x'), data.get('grid_y'))
+    target_state = (data.get('target_x'), data.get('target_y'))
+    with_variance = data.get('variance', False)
 
-    # Analyze walk data
-    df_state_analysis = analyze_walk_data(all_walks, grid_size, only_final_steps=True)
+    target_index = get_target_index(target_state, grid_size)
+    expected, variances = expected_hitting_times(load_walk_chain('torus', grid_size), target_index, with_variance)
 
-    # Create a plots of occurrences
-    #bar_plot_base64 = bar_plot_occurrences(df_state_analysis)
-    bar_plot_base64 = bar_plot_combined_x_y_occurrences(df_state_analysis)
-    heatmap_base64 = heatmap_occurrences(df_state_analysis)
+    x, y = decode_states(np.arange(len(expected)), grid_size)
+    # JSON has no infinity, states that cannot reach the target get null
+    expected = [None if np.isinf(value) else value for value in expected.tolist()]
+    grid = np.full((y.max() + 1, grid_size[0]), None, dtype=object)
+    grid[y, x] = expected
 
-    result = {"bar_plot": bar_plot_base64, "heat_map": heatmap_base64}
+    result = {'x': x.tolist(), 'y': y.tolist(), 'grid_x': grid_size[0], 'grid_y': grid_size[1], 'hitting_time': expected,
+              'hitting_time_grid': grid.tolist(), 'expected_hitting_time': expected[0]}
+    if with_variance:
+        result['variance'] = [None if np.isinf(value) else value for value in variances.tolist()]
     return result
 
 
@@ -79,47 +168,76 @@ def quantum():
     number_qubits = data.get('number_qubits')
     iterator = data.get('iterator')
     sample_number = data.get('sample_number')
+    engine = data.get('engine', 'cirq')
+    dtype = precision_dtype(data.get('precision', 'complex128'))
+    raw_format = requested_raw_format()
 
-    final, state_vector = generate_walk(number_qubits, iterator, sample_number)
+    final, state_vector = generate_walk(number_qubits, iterator, sample_number, engine=engine, dtype=dtype)
 
     data_final = results_2_df(final, sample_number)
 
+    if raw_format:
+        arrays = {'position': data_final["Position_Vectors"].to_numpy(np.int32), 'occurrences': data_final["Occurances"].to_numpy(np.int32),
+                  'probability': position_probabilities(state_vector, 1)}
+        return raw_response(raw_format, arrays, number_qubits=number_qubits, iterator=iterator, sample_number=sample_number,
+                            norm_drift=norm_drift(state_vector))
+
     barplot_base64 = bar_quantum(data_final)
 
     heatmap_base64 = heatmap_quantum(data_final)
 
     # Convert the x and y arrays to lists and return as a JSON object
-    result = {'bar_plot_q': barplot_base64, 'heatmap_q': heatmap_base64}
+    result = {'bar_plot_q': barplot_base64, 'heatmap_q': heatmap_base64, 'norm_drift': norm_drift(state_vector)}
     return result
 
 
 @app.route('/quantum_2d', methods=['POST'])
 def quantum_2d():
-    data = request.get_json()
-    number_qubits = data.get('number_qubits')
-    iterator = data.get('iterator')
-    sample_number = data.get('sample_number')
-
-    final, state_vector = run_2d_walk(number_qubits, iterator, sample_number)
-
-    data_final = convert_2d_results_to_coordinates(final, number_qubits, sample_number)
-
-    #barplot_base64 = bar_quantum_2d(data_final)
-    barplot_base64 = combined_bar_plot_quantum_2d(data_final)
-
-    heatmap_base64 = heatmap_quantum_2d(data_final)
-
-    list_for_gif_heatmap = []
-
-    for i in range(1, iterator + 1):
-        f_iter, sv_iter = run_2d_walk(number_qubits, i, sample_number)
-        df_iter = convert_2d_results_to_coordinates(f_iter, number_qubits, sample_number)
-        list_for_gif_heatmap.append(df_iter)
-
-    heatmap_gif_base64 = create_base64_gif_from_heatmaps(list_for_gif_heatmap, number_qubits)
-
-    # Convert the x and y arrays to lists and return as a JSON object
-    result = {'bar_plot_q_2d': barplot_base64, 'heatmap_q_2d': heatmap_base64, 'heatmap_q_2d_gif': heatmap_gif_base64}
+    return to_response(quantum_2d_task(request.get_json(), requested_raw_format()))
+
+
+@app.route('/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    if kind not in JOB_TASKS:
+        return {'error': f"Unknown job kind '{kind}', expected one of {sorted(JOB_TASKS)}"}, 404
+    raw_format = requested_raw_format()
+    if kind in JOB_PARAMETER_CHECKS:
+        JOB_PARAMETER_CHECKS[kind](request.get_json())
+    job_id = JOB_QUEUE.submit(kind, JOB_TASKS[kind], request.get_json(), raw_format)
+    return JOB_QUEUE.status(job_id), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = JOB_QUEUE.status(job_id)
+    if status is None:
+        return {'error': f"Unknown or expired job '{job_id}'"}, 404
+    return status
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    status = JOB_QUEUE.status(job_id)
+    if status is None:
+        return {'error': f"Unknown or expired job '{job_id}'"}, 404
+    if status['state'] in ('queued', 'running'):
+        return status, 202
+    if status['state'] != 'done':
+        return status, 500 if status['state'] == 'failed' else 410
+    return to_response(JOB_QUEUE.result(job_id))
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if JOB_QUEUE.status(job_id) is None:
+        return {'error': f"Unknown or expired job '{job_id}'"}, 404
+    return {'job_id': job_id, 'cancelled': JOB_QUEUE.cancel(job_id)}
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    result = {'artifacts': ARTIFACT_CACHE.stats(), 'spectral_analysis': spectral_analysis.cache_info()._asdict(),
+              'shared_store': SHARED_STORE.stats() if SHARED_STORE is not None else None}
     return result
 
 
@@ -0,0 +1,132 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List
+import numpy as np
+from scipy import sparse
+
+_MISSING = object()
+
+
+def estimate_nbytes(value: Any) -> int:
+    """
+    Estimates the memory held by a cached artifact, following arrays, containers and object attributes.
+
+    Args:
+        value: The artifact.
+
+    Returns:
+        int: The estimated footprint in bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if sparse.issparse(value):
+        return sum(estimate_nbytes(getattr(value, name)) for name in ('data', 'indices', 'indptr', 'row', 'col') if hasattr(value, name))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(key) + estimate_nbytes(item) for key, item in value.items())
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + estimate_nbytes(vars(value))
+    return sys.getsizeof(value)
+
+
+class ArtifactCache:
+    """
+    A thread-safe LRU cache that evicts by the memory footprint of its entries instead of their number.
+
+    Args:
+        max_bytes: The total footprint the cache may hold, larger artifacts are built but not cached.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the cached artifact for key, or default on a miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        """
+        Caches an artifact, evicting the least recently used ones to stay within max_bytes.
+
+        Args:
+            key: The key of the artifact.
+            value: The artifact, it is not cached if it is larger than the whole cache.
+
+        Returns:
+            Any: The artifact.
+        """
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return value
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, nbytes)
+                self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_nbytes
+                self.evictions += 1
+            return value
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Any]) -> Any:
+        """
+        Returns the cached artifact for key, building and caching it on a miss.
+
+        Args:
+            key: The key of the artifact.
+            builder: Builds the artifact, called without holding the lock.
+
+        Returns:
+            Any: The artifact.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.put(key, builder())
+        return value
+
+    def keys(self) -> List[Hashable]:
+        """
+        Returns the keys currently cached, from the least to the most recently used.
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'keys': [repr(key) for key in self._entries],
+            }
+
+
+ARTIFACT_CACHE = ArtifactCache(int(os.environ.get('RANDOMWALK_CACHE_BYTES', 512 * 2**20)))
@@ -1,34 +1,78 @@
+from __future__ import annotations
 import base64
 import io
-import imageio
 import time
-from typing import List, Optional, Tuple, Union
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple, Union
 import numpy as np
-import pandas as pd
-import pydtmc as dtmc
-import seaborn as sns
-import matplotlib.pyplot as plt
-from scipy.stats import kde
-plt.switch_backend('agg')
+from scipy import sparse
+from accumulator_utils import WalkAccumulator
+from cache_utils import ARTIFACT_CACHE
+from kde_utils import binned_kde_2d
+from lazy_utils import lazy_import
+from lattice_utils import NEIGHBOR_TABLE_LIMIT, Lattice, ring_lattice, torus_lattice
+from markov_utils import SparseMarkovChain
+from render_utils import FAST_HEATMAP_CELLS, encode_gif_base64, fast_heatmap_base64, heatmap_grid, render_distribution_frame, render_frames, report_frames
+from results_utils import coordinate_labels
+from shared_store_utils import shared_arrays, shared_csr_matrix
+from distribution_utils import TransitionModel, exact_distribution
+from trajectory_utils import Trajectory, decode_states, encode_coordinates, split_trajectories
+from validation_utils import InvalidParameter
+
+# Imported on first use, most routes never need them
+pd = lazy_import('pandas')
+sns = lazy_import('seaborn')
+plt = lazy_import('matplotlib.pyplot', on_load=lambda pyplot: pyplot.switch_backend('agg'))
+
+
+def grid_transition_matrix_sparse(grid_size: Tuple[int, int], teleport_prob: float = 0.15) -> sparse.csr_matrix:
+    """
+    This function creates the sparse part of the transition matrix of generate_markov_chain_matrix.
 
+    The uniform teleport term teleport_prob / (m * n) is left out, it is added by SparseMarkovChain(teleport_prob=...)
+    or by generate_markov_chain_matrix when a dense matrix is needed.
 
-def generate_markov_chain_matrix(grid_size: Tuple[int, int], teleport_prob: float = 0.15) -> np.ndarray:
+    Args:
+        grid_size: A tuple representing the size of the grid (m, n).
+        teleport_prob: Probability of jumping to a uniformly chosen state in each step.
+
+    Returns:
+        A scipy.sparse CSR matrix whose rows sum to 1 - teleport_prob.
+    """
     matrix_size = grid_size[0] * grid_size[1]
-    matrix = np.zeros((matrix_size, matrix_size))
-    transitions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    transitions = np.array([(0, 1), (0, -1), (1, 0), (-1, 0)])
 
-   
-    for i in range(grid_size[0]):
-        for j in range(grid_size[1]):
-            possible_transitions = sum(1 for dx, dy in transitions if 0 <= i + dx < grid_size[0] and 0 <= j + dy < grid_size[1])
-            for dx, dy in transitions:
-                if 0 <= i + dx < grid_size[0] and 0 <= j + dy < grid_size[1]:
-                    matrix[i * grid_size[1] + j][(i + dx) * grid_size[1] + (j + dy)] = (1 - teleport_prob) / possible_transitions
+    i, j = np.divmod(np.arange(matrix_size), grid_size[1])
+    target_i = i[:, None] + transitions[:, 0]
+    target_j = j[:, None] + transitions[:, 1]
+    inside = (0 <= target_i) & (target_i < grid_size[0]) & (0 <= target_j) & (target_j < grid_size[1])
+    possible_transitions = inside.sum(axis=1)
 
+    rows = np.broadcast_to(np.arange(matrix_size)[:, None], inside.shape)[inside]
+    columns = target_i[inside] * grid_size[1] + target_j[inside]
+    data = (1 - teleport_prob) / possible_transitions[rows]
+    return sparse.csr_matrix((data, (rows, columns)), shape=(matrix_size, matrix_size))
+
+
+def generate_markov_chain_matrix(grid_size: Tuple[int, int], teleport_prob: float = 0.15) -> np.ndarray:
+    matrix_size = grid_size[0] * grid_size[1]
+    matrix = grid_transition_matrix_sparse(grid_size, teleport_prob).toarray()
     matrix += teleport_prob / matrix_size
     return matrix
 
 
+def torus_transition_matrix_sparse(grid_size: tuple) -> sparse.csr_matrix:
+    """
+    This function creates a sparse transition matrix for a random walk on a torus.
+
+    Args:
+        grid_size: A tuple representing the size of the torus grid (m, n).
+
+    Returns:
+        A scipy.sparse CSR matrix representing the transition matrix.
+    """
+    return torus_lattice(grid_size).transition_matrix()
+
+
 def torus_transition_matrix(grid_size: tuple) -> np.ndarray:
   """
   This function creates a transition matrix for a random walk on a torus.
@@ -39,34 +83,20 @@ def torus_transition_matrix(grid_size: tuple) -> np.ndarray:
   Returns:
       A numpy array representing the transition matrix.
   """
-  matrix_size = grid_size[0] * grid_size[1]
-  P = np.zeros((matrix_size, matrix_size))
-
-  if (grid_size[0] == grid_size[1]):
-     for i in range(matrix_size):
-        x = i % grid_size[0]
-        y = i // grid_size[1]
-        neighbors = [(i + grid_size[0]) % matrix_size, # Upper
-                     (i - grid_size[0]) % matrix_size, # Lower
-                     y * grid_size[0] + (x - 1 + grid_size[0]) % grid_size[0], # Left
-                     y * grid_size[0] + (x + 1) % grid_size[0]] # Right
-        for neighbor in neighbors:
-           P[i][neighbor] += 1/4
-
+  return torus_transition_matrix_sparse(grid_size).toarray()
 
-  elif (grid_size[0] != grid_size[1]):
-      for i in range(matrix_size):
 
-        # Define neighbors with proper wrapping for torus
-        neighbors = [(i - grid_size[0]) % matrix_size, # Upper
-                     (i + grid_size[0]) % matrix_size, # Lower
-                     (i - grid_size[1]) % matrix_size, # Left
-                     (i + grid_size[1]) % matrix_size] # Right
+def circular_1d_transition_matrix_sparse(num_states: int) -> sparse.csr_matrix:
+    """
+    This function creates a sparse transition matrix for a 1D random walk on a circle.
 
-        for neighbor in neighbors:
-            P[i][neighbor] += 1/4
+    Args:
+        num_states: The number of states in the circular random walk.
 
-  return P
+    Returns:
+        A scipy.sparse CSR matrix representing the transition matrix.
+    """
+    return ring_lattice(num_states).transition_matrix()
 
 
 def circular_1d_transition_matrix(num_states: int) -> np.ndarray:
@@ -79,139 +109,188 @@ def circular_1d_transition_matrix(num_states: int) -> np.ndarray:
     Returns:
         A numpy array representing the transition matrix.
     """
+    return circular_1d_transition_matrix_sparse(num_states).toarray()
+
+
+class WalkArtifacts(NamedTuple):
+    initial_dist: np.ndarray
+    lattice: Lattice
+
+
+def load_walk_artifacts(topology: str, size: Tuple[int, ...]) -> WalkArtifacts:
+    """
+    This function returns the initial distribution and lattice of a walk from the process-wide cache.
+
+    The lattice is all the simulations and exact distributions need, the transition matrix and Markov chain
+    are only built by load_walk_chain.
+
+    Args:
+        topology: 'torus' with size (m, n) or 'ring' with size (n_states,).
+        size: The grid size or number of states.
+
+    Returns:
+        WalkArtifacts: The artifacts, built on the first request for the key.
+    """
+    def build() -> WalkArtifacts:
+        if topology == 'torus':
+            lattice = torus_lattice(size)
+            initial_dist = generate_initial_distribution(size)
+        elif topology == 'ring':
+            lattice = ring_lattice(size[0])
+            initial_dist = np.ones(size[0]) / size[0]
+        else:
+            raise ValueError(f"Unknown topology '{topology}'")
+
+        # Build the neighbor table up front so that it is accounted for in the cache footprint, it is shared with
+        # the other workers when SHARED_STORE is set
+        if lattice.size * len(lattice.stencil) <= NEIGHBOR_TABLE_LIMIT:
+            neighbors = shared_arrays(('neighbors',) + lattice.key, lambda: {'neighbors': lattice.neighbors()})
+            lattice.use_neighbors(neighbors['neighbors'])
+        return WalkArtifacts(initial_dist, lattice)
+
+    return ARTIFACT_CACHE.get_or_build((topology, tuple(size)), build)
+
+
+def load_walk_chain(topology: str, size: Tuple[int, ...], teleport_prob: float = 0.0) -> SparseMarkovChain:
+    """
+    This function returns the Markov chain of a walk from the process-wide cache, for the routes that need its
+    transition matrix, e.g. for hitting times.
 
-    P = np.zeros((num_states, num_states))
+    Args:
+        topology: 'torus' with size (m, n), 'ring' with size (n_states,) or 'grid' with size (m, n).
+        size: The grid size or number of states.
+        teleport_prob: Probability of jumping to a uniformly chosen state in each step, only used by 'grid'.
 
-    for i in range(num_states):
-        # Set the probability of moving left and right with wrapping
-        P[i][(i - 1) % num_states] = 0.5  # Move left with wrapping
-        P[i][(i + 1) % num_states] = 0.5  # Move right with wrapping
+    Returns:
+        SparseMarkovChain: The chain, built on the first request for the key.
+    """
+    def build() -> SparseMarkovChain:
+        # The transition matrix is shared with the other workers when SHARED_STORE is set
+        if topology == 'grid':
+            trans = shared_csr_matrix(('grid_transition_matrix', tuple(size), teleport_prob),
+                                      lambda: grid_transition_matrix_sparse(size, teleport_prob))
+        else:
+            lattice = load_walk_artifacts(topology, size).lattice
+            trans = shared_csr_matrix(('transition_matrix',) + lattice.key, lattice.transition_matrix)
+        return SparseMarkovChain(trans, teleport_prob=teleport_prob, shared_key=(topology, tuple(size), teleport_prob))
 
-    return P
+    return ARTIFACT_CACHE.get_or_build(('chain', topology, tuple(size), teleport_prob), build)
 
 
-def initialize_processing(grid_size: Tuple[int, int]) -> Tuple[List[str], np.ndarray, dtmc.MarkovChain]:
-    trans = torus_transition_matrix(grid_size)
-    states = [str(i) for i in range(grid_size[0] * grid_size[1])]
-    initial_dist = generate_initial_distribution(grid_size)
-    mc = dtmc.MarkovChain(trans, states)
-    return states, initial_dist, mc
+def initialize_processing(grid_size: Tuple[int, int]) -> Tuple[List[str], np.ndarray, SparseMarkovChain]:
+    chain = load_walk_chain('torus', grid_size)
+    return chain.states, load_walk_artifacts('torus', grid_size).initial_dist, chain
 
 
-def convert_states_to_coordinates(walk: List[str], grid_size: Tuple[int, int]):
+def convert_states_to_coordinates(walk: Union[Trajectory, Sequence[int]], grid_size: Tuple[int, int]) -> Tuple[List[int], List[int]]:
     """
-    Converts the walk states to coordinates using the get_target_coordinate function.
+    Converts the walk states to coordinates with decode_states, for the whole walk at once.
 
     Args:
-        walk (List[str]): List of walk states.
+        walk: The trajectory or state indexes of the walk.
         grid_size (Tuple[int, int]): Size of the torus grid (m, n).
 
     Returns:
         Tuple[List[int], List[int]]: Two lists of integers representing x and y coordinates.
     """
-    x_coords, y_coords = zip(*[map(int, get_target_coordinate(int(state), grid_size).split(", ")) for state in walk])
-    return list(x_coords), list(y_coords)
+    x_coords, y_coords = decode_states(np.asarray(walk), grid_size)
+    return x_coords.tolist(), y_coords.tolist()
     
 def walk_step_by_step_1d(
-    mc: dtmc.MarkovChain,
+    lattice: Lattice,
     n: int,
     n_states: int,
-    states: List[str]
-) -> List[str]:
+) -> Trajectory:
     middle_point = n_states // 2
-    walk = [str(middle_point)]
-    for i in range(0, n):
-        current_state = walk[-1]
-        next_state = mc.next(current_state)
-        walk.append(next_state)
-    return walk
+    walks, _ = lattice.simulate(n, 1, middle_point, record_walks=True)
+    return Trajectory(walks[0], (n_states,))
 
 def walk_step_by_step(
-    mc: dtmc.MarkovChain,
+    lattice: Lattice,
     n: int,
     target_state: Tuple[int, int],
     grid_size: Tuple[int, int],
-    states: List[str],
     search_enabled: bool = True,
-) -> Tuple[List[str], Optional[int]]:
+) -> Tuple[Trajectory, Optional[int]]:
     """
   This function creates a walk on the torus, searching for the target state by default, runs for n steps instead if search is disabled. 
 
   Args:
-      mc: MarkovChain object representing the torus.
+      lattice: Lattice object representing the torus.
       n: number of the steps in the walk
       target_state: The state in the walk that we want to reach.
       grid_size: A tuple representing the size of the torus grid (m, n).
-      states: List of possible state indexes as strings
       search_enabled: Bool to set if want to search for a state or not.
 
   Returns:
-      An array with the states visited by the walk in order and the hitting time of the target state.
-    """
-    walk = ['0']
-    hitting_time = None
-    target_index = get_target_index(target_state, grid_size)
-    for i in range(0, n):
-        current_state = walk[-1]
-        if search_enabled:
-            if search_enabled and str(current_state) == str(target_index):
-                hitting_time = i
-                break
-        next_state = mc.next(current_state)
-        walk.append(next_state)
-    return walk, hitting_time
+      The trajectory of the walk and the hitting time of the target state.
+    """
+    all_walks, hitting_times = simulate_multiple_walks(lattice, n, 1, target_state, grid_size, search_enabled)
+    return all_walks[0], hitting_times[0]
 
 
 def simulate_multiple_walks_1d(
-    mc: dtmc.MarkovChain,
+    lattice: Lattice,
     n: int,
     n_sims: int,
     n_states: int,
-    states: List[str],
-) -> List[List[str]]:
+    seed: Optional[int] = None,
+) -> List[Trajectory]:
 
-    all_walks = []
-    
-    for _ in range(n_sims):
-        walk = walk_step_by_step_1d(mc,n, n_states, states)
-        all_walks.append(walk)
-    return all_walks
+    middle_point = n_states // 2
+    walks, hitting_times = lattice.simulate(n, n_sims, middle_point, record_walks=True, rng=np.random.default_rng(seed))
+    return split_trajectories(walks, hitting_times, (n_states,))
 
 
 def simulate_multiple_walks(
-    mc: dtmc.MarkovChain,
+    lattice: Lattice,
     n: int,
     n_sims: int,
     target_state: Tuple[int, int],
     grid_size: Tuple[int, int],
-    states: List[str],
     search_enabled: bool = False,
-) -> Tuple[List[List[str]], List[Optional[int]]]:
+    progress: Optional[Callable[[float], None]] = None,
+    seed: Optional[int] = None,
+) -> Tuple[List[Trajectory], List[Optional[int]]]:
     """
   This function simulates multiple random walks on a torus and collects data.
 
   Args:
-      mc (pydtmc.MarkovChain): The Markov chain object representing the random walk on a torus.
+      lattice (Lattice): The lattice object representing the random walk on a torus.
       n: number of the steps in the walk
       n_sims (int): The number of simulations to run.
       target_state (tuple): The state in the walk that we want to reach.
       grid_size: A tuple representing the size of the torus grid (m, n).
-      states: List of possible state indexes as strings
       search_enabled: Bool to set if we want to search for a state or not.
+      progress: Called with the fraction of the walks simulated, from the walks that are advanced step by step.
+      seed: The seed of the random generator, fresh entropy if None.
 
   Returns:
       tuple: A tuple containing two elements:
-          - list: A list of lists, where each inner list represents the states visited in a single simulation.
+          - list: The trajectory of every simulation, ending at its hitting time.
           - list: A list containing the hitting times (steps taken) to reach the target state for each simulation, 
                   or None if the target state was not reached within n steps.
   """
-    all_walks = []
-    hitting_times = []
-    for _ in range(n_sims):
-        walk, hitting_time = walk_step_by_step(mc,n,target_state,grid_size, states,search_enabled)
-        all_walks.append(walk)
-        hitting_times.append(hitting_time)
-    return all_walks, hitting_times
+    target_index = get_target_index(target_state, grid_size) if search_enabled else None
+    walks, hitting_times = lattice.simulate(n, n_sims, 0, target_index, record_walks=True, rng=np.random.default_rng(seed),
+                                            progress=progress)
+    all_walks = split_trajectories(walks, hitting_times, grid_size)
+    return all_walks, [walk.hitting_time for walk in all_walks]
+
+
+def check_drawable_grid(grid_size: Tuple[int, int]):
+    """
+    Raises InvalidParameter if the states of the torus cannot be drawn one per cell of its grid.
+
+    Non-square grids are rings of m * n states, whose coordinates (index % m, index % n) are only distinct when
+    m and n are coprime, otherwise several states land on the same cell.
+
+    Args:
+        grid_size: A tuple representing the size of the torus grid (m, n).
+    """
+    m, n = grid_size
+    if m != n and np.gcd(m, n) != 1:
+        raise InvalidParameter(f"A {m}x{n} grid cannot be drawn, non-square grids need coprime sides")
 
 
 def get_target_index(target_state: Tuple[int, int], grid_size: Tuple[int, int]) -> int:
@@ -225,14 +304,7 @@ def get_target_index(target_state: Tuple[int, int], grid_size: Tuple[int, int])
   Returns:
       int: The index of the target state.
   """
-  if (grid_size[0] == grid_size[1]):
-      target_index = target_state[1] * grid_size[1] + target_state[0]
-  elif (grid_size[0] != grid_size[1]):
-      if (grid_size[0] < grid_size[1]):
-          target_index = (target_state[0] * grid_size[1] - target_state[1] * grid_size[0]) % (grid_size[0] * grid_size[1])
-      elif (grid_size[0] > grid_size[1]):
-          target_index = (target_state[1] * grid_size[0] - target_state[0] * grid_size[1]) % (grid_size[0] * grid_size[1])
-  return target_index
+  return int(encode_coordinates(target_state[0], target_state[1], grid_size))
 
 
 def get_target_coordinate(target_state_index: int, grid_size: Tuple[int, int]) -> str:
@@ -244,90 +316,116 @@ def get_target_coordinate(target_state_index: int, grid_size: Tuple[int, int]) -
       grid_size: A tuple representing the size of the torus grid (m, n).
 
   Returns:
-      int: The coordinates of the target state.
+      str: The coordinates of the target state, as "x, y".
   """
-    if (grid_size[0] == grid_size[1]):
-        x = target_state_index % grid_size[0]
-        y = target_state_index // grid_size[1]
-    elif (grid_size[0] != grid_size[1]):
-        x = target_state_index % grid_size[0]
-        y = target_state_index % grid_size[1]
+    x, y = decode_states(target_state_index, grid_size)
     return f"{x}, {y}"
 
 
-def assign_mixing_time(mc: dtmc.MarkovChain, initial_dist: np.ndarray) -> str:
-    if mc.is_ergodic:
-        mixing_time = mc.mixing_time(initial_dist)
-        if mixing_time is None:
-            mixing_time = "100+"
+def count_walk_states(all_walks: Sequence[Trajectory], n_states: int, only_final_steps: bool = False) -> WalkAccumulator:
+    """
+    Counts the states of walks that were already simulated, for the callers that hold them.
+
+    Args:
+        all_walks (list): The trajectory of every simulation, or lists of its state indexes.
+        n_states: The number of states of the walk.
+        only_final_steps: Bool to set if only the last state of every walk is counted.
+
+    Returns:
+        WalkAccumulator: The accumulator with the occupancy of the states.
+    """
+    accumulator = WalkAccumulator(n_states, 'final' if only_final_steps else 'all_steps')
+    if only_final_steps:
+        accumulator.add_final(np.array([walk[-1] for walk in all_walks]).astype(np.int64))
     else:
-        mixing_time = "The Markov chain is not ergodic"
-    return mixing_time
+        for walk in all_walks:
+            accumulator.add_visits(np.asarray(walk).astype(np.int64))
+    return accumulator
 
 
-def analyze_walk_data_1d(all_walks: List[List[int]], n_states: int, only_final_steps: bool = False) -> pd.DataFrame:
+def analyze_walk_data_1d(all_walks: Sequence[Trajectory], n_states: int, only_final_steps: bool = False) -> pd.DataFrame:
     """
     This function analyzes the walk data and creates a DataFrame containing unique states, their occurrences, and probabilities.
 
     Args:
-        all_walks (list): A list of lists, where each inner list represents the states visited in a single simulation.
+        all_walks (list): The trajectory of every simulation.
         n_sims (int): The number of simulations run.
 
     Returns:
         pandas.DataFrame: A DataFrame containing unique states, their occurrences, and probabilities.
     """
-    selected_steps = [walk[-1] for walk in all_walks] if only_final_steps else [state for walk in all_walks for state in walk]
-    total_steps = len(selected_steps)  # Total number of steps in all simulations
-    state_counts = {}
-    for state in selected_steps:
-        state_counts[state] = state_counts.get(state, 0) + 1
-    state_data = [
-            {"State": state, "Occurrences": count, "Probability": count / total_steps}
-            for state, count in state_counts.items()
-        ]
-    df_state_analysis = pd.DataFrame(state_data)
-    df_state_analysis['State'] = pd.to_numeric(df_state_analysis['State'])
-    df_state_analysis = df_state_analysis.sort_values(by='State').reset_index(drop=True)
-    return df_state_analysis
+    return analyze_state_counts(count_walk_states(all_walks, n_states, only_final_steps).occupancy)
 
 
-def analyze_walk_data(all_walks: List[List[int]], grid_size: Tuple[int, int], only_final_steps: bool = False) -> pd.DataFrame:
+def analyze_walk_data(all_walks: Sequence[Trajectory], grid_size: Tuple[int, int], only_final_steps: bool = False) -> pd.DataFrame:
     """
     This function analyzes the walk data and creates a DataFrame containing unique states, their occurrences, and probabilities.
 
     Args:
-        all_walks (list): A list of lists, where each inner list represents the states visited in a single simulation.
+        all_walks (list): The trajectory of every simulation.
         n_sims (int): The number of simulations run.
 
     Returns:
         pandas.DataFrame: A DataFrame containing unique states, their occurrences, and probabilities.
     """
-    selected_steps = [walk[-1] for walk in all_walks] if only_final_steps else [state for walk in all_walks for state in walk]
-    total_steps = len(selected_steps)  # Total number of steps in all simulations
-    state_counts = {}
-    for state in selected_steps:
-        state_counts[state] = state_counts.get(state, 0) + 1
-    state_data = [
-            {"State": state, "Occurrences": count, "Probability": count / total_steps}
-            for state, count in state_counts.items()
-        ]
-    df_state_analysis = pd.DataFrame(state_data)
-    df_state_analysis['State'] = pd.to_numeric(df_state_analysis['State'])
-    df_state_analysis = df_state_analysis.sort_values(by='State').reset_index(drop=True)
-    df_state_analysis['Coordinates'] = df_state_analysis['State'].apply(lambda x: get_target_coordinate(x, grid_size))
-    df_state_analysis[["X", "Y"]] = df_state_analysis["Coordinates"].str.split(", ", expand=True).astype(int)
+    return analyze_state_counts(count_walk_states(all_walks, grid_size[0] * grid_size[1], only_final_steps).occupancy, grid_size)
+
+
+def analyze_state_counts(counts: np.ndarray, grid_size: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+    """
+    Builds the DataFrame of analyze_walk_data from a histogram of states, e.g. the occupancy of a sharded simulation.
+
+    Args:
+        counts: The number of occurrences of every state index.
+        grid_size: A tuple representing the size of the torus grid (m, n), None for a 1D walk without coordinates.
+
+    Returns:
+        pandas.DataFrame: The visited states, their occurrences and probabilities, like analyze_walk_data_1d for
+                          a 1D walk and analyze_walk_data with only_final_steps for a torus.
+    """
+    counts = np.asarray(counts)
+    visited = np.flatnonzero(counts)
+    df_state_analysis = pd.DataFrame({
+        "State": visited.astype(np.int64),
+        "Occurrences": counts[visited].astype(np.int64),
+        "Probability": counts[visited] / counts.sum(),
+    })
+    if grid_size is None:
+        return df_state_analysis
+    x_coords, y_coords = decode_states(visited, grid_size)
+    df_state_analysis['Coordinates'] = coordinate_labels(x_coords, y_coords)
+    df_state_analysis['X'] = x_coords
+    df_state_analysis['Y'] = y_coords
     df_state_analysis = df_state_analysis.sort_values(by=['X', 'Y'], ascending=[True, True])
     return df_state_analysis
 
 
-def compute_theoretical_distribution(states: List[str], transition_matrix: np.ndarray, grid_size: Tuple[int, int], steps: int) -> pd.DataFrame:
-    step_transition_matrix = np.linalg.matrix_power(transition_matrix, steps)
-    
-    # Generate a normalized random initial distribution
-    initial_distribution = generate_initial_distribution(grid_size)
-    
+def compute_theoretical_distribution(
+    states: Sequence[Union[int, str]],
+    transition_matrix: TransitionModel,
+    grid_size: Tuple[int, int],
+    steps: int,
+    initial_distribution: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """
+    This function computes the exact distribution of the walk after the given number of steps.
+
+    Args:
+        states: The possible state indexes, as integers or strings
+        transition_matrix: The dense or sparse transition matrix, or the Lattice of the walk.
+        grid_size: A tuple representing the size of the torus grid (m, n).
+        steps: The number of steps in the walk.
+        initial_distribution: The distribution of the states at the start, uniform by default.
+
+    Returns:
+        pandas.DataFrame: A DataFrame containing the states, their probabilities and coordinates.
+    """
+    if initial_distribution is None:
+        initial_distribution = generate_initial_distribution(grid_size)
+
     # Compute the distribution after the given number of steps
-    distribution_after_steps = np.dot(initial_distribution, step_transition_matrix)
+    distribution_after_steps = exact_distribution(transition_matrix, initial_distribution, steps,
+                                                  shapes=[(grid_size[0], grid_size[1])])
     
     # Ensure the resulting distribution is normalized
     distribution_after_steps /= distribution_after_steps.sum()
@@ -337,7 +435,10 @@ def compute_theoretical_distribution(states: List[str], transition_matrix: np.nd
         "Probability": distribution_after_steps
     })
     distribution_df['State'] = pd.to_numeric(distribution_df['State'])
-    distribution_df['Coordinates'] = distribution_df['State'].apply(lambda x: get_target_coordinate(x, grid_size))
+    x_coords, y_coords = decode_states(distribution_df['State'].to_numpy(), grid_size)
+    distribution_df['Coordinates'] = coordinate_labels(x_coords, y_coords)
+    distribution_df['X'] = x_coords
+    distribution_df['Y'] = y_coords
     return distribution_df
 
 
@@ -443,9 +544,7 @@ def heatmap_1d(data_final: pd.DataFrame) -> str:
 
     ig, ax = plt.subplots(figsize=(20,10))
     nbins=256
-    k = kde.gaussian_kde([data_final['State'],data_final['Occurrences']])
-    xi, yi = np.mgrid[data_final['State'].min():data_final['State'].max():nbins*1j, data_final['Occurrences'].min():data_final['Occurrences'].max():nbins*1j]
-    zi = k(np.vstack([xi.flatten(), yi.flatten()]))
+    xi, yi, zi = binned_kde_2d(data_final['State'], data_final['Occurrences'], nbins)
     plt.pcolormesh(xi, yi, zi.reshape(xi.shape), shading='auto')
     ax.set_title("Heatmap of the random walk")
     buffer = io.BytesIO()
@@ -467,6 +566,11 @@ def heatmap_occurrences(data_final: pd.DataFrame) -> str:
         str: Path to the saved heatmap image.
     """
 
+    # Annotating every cell does not scale, large grids are drawn straight from a colormap lookup table
+    if (data_final["X"].max() + 1) * (data_final["Y"].max() + 1) > FAST_HEATMAP_CELLS:
+        heatmap_data = heatmap_grid(data_final["X"], data_final["Y"], data_final["Occurrences"])
+        return fast_heatmap_base64(heatmap_data, title="Heatmap of Occurrences", origin="lower")
+
     # Pivot the DataFrame to create a heatmap
     heatmap_data = data_final.pivot(index="Y", columns="X", values="Occurrences")
 
@@ -489,6 +593,67 @@ def heatmap_occurrences(data_final: pd.DataFrame) -> str:
     return image_base64
 
 
+def distribution_grids(distributions: np.ndarray, grid_size: Tuple[int, ...]) -> np.ndarray:
+    """
+    Lays flat distributions out on the grid, for heatmaps.
+
+    Args:
+        distributions: The (number of distributions, N) array of probabilities.
+        grid_size: A tuple representing the size of the torus grid (m, n), or (n_states,) for the circle.
+
+    Returns:
+        np.ndarray: The grids indexed [distribution, y, x], the circle is a single row.
+    """
+    distributions = np.atleast_2d(distributions)
+    if len(grid_size) == 1:
+        return distributions[:, None, :]
+    x_coords, y_coords = decode_states(np.arange(distributions.shape[1]), grid_size)
+    grids = np.zeros((len(distributions), grid_size[1], grid_size[0]))
+    grids[:, y_coords, x_coords] = distributions
+    return grids
+
+
+def create_base64_gif_from_distributions(steps: np.ndarray, grids: np.ndarray, duration: float = 0.2, progress=None) -> str:
+    """
+    Creates an animated GIF of the exact distribution of a walk over the steps and returns it in base64 format.
+
+    Args:
+        steps: The step of every grid.
+        grids: The probability grids, indexed [frame, y, x].
+        duration (float): Duration of each frame in the GIF, in seconds.
+        progress: Called with the fraction of the frames rendered.
+
+    Returns:
+        str: A base64-encoded string representing the animated GIF.
+    """
+    frames = render_frames(zip(np.asarray(steps).tolist(), grids), render_distribution_frame)
+    return encode_gif_base64(report_frames(frames, len(grids), progress), duration)
+
+
+def tv_distance_plot(tv_to_uniform: np.ndarray) -> str:
+    """
+    Plots the total variation distance to the uniform distribution against the step.
+
+    Args:
+        tv_to_uniform: The distance after every step, from step 0.
+
+    Returns:
+        str: The base64-encoded PNG.
+    """
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(np.arange(len(tv_to_uniform)), tv_to_uniform)
+    ax.set_ylim(0, 1)
+    ax.set_xlabel("Step")
+    ax.set_ylabel("Total variation distance")
+    ax.set_title("Distance to the uniform distribution")
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format='png')
+    buffer.seek(0)
+    image_base64 = base64.b64encode(buffer.read()).decode('utf-8')
+    plt.close()
+    return image_base64
+
+
 def generate_initial_distribution(grid_size: Tuple[int, int], initial_state: int=0, is_random: bool=True) -> np.ndarray:
     """
     Generate a random or predefined initial distribution for the grid.
@@ -0,0 +1,143 @@
+import numpy as np
+
+HADAMARD = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+
+
+def coin_matrix(coin: str, dimension: int) -> np.ndarray:
+    """
+    Returns the coin operator of a walk on a ring (dimension 1) or a torus (dimension 2).
+
+    Args:
+        coin: 'hadamard' for the coin of the cirq circuits (H on every coin qubit) or 'grover' for the Grover diffusion coin.
+        dimension: The dimension of the walk, the coin has 2 * dimension sides.
+
+    Returns:
+        np.ndarray: The (2 * dimension) x (2 * dimension) unitary.
+    """
+    sides = 2 * dimension
+    if coin == 'hadamard':
+        matrix = HADAMARD
+        for _ in range(dimension - 1):
+            matrix = np.kron(matrix, HADAMARD)
+        return matrix
+    if coin == 'grover':
+        return np.full((sides, sides), 2 / sides) - np.eye(sides)
+    raise ValueError(f"Unknown coin '{coin}', expected 'hadamard' or 'grover'")
+
+
+def initial_state_1d(number_positions: int, is_y=False, dtype=np.complex128) -> np.ndarray:
+    """
+    Prepares the state of initial_state: the walker in the middle of the ring with the coin in (|0> + i|1>) / sqrt(2),
+    or (|0> - i|1>) / sqrt(2) if is_y is set.
+
+    Returns:
+        np.ndarray: The (coin, positions) amplitudes.
+    """
+    psi = np.zeros((2, number_positions), dtype=dtype)
+    psi[:, number_positions // 2] = np.array([1, -1j if is_y else 1j]) / np.sqrt(2)
+    return psi
+
+
+def initial_state_2d(number_positions: int, dtype=np.complex128) -> np.ndarray:
+    """
+    Prepares the state of initialize_2D: the walker in the middle of the torus with the coin in |00>.
+
+    Returns:
+        np.ndarray: The (coin, x positions, y positions) amplitudes.
+    """
+    psi = np.zeros((4, number_positions, number_positions), dtype=dtype)
+    psi[0, number_positions // 2, number_positions // 2] = 1
+    return psi
+
+
+def to_state_vector(psi: np.ndarray) -> np.ndarray:
+    """
+    Flattens coin-major amplitudes into the qubit order of the cirq walks, with the position first and the coin last.
+    """
+    return np.moveaxis(psi, 0, -1).ravel()
+
+
+def from_state_vector(state_vector: np.ndarray, shape: tuple) -> np.ndarray:
+    """
+    Inverse of to_state_vector, shape is the coin-major shape of the amplitudes.
+    """
+    return np.ascontiguousarray(np.moveaxis(state_vector.reshape(shape[1:] + shape[:1]), -1, 0))
+
+
+def coined_step_1d(psi: np.ndarray, coin: np.ndarray) -> np.ndarray:
+    """
+    Applies one step of walk_step: the coin, then coin 0 moves right and coin 1 moves left around the ring.
+
+    Args:
+        psi: The (coin, positions) amplitudes.
+        coin: The 2 x 2 coin operator, in the dtype of psi.
+
+    Returns:
+        np.ndarray: The amplitudes after the step.
+    """
+    psi = coin @ psi
+    psi[0] = np.roll(psi[0], 1)
+    psi[1] = np.roll(psi[1], -1)
+    return psi
+
+
+def coined_step_2d(psi: np.ndarray, coin: np.ndarray) -> np.ndarray:
+    """
+    Applies one step of step: the coin, then a shift depending on the coin state c (x - 1, y - 1, x + 1 and y + 1
+    for c = 0, 1, 2, 3), after which the coin is flipped to 3 - c.
+
+    Args:
+        psi: The (coin, x positions, y positions) amplitudes.
+        coin: The 4 x 4 coin operator, in the dtype of psi.
+
+    Returns:
+        np.ndarray: The amplitudes after the step.
+    """
+    psi = (coin @ psi.reshape(4, -1)).reshape(psi.shape)
+    shifted = np.empty_like(psi)
+    shifted[3] = np.roll(psi[0], -1, axis=0)
+    shifted[2] = np.roll(psi[1], -1, axis=1)
+    shifted[1] = np.roll(psi[2], 1, axis=0)
+    shifted[0] = np.roll(psi[3], 1, axis=1)
+    return shifted
+
+
+def coined_walk_1d(number_positions: int, steps: int, is_y=False, coin: str = 'hadamard', dtype=np.complex128) -> np.ndarray:
+    """
+    Simulates the coined walk of generate_walk on a ring of any size.
+
+    Args:
+        number_positions: The number of positions on the ring, 2**number_qubits for the cirq walk.
+        steps: Number of steps.
+        is_y: Bool to set if the coin starts in (|0> - i|1>) / sqrt(2).
+        coin: The coin, see coin_matrix.
+        dtype: The complex dtype of the amplitudes.
+
+    Returns:
+        np.ndarray: The state vector, ordered like the one of generate_walk (position first, coin last).
+    """
+    psi = initial_state_1d(number_positions, is_y, dtype)
+    operator = coin_matrix(coin, 1).astype(dtype)
+    for _ in range(steps):
+        psi = coined_step_1d(psi, operator)
+    return to_state_vector(psi)
+
+
+def coined_walk_2d(number_positions: int, steps: int, coin: str = 'hadamard', dtype=np.complex128) -> np.ndarray:
+    """
+    Simulates the coined walk of run_2d_walk on a torus of any size.
+
+    Args:
+        number_positions: The number of positions along each axis, 2**n for the cirq walk.
+        steps: Number of steps.
+        coin: The coin, see coin_matrix.
+        dtype: The complex dtype of the amplitudes.
+
+    Returns:
+        np.ndarray: The state vector, ordered like the one of run_2d_walk (x, then y, then the coin).
+    """
+    psi = initial_state_2d(number_positions, dtype)
+    operator = coin_matrix(coin, 2).astype(dtype)
+    for _ in range(steps):
+        psi = coined_step_2d(psi, operator)
+    return to_state_vector(psi)
@@ -0,0 +1,214 @@
+from typing import Callable, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
+import numpy as np
+from scipy import sparse
+from lattice_utils import Lattice
+from markov_utils import SparseMarkovChain
+from validation_utils import InvalidParameter
+
+TransitionModel = Union[np.ndarray, sparse.spmatrix, Lattice, SparseMarkovChain]
+
+
+def lattice_kernel(lattice: Lattice) -> Optional[np.ndarray]:
+    """
+    Places the move probabilities of a periodic lattice on the lattice, so that one step is a circular convolution.
+
+    Args:
+        lattice: The lattice walk.
+
+    Returns:
+        Optional[np.ndarray]: The kernel in the lattice shape, None for reflecting boundaries.
+    """
+    if lattice.boundary != 'periodic':
+        return None
+    kernel = np.zeros(lattice.shape)
+    offsets = lattice.stencil % np.array(lattice.shape)
+    np.add.at(kernel, tuple(offsets.T), lattice.weights)
+    return kernel
+
+
+def circulant_kernel(transition_matrix: Union[np.ndarray, sparse.spmatrix], shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+    """
+    Checks whether a transition matrix is (block-)circulant over a lattice of the given shape.
+
+    The matrix is circulant if the probability of every transition only depends on the coordinate
+    difference of its states modulo the shape, as for the walks on the circle and the torus.
+
+    Args:
+        transition_matrix: The dense or sparse transition matrix.
+        shape: The lattice shape the states are laid out on in C order.
+
+    Returns:
+        Optional[np.ndarray]: The kernel in the lattice shape, None if the matrix is not circulant.
+    """
+    matrix = sparse.csr_matrix(transition_matrix)
+    matrix.eliminate_zeros()
+    if int(np.prod(shape)) != matrix.shape[0]:
+        return None
+
+    row_lengths = np.diff(matrix.indptr)
+    if np.any(row_lengths != row_lengths[0]):
+        return None
+
+    shape_array = np.array(shape)[:, None]
+    rows = np.repeat(np.arange(matrix.shape[0]), row_lengths)
+    differences = (np.array(np.unravel_index(matrix.indices, shape)) - np.array(np.unravel_index(rows, shape))) % shape_array
+    flat_differences = np.ravel_multi_index(tuple(differences), shape)
+
+    kernel = np.zeros(matrix.shape[0])
+    kernel[flat_differences[:row_lengths[0]]] = matrix.data[:row_lengths[0]]
+    if not np.allclose(kernel[flat_differences], matrix.data):
+        return None
+    return kernel.reshape(shape)
+
+
+def convolution_power(kernel: np.ndarray, distribution: np.ndarray, steps: int) -> np.ndarray:
+    """
+    Applies the circular convolution with kernel steps times at once, as a pointwise power in Fourier space.
+
+    Args:
+        kernel: The one step kernel in the lattice shape.
+        distribution: The distribution to start from, in the lattice shape.
+        steps: The number of steps to take.
+
+    Returns:
+        np.ndarray: The distribution after the steps, in the lattice shape.
+    """
+    axes = tuple(range(kernel.ndim))
+    spectrum = np.fft.rfftn(kernel, axes=axes) ** steps
+    result = np.fft.irfftn(np.fft.rfftn(distribution, axes=axes) * spectrum, s=kernel.shape, axes=axes)
+    return np.maximum(result, 0.0)
+
+
+def exact_distribution(
+    model: TransitionModel,
+    initial_distribution: np.ndarray,
+    steps: int,
+    shapes: Sequence[Tuple[int, ...]] = (),
+) -> np.ndarray:
+    """
+    Computes the exact distribution of a chain after the given number of steps.
+
+    Circulant and block-circulant chains are handled with FFTs in O(N log N), regardless of the number of steps,
+    all other chains fall back to repeated sparse matrix-vector products.
+
+    Args:
+        model: A transition matrix, a Lattice or a SparseMarkovChain.
+        initial_distribution: The flat distribution of the states at the start.
+        steps: The number of steps to take.
+        shapes: Lattice shapes to test a transition matrix for circulant structure with, it is always tested as a ring.
+
+    Returns:
+        np.ndarray: The flat distribution of the states after the steps.
+    """
+    initial_distribution = np.asarray(initial_distribution, dtype=float)
+
+    if isinstance(model, Lattice):
+        kernel = lattice_kernel(model)
+        if kernel is None:
+            return model.propagate(initial_distribution, steps)
+        return convolution_power(kernel, initial_distribution.reshape(model.shape), steps).ravel()
+
+    if isinstance(model, SparseMarkovChain):
+        if model.teleport_prob > 0:
+            return model.propagate(initial_distribution, steps)
+        model = model.p
+
+    for shape in list(shapes) + [(initial_distribution.size,)]:
+        kernel = circulant_kernel(model, tuple(shape))
+        if kernel is not None:
+            return convolution_power(kernel, initial_distribution.reshape(shape), steps).ravel()
+
+    step = transition_step(model)
+    distribution = initial_distribution
+    for _ in range(steps):
+        distribution = step(distribution)
+    return distribution
+
+
+def transition_step(model: TransitionModel) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Builds the function that advances a flat distribution by one step of a chain.
+
+    Lattices are stepped matrix-free with their stencil, chains with teleportation with their propagate method,
+    transition matrices with a sparse matrix-vector product.
+
+    Args:
+        model: A transition matrix, a Lattice or a SparseMarkovChain.
+
+    Returns:
+        Callable: The one step map.
+    """
+    if isinstance(model, (Lattice, SparseMarkovChain)):
+        return lambda distribution: model.propagate(distribution, 1)
+    transposed = sparse.csr_matrix(model).T.tocsr()
+    return lambda distribution: transposed @ distribution
+
+
+def distribution_steps(model: TransitionModel, initial_distribution: np.ndarray, steps: int) -> Iterator[np.ndarray]:
+    """
+    Yields the exact distribution of a chain after every step, from the initial one (step 0) up to the given step.
+
+    Args:
+        model: A transition matrix, a Lattice or a SparseMarkovChain.
+        initial_distribution: The flat distribution of the states at the start.
+        steps: The number of steps to take.
+
+    Returns:
+        Iterator[np.ndarray]: steps + 1 flat distributions.
+    """
+    step = transition_step(model)
+    distribution = np.asarray(initial_distribution, dtype=float)
+    yield distribution
+    for _ in range(steps):
+        distribution = step(distribution)
+        yield distribution
+
+
+class OccupancySeries(NamedTuple):
+    steps: np.ndarray
+    distributions: np.ndarray
+    tv_to_uniform: np.ndarray
+
+
+def occupancy_series(
+    model: TransitionModel,
+    initial_distribution: np.ndarray,
+    steps: int,
+    stride: int = 1,
+    progress: Optional[Callable[[float], None]] = None,
+) -> OccupancySeries:
+    """
+    Propagates a distribution step by step, recording it every stride steps and its distance to uniform at every step.
+
+    The evolution is exact, at the cost of one sparse or stencil matrix-vector product per step.
+
+    Args:
+        model: A transition matrix, a Lattice or a SparseMarkovChain.
+        initial_distribution: The flat distribution of the states at the start.
+        steps: The number of steps to take.
+        stride: The number of steps between recorded distributions, at least 1, the last step is always recorded.
+        progress: Called with the fraction of the steps done.
+
+    Returns:
+        OccupancySeries: The recorded steps, the (recorded steps, N) array of their distributions and the
+                         total variation distance to the uniform distribution after every step, steps + 1 values.
+    """
+    if steps < 0 or stride < 1:
+        raise InvalidParameter(f"Expected a non-negative number of steps and a stride of at least 1, got {steps} and {stride}")
+    recorded_steps = list(range(0, steps + 1, stride))
+    if recorded_steps[-1] != steps:
+        recorded_steps.append(steps)
+
+    initial_distribution = np.asarray(initial_distribution, dtype=float)
+    distributions = np.empty((len(recorded_steps), initial_distribution.size))
+    tv_to_uniform = np.empty(steps + 1)
+    uniform = 1 / initial_distribution.size
+    recorded = 0
+    for index, distribution in enumerate(distribution_steps(model, initial_distribution, steps)):
+        tv_to_uniform[index] = 0.5 * np.abs(distribution - uniform).sum()
+        if index == recorded_steps[recorded]:
+            distributions[recorded] = distribution
+            recorded += 1
+        if progress is not None and steps:
+            progress(index / steps)
+    return OccupancySeries(np.array(recorded_steps), distributions, tv_to_uniform)
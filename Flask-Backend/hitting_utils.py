@@ -0,0 +1,110 @@
+from typing import Optional, Tuple
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse import linalg as sparse_linalg
+from distribution_utils import TransitionModel
+from lattice_utils import Lattice
+from markov_utils import SparseMarkovChain
+
+
+def surely_hitting_states(matrix: sparse.spmatrix, target_index: int) -> np.ndarray:
+    """
+    Finds the states of a chain without teleports from which a walk hits the target with probability 1.
+
+    A walk misses the target with positive probability exactly when it can reach, without passing through the
+    target, a state from which the target cannot be reached. Both sets are found by breadth-first searches over
+    the reversed transitions, the second one from all the states of the first at once through an extra node.
+
+    Args:
+        matrix: The sparse transition matrix.
+        target_index: The index of the state that we want to reach.
+
+    Returns:
+        np.ndarray: The boolean mask of those states, the target included.
+    """
+    size = matrix.shape[0]
+    reversed_edges = matrix.T.tocsr()
+    reaching = np.zeros(size, dtype=bool)
+    reaching[csgraph.breadth_first_order(reversed_edges, target_index, directed=True, return_predecessors=False)] = True
+    if reaching.all():
+        return reaching
+
+    # Walks stop at the target, so edges leaving it do not count, the extra node leads to every non-reaching state
+    edges = matrix.tocoo()
+    kept = (edges.row != target_index) & (edges.data != 0)
+    dead_ends = np.flatnonzero(~reaching)
+    rows = np.concatenate((edges.col[kept], np.full(len(dead_ends), size)))
+    cols = np.concatenate((edges.row[kept], dead_ends))
+    graph = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(size + 1, size + 1))
+    missing = np.zeros(size + 1, dtype=bool)
+    missing[csgraph.breadth_first_order(graph, size, directed=True, return_predecessors=False)] = True
+    return ~missing[:size]
+
+
+def expected_hitting_times(
+    model: TransitionModel,
+    target_index: int,
+    second_moment: bool = False,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Solves for the expected hitting time of the target from every state of a chain.
+
+    The target is made absorbing and the times h of the states that hit it with probability 1 (see
+    surely_hitting_states) solve (I - Q) h = 1, where Q is the transition matrix restricted to them. The second moments s solve (I - Q) s = 2h - 1 with the same factorization.
+    The uniform teleport term of a SparseMarkovChain is handled as a rank-one update of the sparse system.
+
+    Args:
+        model: A transition matrix, a Lattice or a SparseMarkovChain.
+        target_index: The index of the state that we want to reach.
+        second_moment: Bool to set if the variances of the hitting times are computed as well.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - np.ndarray: The expected hitting time from every state, inf for states that miss the target with
+                          positive probability.
+            - np.ndarray: The variance of the hitting time from every state, None if second_moment is not set.
+    """
+    teleport_prob = 0.0
+    if isinstance(model, Lattice):
+        matrix = model.transition_matrix()
+    elif isinstance(model, SparseMarkovChain):
+        matrix, teleport_prob = model.p, model.teleport_prob
+    else:
+        matrix = sparse.csr_matrix(model)
+    size = matrix.shape[0]
+
+    # Teleporting chains hit the target from every state, other chains only from the states that hit it with probability 1
+    if teleport_prob > 0:
+        transient = np.ones(size, dtype=bool)
+    else:
+        transient = surely_hitting_states(matrix, target_index)
+    transient[target_index] = False
+    indexes = np.flatnonzero(transient)
+
+    q = matrix[indexes][:, indexes]
+    lu = sparse_linalg.splu((sparse.identity(len(indexes), format='csc') - q).tocsc())
+
+    if teleport_prob > 0:
+        # (I - Q - u 1^T) x = b with u = teleport_prob / size, solved with the Sherman-Morrison formula
+        u = np.full(len(indexes), teleport_prob / size)
+        inverse_u = lu.solve(u)
+
+        def solve(b: np.ndarray) -> np.ndarray:
+            x = lu.solve(b)
+            return x + inverse_u * x.sum() / (1 - inverse_u.sum())
+    else:
+        solve = lu.solve
+
+    hitting_times = np.full(size, np.inf)
+    hitting_times[target_index] = 0.0
+    expected = solve(np.ones(len(indexes)))
+    hitting_times[indexes] = expected
+
+    if not second_moment:
+        return hitting_times, None
+
+    variances = np.full(size, np.inf)
+    variances[target_index] = 0.0
+    variances[indexes] = solve(2 * expected - 1) - expected ** 2
+    return hitting_times, variances
@@ -0,0 +1,375 @@
+import fcntl
+import glob
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from pool_utils import start_process_pool
+
+# Seconds a queued job waits between attempts to take one of the worker slots
+SLOT_POLL_SECONDS = 0.05
+
+# Files of a job in the store directory, next to the JSON record of the job in <job_id>.job
+PROGRESS_SUFFIX = '.progress'
+RUNNING_SUFFIX = '.running'
+CANCELLED_SUFFIX = '.cancelled'
+RESULT_SUFFIX = '.result'
+ERROR_SUFFIX = '.error'
+FINISHED_SUFFIXES = (RESULT_SUFFIX, ERROR_SUFFIX, CANCELLED_SUFFIX)
+
+
+class ProgressReporter:
+    """
+    Reports the fraction of a job that is done to the store shared with the web processes.
+
+    Fractions are mapped into [start, end] so that the stages of a job can report their own progress from 0 to 1,
+    and only written when they moved by at least min_delta, so that tight loops can report on every iteration.
+
+    Args:
+        store: The JobStore the progress is written to.
+        job_id: The key of the job in the store.
+        start: The progress of the job when this stage starts.
+        end: The progress of the job when this stage is done.
+        min_delta: The smallest change of progress that is written.
+    """
+
+    def __init__(self, store, job_id: str, start: float = 0.0, end: float = 1.0, min_delta: float = 0.01, _last=None):
+        self.store = store
+        self.job_id = job_id
+        self.start = start
+        self.end = end
+        self.min_delta = min_delta
+        self._last = [start] if _last is None else _last
+
+    def __call__(self, fraction: float):
+        value = self.start + (self.end - self.start) * min(max(fraction, 0.0), 1.0)
+        if value - self._last[0] >= self.min_delta or (fraction >= 1 and value > self._last[0]):
+            self.store.set_progress(self.job_id, value)
+            self._last[0] = value
+
+    def stage(self, start: float, end: float) -> 'ProgressReporter':
+        """
+        Returns a reporter for the part of this stage between the fractions start and end.
+        """
+        span = self.end - self.start
+        return ProgressReporter(self.store, self.job_id, self.start + span * start, self.start + span * end, self.min_delta, self._last)
+
+
+def stage(progress: Optional[ProgressReporter], start: float, end: float) -> Optional[ProgressReporter]:
+    """
+    Returns the reporter of a stage of a job, None if the job is not reported on (run outside of the queue).
+    """
+    return None if progress is None else progress.stage(start, end)
+
+
+def _write_atomic(path: str, data: bytes):
+    temporary = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def _format_error(error: BaseException) -> str:
+    return ''.join(traceback.format_exception_only(type(error), error)).strip()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """
+    Keeps the state of jobs in files of a directory, so that every web worker of the host can report on a job,
+    whichever worker queued it.
+
+    A job is a JSON record in <job_id>.job, and one file per fact the job process or a web worker adds: its progress,
+    that it started running or was cancelled, and its pickled result or error. Files are replaced atomically, and the
+    record is locked while a job starts or is cancelled, so that exactly one of them happens.
+
+    Args:
+        directory: The directory of the store, created if missing.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, job_id + suffix)
+
+    def _locked_record(self, job_id: str) -> int:
+        fd = os.open(self._path(job_id, '.job'), os.O_RDONLY)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def create(self, job_id: str, kind: str):
+        record = {'kind': kind, 'submitted_at': time.time(), 'pid': os.getpid()}
+        _write_atomic(self._path(job_id, '.job'), json.dumps(record).encode())
+
+    def set_progress(self, job_id: str, progress: float):
+        _write_atomic(self._path(job_id, PROGRESS_SUFFIX), repr(progress).encode())
+
+    def start(self, job_id: str) -> bool:
+        """
+        Marks a job as running, unless it was cancelled.
+
+        Returns:
+            bool: True if the job is to run.
+        """
+        fd = self._locked_record(job_id)
+        try:
+            if os.path.exists(self._path(job_id, CANCELLED_SUFFIX)):
+                return False
+            open(self._path(job_id, RUNNING_SUFFIX), 'wb').close()
+            return True
+        finally:
+            os.close(fd)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Marks a job as cancelled, unless it started running.
+
+        Returns:
+            bool: True if the job was cancelled.
+        """
+        fd = self._locked_record(job_id)
+        try:
+            if any(os.path.exists(self._path(job_id, suffix)) for suffix in (RUNNING_SUFFIX,) + FINISHED_SUFFIXES):
+                return False
+            open(self._path(job_id, CANCELLED_SUFFIX), 'wb').close()
+            return True
+        finally:
+            os.close(fd)
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None):
+        """
+        Stores the result of a job, or the error it failed with.
+        """
+        if error is None:
+            _write_atomic(self._path(job_id, RESULT_SUFFIX), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        else:
+            _write_atomic(self._path(job_id, ERROR_SUFFIX), error.encode())
+
+    def finished_at(self, job_id: str) -> Optional[float]:
+        for suffix in FINISHED_SUFFIXES:
+            try:
+                return os.path.getmtime(self._path(job_id, suffix))
+            except FileNotFoundError:
+                pass
+        return None
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Describes a job from its files, see JobQueue.status.
+        """
+        try:
+            with open(self._path(job_id, '.job')) as file:
+                record = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        finished_at = self.finished_at(job_id)
+        if finished_at is None and not _process_alive(record['pid']):
+            # The web worker running the job exited, and its job processes with it
+            self.finish(job_id, error=f"The worker process {record['pid']} running the job exited")
+            finished_at = self.finished_at(job_id)
+
+        status = {'job_id': job_id, 'kind': record['kind'], 'progress': 0.0, 'submitted_at': record['submitted_at'],
+                  'finished_at': finished_at, 'error': None}
+        try:
+            with open(self._path(job_id, PROGRESS_SUFFIX)) as file:
+                status['progress'] = float(file.read())
+        except (FileNotFoundError, ValueError):
+            pass
+        if os.path.exists(self._path(job_id, CANCELLED_SUFFIX)):
+            status['state'] = 'cancelled'
+        elif os.path.exists(self._path(job_id, ERROR_SUFFIX)):
+            status['state'] = 'failed'
+            with open(self._path(job_id, ERROR_SUFFIX)) as file:
+                status['error'] = file.read()
+        elif os.path.exists(self._path(job_id, RESULT_SUFFIX)):
+            status['state'] = 'done'
+        else:
+            status['state'] = 'running' if os.path.exists(self._path(job_id, RUNNING_SUFFIX)) else 'queued'
+        return status
+
+    def result(self, job_id: str) -> Any:
+        with open(self._path(job_id, RESULT_SUFFIX), 'rb') as file:
+            return pickle.load(file)
+
+    def expire(self, ttl: float):
+        """
+        Removes the jobs that finished more than ttl seconds ago.
+        """
+        deadline = time.time() - ttl
+        for suffix in FINISHED_SUFFIXES:
+            for path in glob.glob(os.path.join(glob.escape(self.directory), '*' + suffix)):
+                try:
+                    expired = os.path.getmtime(path) < deadline
+                except FileNotFoundError:
+                    continue
+                if expired:
+                    job_id = os.path.basename(path)[:-len(suffix)]
+                    for job_path in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(job_id) + '.*')):
+                        try:
+                            os.remove(job_path)
+                        except FileNotFoundError:
+                            pass
+
+    def acquire_slot(self, job_id: str, slots: int) -> Optional[int]:
+        """
+        Waits for one of the slots shared by all the processes running jobs from this store, a slot is a file
+        locked by the process running a job.
+
+        Returns:
+            Optional[int]: The descriptor holding the slot, closing it frees the slot. None if the job was
+                           cancelled while it waited.
+        """
+        while True:
+            for slot in range(slots):
+                fd = os.open(os.path.join(self.directory, f'slot-{slot}.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    os.close(fd)
+            if os.path.exists(self._path(job_id, CANCELLED_SUFFIX)):
+                return None
+            time.sleep(SLOT_POLL_SECONDS)
+
+
+def _run_job(task: Callable, args: tuple, job_id: str, directory: str, slots: int):
+    store = JobStore(directory)
+    slot = store.acquire_slot(job_id, slots)
+    if slot is None:
+        return
+    try:
+        if not store.start(job_id):
+            return
+        try:
+            result = task(*args, progress=ProgressReporter(store, job_id))
+            store.set_progress(job_id, 1.0)
+            store.finish(job_id, result)
+        except Exception as error:
+            store.finish(job_id, error=_format_error(error))
+    finally:
+        os.close(slot)
+
+
+class JobQueue:
+    """
+    Runs simulations in pools of local processes, so that long requests do not hold a web worker.
+
+    The state of the jobs is kept in a JobStore, so that the workers of a pre-fork server sharing its directory
+    all know every job. Each web worker has its own pool of forkserver processes, but at most max_workers jobs
+    run at once over all of them, the others wait for a slot. Jobs are forgotten ttl seconds after they finished.
+
+    Args:
+        directory: The directory of the job store.
+        max_workers: Number of jobs running at once on the host, the number of CPUs by default.
+        ttl: Seconds a finished job and its result are kept.
+    """
+
+    def __init__(self, directory: str, max_workers: Optional[int] = None, ttl: float = 3600.0):
+        self.directory = directory
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.ttl = ttl
+        self._store: Optional[JobStore] = None
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore(self.directory)
+        return self._store
+
+    def start(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Starts the pool of job processes of this web worker, see start_process_pool. Called when the app is loaded,
+        the processes themselves are only started when jobs are submitted.
+
+        Returns:
+            Optional[ProcessPoolExecutor]: The pool, None in processes of multiprocessing, which do not queue jobs.
+        """
+        return start_process_pool(('jobs', self.directory), self.max_workers, ['job_utils', 'task_utils'])
+
+    def _job_done(self, job_id: str, future: Future):
+        # Errors of the task are stored by the job process, this catches the ones of the pool, e.g. a killed process
+        error = CancelledError() if future.cancelled() else future.exception()
+        if error is not None and self.store.finished_at(job_id) is None:
+            self.store.finish(job_id, error=_format_error(error))
+
+    def submit(self, kind: str, task: Callable, *args: Any) -> str:
+        """
+        Queues a task, called as task(*args, progress=reporter) in a worker process.
+
+        Args:
+            kind: The name of the task, reported with the status.
+            task: A picklable module-level function.
+            args: The picklable arguments of the task.
+
+        Returns:
+            str: The id of the job.
+        """
+        job_id = uuid.uuid4().hex
+        self.store.expire(self.ttl)
+        self.store.create(job_id, kind)
+        pool = self.start()
+        if pool is None:
+            raise RuntimeError("Jobs can only be queued from the web process")
+        future = pool.submit(_run_job, task, args, job_id, self.directory, self.max_workers)
+        future.add_done_callback(lambda done: self._job_done(job_id, done))
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Describes a job, None if it is unknown or expired.
+
+        Returns:
+            Optional[dict]: The id, kind, state ('queued', 'running', 'done', 'failed' or 'cancelled'),
+                            progress from 0 to 1, submission and finishing times and the error of a failed job.
+        """
+        if not job_id.isalnum():
+            return None
+        self.store.expire(self.ttl)
+        return self.store.status(job_id)
+
+    def result(self, job_id: str) -> Any:
+        """
+        Returns the result of a finished job.
+
+        Raises:
+            FileNotFoundError: If the job has no result, it is unknown, expired, failed or was cancelled.
+        """
+        return self.store.result(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job that has not started yet.
+
+        Returns:
+            bool: True if the job was cancelled.
+        """
+        return job_id.isalnum() and self.store.status(job_id) is not None and self.store.cancel(job_id)
+
+
+JOB_QUEUE = JobQueue(
+    os.environ.get('RANDOMWALK_JOB_DIR', os.path.join(tempfile.gettempdir(), 'randomwalk-jobs')),
+    int(os.environ['RANDOMWALK_JOB_WORKERS']) if 'RANDOMWALK_JOB_WORKERS' in os.environ else None,
+    float(os.environ.get('RANDOMWALK_JOB_TTL', 3600)),
+)
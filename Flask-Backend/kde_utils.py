@@ -0,0 +1,98 @@
+from typing import Tuple, Union
+import numpy as np
+from scipy import fft
+
+
+def bandwidth_factor(n: int, dimensions: int, bw_method: Union[str, float] = 'scott') -> float:
+    """
+    Computes the factor scaling the data covariance into the kernel covariance, like scipy.stats.gaussian_kde.
+
+    Args:
+        n: The number of samples.
+        dimensions: The number of dimensions of the samples.
+        bw_method: 'scott', 'silverman' or the factor itself.
+
+    Returns:
+        float: The bandwidth factor.
+    """
+    if bw_method == 'scott':
+        return n ** (-1.0 / (dimensions + 4))
+    if bw_method == 'silverman':
+        return (n * (dimensions + 2) / 4.0) ** (-1.0 / (dimensions + 4))
+    if isinstance(bw_method, str):
+        raise ValueError(f"Unknown bandwidth method '{bw_method}', expected 'scott', 'silverman' or a number")
+    return float(bw_method)
+
+
+def linear_binning(x: np.ndarray, y: np.ndarray, x_range: Tuple[float, float], y_range: Tuple[float, float],
+                   gridsize: int) -> np.ndarray:
+    """
+    Spreads every sample over the four grid points around it, with weights linear in its distance to them.
+
+    Args:
+        x: The first coordinate of the samples, within x_range.
+        y: The second coordinate of the samples, within y_range.
+        x_range: The first and last grid point along x.
+        y_range: The first and last grid point along y.
+        gridsize: The number of grid points along both axes.
+
+    Returns:
+        np.ndarray: The gridsize x gridsize weights, indexed [x, y], summing up to the number of samples.
+    """
+    grid = np.zeros((gridsize, gridsize))
+    indexes, fractions = [], []
+    for values, (low, high) in ((x, x_range), (y, y_range)):
+        position = (np.asarray(values, dtype=float) - low) / (high - low) * (gridsize - 1)
+        index = np.clip(np.floor(position).astype(np.intp), 0, gridsize - 2)
+        indexes.append(index)
+        fractions.append(position - index)
+    (ix, iy), (fx, fy) = indexes, fractions
+    np.add.at(grid, (ix, iy), (1 - fx) * (1 - fy))
+    np.add.at(grid, (ix + 1, iy), fx * (1 - fy))
+    np.add.at(grid, (ix, iy + 1), (1 - fx) * fy)
+    np.add.at(grid, (ix + 1, iy + 1), fx * fy)
+    return grid
+
+
+def binned_kde_2d(x: np.ndarray, y: np.ndarray, gridsize: int = 256,
+                  bw_method: Union[str, float] = 'scott') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Estimates the density of 2D samples on a grid spanning their range, with a Gaussian kernel.
+
+    The kernel has the covariance of the samples scaled by the bandwidth factor, as in scipy.stats.gaussian_kde,
+    but the samples are binned onto the grid and convolved with the kernel by FFT, so the cost is O(G log G) in the
+    number of grid points G instead of proportional to samples x grid points.
+
+    Args:
+        x: The first coordinate of the samples.
+        y: The second coordinate of the samples.
+        gridsize: The number of grid points along both axes.
+        bw_method: 'scott', 'silverman' or the bandwidth factor.
+
+    Returns:
+        tuple: The x and y coordinates of the grid points and the density at them, gridsize x gridsize arrays
+               laid out like np.mgrid[x.min():x.max():gridsize * 1j, y.min():y.max():gridsize * 1j].
+
+    Raises:
+        np.linalg.LinAlgError: If the covariance of the samples is singular.
+    """
+    samples = np.vstack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+    n = samples.shape[1]
+    covariance = np.atleast_2d(np.cov(samples)) * bandwidth_factor(n, 2, bw_method) ** 2
+    inverse = np.linalg.inv(covariance)
+    norm = 2 * np.pi * np.sqrt(np.linalg.det(covariance))
+
+    (x_low, y_low), (x_high, y_high) = samples.min(axis=1), samples.max(axis=1)
+    xi, yi = np.mgrid[x_low:x_high:gridsize * 1j, y_low:y_high:gridsize * 1j]
+    counts = linear_binning(samples[0], samples[1], (x_low, x_high), (y_low, y_high), gridsize)
+
+    # The kernel at every offset between two grid points, laid out for a linear (zero padded) convolution
+    offsets = np.arange(-(gridsize - 1), gridsize)
+    dx = offsets[:, None] * (x_high - x_low) / (gridsize - 1)
+    dy = offsets[None, :] * (y_high - y_low) / (gridsize - 1)
+    kernel = np.exp(-0.5 * (inverse[0, 0] * dx ** 2 + 2 * inverse[0, 1] * dx * dy + inverse[1, 1] * dy ** 2)) / norm
+
+    shape = [fft.next_fast_len(2 * gridsize - 1 + gridsize - 1, real=True)] * 2
+    density = fft.irfft2(fft.rfft2(counts, shape) * fft.rfft2(kernel, shape), shape)
+    density = density[gridsize - 1:2 * gridsize - 1, gridsize - 1:2 * gridsize - 1] / n
+    return xi, yi, np.maximum(density, 0.0)
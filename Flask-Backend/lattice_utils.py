@@ -0,0 +1,323 @@
+from typing import Callable, Optional, Sequence, Tuple
+import numpy as np
+from scipy import sparse
+from accumulator_utils import WalkAccumulator
+
+# Largest number of (state, move) pairs for which the next states are looked up from a table instead of computed
+NEIGHBOR_TABLE_LIMIT = 1 << 24
+
+
+class Lattice:
+    """
+    A random walk on an N-dimensional lattice, described by its shape and a stencil of moves.
+
+    The walk is matrix-free: walkers are stepped and distributions are propagated with coordinate arithmetic,
+    no transition matrix is built unless transition_matrix is called. States are the C-order flat indexes
+    of the lattice coordinates.
+
+    Args:
+        shape: The number of sites along every axis, e.g. (n,) for a ring or (m, n) for a torus.
+        stencil: The coordinate offsets of the moves, one row per move.
+        weights: The probabilities of the moves, uniform by default.
+        boundary: 'periodic' to wrap around every axis or 'reflecting' to stay on the border instead of leaving.
+    """
+
+    def __init__(self, shape: Sequence[int], stencil: Sequence[Sequence[int]], weights: Optional[Sequence[float]] = None,
+                 boundary: str = 'periodic'):
+        self.shape = tuple(int(length) for length in shape)
+        self.stencil = np.atleast_2d(np.asarray(stencil, dtype=np.int64))
+        if self.stencil.shape[1] != len(self.shape):
+            raise ValueError(f"The stencil moves have {self.stencil.shape[1]} coordinates, the lattice has {len(self.shape)} axes")
+        if boundary not in ('periodic', 'reflecting'):
+            raise ValueError(f"Unknown boundary '{boundary}', expected 'periodic' or 'reflecting'")
+
+        n_moves = len(self.stencil)
+        self.weights = np.full(n_moves, 1 / n_moves) if weights is None else np.asarray(weights, dtype=float) / np.sum(weights)
+        self.is_uniform = weights is None or np.allclose(self.weights, 1 / n_moves)
+        self.boundary = boundary
+        self.size = int(np.prod(self.shape))
+        self._neighbors = None
+
+    @property
+    def key(self) -> tuple:
+        """A hashable description of the walk, equal for lattices that walk the same way."""
+        return self.shape, tuple(map(tuple, self.stencil.tolist())), tuple(self.weights.tolist()), self.boundary
+
+    def __getstate__(self) -> dict:
+        # The neighbor table can be much larger than the lattice description, receivers rebuild it when needed
+        state = self.__dict__.copy()
+        state['_neighbors'] = None
+        return state
+
+    def unravel(self, indices: np.ndarray) -> np.ndarray:
+        return np.array(np.unravel_index(indices, self.shape))
+
+    def ravel(self, coordinates: np.ndarray) -> np.ndarray:
+        return np.ravel_multi_index(tuple(coordinates), self.shape)
+
+    def _move(self, coordinates: np.ndarray, moves: np.ndarray) -> np.ndarray:
+        # coordinates has one row per axis, moves holds the stencil row taken by every column
+        coordinates = coordinates + self.stencil.T[:, moves]
+        shape = np.array(self.shape).reshape((-1,) + (1,) * (coordinates.ndim - 1))
+        if self.boundary == 'periodic':
+            return coordinates % shape
+        return np.clip(coordinates, 0, shape - 1)
+
+    def neighbors(self) -> np.ndarray:
+        """
+        Looks up the state reached by every move from every state.
+
+        Returns:
+            np.ndarray: An (N, number of moves) array of state indexes.
+        """
+        if self._neighbors is None:
+            coordinates = self.unravel(np.arange(self.size))[:, None, :]
+            moves = np.broadcast_to(np.arange(len(self.stencil))[:, None], (len(self.stencil), self.size))
+            self._neighbors = np.ascontiguousarray(self.ravel(self._move(coordinates, moves)).T)
+        return self._neighbors
+
+    def use_neighbors(self, neighbors: np.ndarray):
+        """
+        Sets the neighbor table instead of building it on first use, e.g. to one shared between processes.
+
+        Args:
+            neighbors: The (N, number of moves) array of neighbors, it is only read.
+        """
+        neighbors = np.asarray(neighbors)
+        if neighbors.shape != (self.size, len(self.stencil)):
+            raise ValueError(f"The neighbor table has shape {neighbors.shape}, expected {(self.size, len(self.stencil))}")
+        self._neighbors = neighbors
+
+    def transition_matrix(self) -> sparse.csr_matrix:
+        """
+        Builds the transition matrix of the walk, for consumers that need one.
+
+        Returns:
+            sparse.csr_matrix: The transition matrix, moves leading to the same state are summed up.
+        """
+        neighbors = self.neighbors()
+        rows = np.repeat(np.arange(self.size), len(self.stencil))
+        data = np.tile(self.weights, self.size)
+        return sparse.csr_matrix((data, (rows, neighbors.ravel())), shape=(self.size, self.size))
+
+    def draw_moves(self, size, rng: np.random.Generator) -> np.ndarray:
+        if self.is_uniform:
+            return rng.integers(0, len(self.stencil), size=size, dtype=np.uint8)
+        return np.searchsorted(np.cumsum(self.weights)[:-1], rng.random(size), side='right').astype(np.uint8)
+
+    def step(self, positions: np.ndarray, moves: np.ndarray) -> np.ndarray:
+        """
+        Applies one move to every walker.
+
+        Args:
+            positions: The current state indexes of the walkers.
+            moves: The stencil row taken by every walker.
+
+        Returns:
+            np.ndarray: The next state indexes of the walkers.
+        """
+        if self._neighbors is not None or self.size * len(self.stencil) <= NEIGHBOR_TABLE_LIMIT:
+            return self.neighbors()[positions, moves]
+        return self.ravel(self._move(self.unravel(positions), moves))
+
+    def next_indices(self, positions: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        rng = np.random.default_rng() if rng is None else rng
+        positions = np.asarray(positions)
+        return self.step(positions, self.draw_moves(positions.shape, rng))
+
+    def _shift(self, distribution: np.ndarray, offset: np.ndarray) -> np.ndarray:
+        # Moves the probability mass of every site by offset, keeping the mass that would leave a reflecting border on it
+        if self.boundary == 'periodic':
+            return np.roll(distribution, tuple(offset), axis=tuple(range(len(self.shape))))
+        for axis, delta in enumerate(offset):
+            if delta == 0:
+                continue
+            values = np.moveaxis(distribution, axis, 0)
+            shifted = np.zeros_like(values)
+            length = len(values)
+            k = min(abs(delta), length)
+            if delta > 0:
+                shifted[k:] = values[:length - k]
+                shifted[length - 1] += values[length - k:].sum(axis=0)
+            else:
+                shifted[:length - k] = values[k:]
+                shifted[0] += values[:k].sum(axis=0)
+            distribution = np.moveaxis(shifted, 0, axis)
+        return distribution
+
+    def propagate(self, distribution: np.ndarray, steps: int = 1) -> np.ndarray:
+        """
+        Computes the distribution of the walk after the given number of steps.
+
+        Args:
+            distribution: The distribution of the states at the start, flat or in the lattice shape.
+            steps: The number of steps to take.
+
+        Returns:
+            np.ndarray: The flat distribution of the states after the steps.
+        """
+        distribution = np.asarray(distribution, dtype=float).reshape(self.shape)
+        for _ in range(steps):
+            distribution = sum(weight * self._shift(distribution, offset) for weight, offset in zip(self.weights, self.stencil))
+        return distribution.ravel()
+
+    def simulate(
+        self,
+        n: int,
+        n_sims: int,
+        start_index: int = 0,
+        target_index: Optional[int] = None,
+        record_walks: bool = False,
+        rng: Optional[np.random.Generator] = None,
+        progress: Optional[Callable[[float], None]] = None,
+        accumulator: Optional[WalkAccumulator] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Advances n_sims walkers at once, as integer state indexes.
+
+        The moves of all walkers are drawn with a single call to the random generator in every step.
+        If a target is given, walkers that reach it are absorbed and no longer advanced.
+        An accumulator is fed the states of the walkers step by step, so that visits and snapshots are counted
+        without recording the walks.
+
+        Args:
+            n: number of the steps in the walk
+            n_sims: The number of walkers to simulate.
+            start_index: The index of the state every walker starts from.
+            target_index: The index of the state that we want to reach, None disables the search.
+            record_walks: Bool to set if the full walks are returned instead of the final states only.
+            rng: The random generator to draw the moves from.
+            progress: Called with the fraction of the steps done, from the walks that are advanced step by step.
+            accumulator: Counts the states and hitting times of the walkers, in addition to what is returned.
+
+        Returns:
+            tuple: A tuple containing two elements:
+                - np.ndarray: The walks as an (n_sims, n + 1) array if record_walks is set, the final states otherwise.
+                              Absorbed walkers stay on the target after their hitting time.
+                - np.ndarray: The hitting times of the walkers, -1 if the target was not reached within n steps.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        start = self.unravel(start_index)
+        hitting_times = np.full(n_sims, -1, dtype=np.int64)
+        if target_index is not None and not 0 <= target_index < self.size:
+            target_index = None
+
+        if record_walks:
+            if self.boundary == 'periodic':
+                moves = self.draw_moves((n_sims, n), rng)
+                coordinates = np.empty((len(self.shape), n_sims, n + 1), dtype=np.int64)
+                coordinates[:, :, 0] = start[:, None]
+                np.cumsum(self.stencil.T[:, moves], axis=2, out=coordinates[:, :, 1:])
+                coordinates[:, :, 1:] += start[:, None, None]
+                walks = np.ravel_multi_index(tuple(coordinates), self.shape, mode='wrap')
+            else:
+                walks = np.empty((n_sims, n + 1), dtype=np.int64)
+                walks[:, 0] = start_index
+                for i in range(n):
+                    walks[:, i + 1] = self.next_indices(walks[:, i], rng)
+                    if progress is not None:
+                        progress((i + 1) / n)
+            if target_index is not None:
+                hits = walks[:, :n] == target_index
+                hit = hits.any(axis=1)
+                hitting_times[hit] = hits[hit].argmax(axis=1)
+                for sim in np.flatnonzero(hit):
+                    walks[sim, hitting_times[sim]:] = target_index
+            if accumulator is not None:
+                accumulator.add_walks(walks, hitting_times)
+            return walks, hitting_times
+
+        stepwise = accumulator is not None and (accumulator.all_steps or accumulator.snapshot_steps)
+        if target_index is None and self.boundary == 'periodic' and not stepwise:
+            # The order of the moves does not matter for the final state, only how often each move was taken
+            counts = rng.multinomial(n, self.weights, size=n_sims)
+            coordinates = start[:, None] + self.stencil.T @ counts.T
+            final_states = np.ravel_multi_index(tuple(coordinates), self.shape, mode='wrap')
+            if accumulator is not None:
+                accumulator.add_final(final_states)
+                accumulator.add_hitting_times(hitting_times)
+            return final_states, hitting_times
+
+        positions = np.full(n_sims, start_index, dtype=np.int64)
+        active = np.arange(n_sims)
+        for i in range(n):
+            if stepwise:
+                self._accumulate_step(accumulator, i, positions, active, n_sims, target_index)
+            if target_index is not None:
+                absorbed = positions == target_index
+                if absorbed.any():
+                    hitting_times[active[absorbed]] = i
+                    active = active[~absorbed]
+                    positions = positions[~absorbed]
+                    if active.size == 0 and not stepwise:
+                        break
+            positions = self.next_indices(positions, rng)
+            if progress is not None:
+                progress((i + 1) / n)
+        if stepwise:
+            self._accumulate_step(accumulator, n, positions, active, n_sims, target_index)
+
+        final_states = np.full(n_sims, -1 if target_index is None else target_index, dtype=np.int64)
+        final_states[active] = positions
+        if accumulator is not None:
+            accumulator.add_final(final_states)
+            accumulator.add_hitting_times(hitting_times)
+        return final_states, hitting_times
+
+    @staticmethod
+    def _accumulate_step(accumulator: WalkAccumulator, step: int, positions: np.ndarray, active: np.ndarray, n_sims: int,
+                         target_index: Optional[int]):
+        # positions holds the walkers that were not absorbed before this step, the others are parked on the target
+        accumulator.add_visits(positions)
+        if step in accumulator.snapshot_steps:
+            states = positions
+            if active.size < n_sims:
+                states = np.full(n_sims, target_index, dtype=np.int64)
+                states[active] = positions
+            accumulator.add_snapshot(step, states)
+
+
+def hypercubic_lattice(shape: Sequence[int], boundary: str = 'periodic') -> Lattice:
+    """
+    Creates a nearest-neighbor walk on a ring, torus or higher dimensional torus (or box, with reflecting boundaries).
+
+    Args:
+        shape: The number of sites along every axis.
+        boundary: 'periodic' or 'reflecting'.
+
+    Returns:
+        Lattice: A lattice moving one site forwards or backwards along a single axis in every step.
+    """
+    unit = np.eye(len(shape), dtype=np.int64)
+    return Lattice(shape, np.concatenate([unit, -unit]), boundary=boundary)
+
+
+def ring_lattice(n_states: int) -> Lattice:
+    """
+    Creates the walk of circular_1d_transition_matrix.
+
+    Args:
+        n_states: The number of states in the circular random walk.
+
+    Returns:
+        Lattice: The walk on the circle.
+    """
+    return Lattice((n_states,), [(-1,), (1,)])
+
+
+def torus_lattice(grid_size: Tuple[int, int]) -> Lattice:
+    """
+    Creates the walk of torus_transition_matrix.
+
+    Square grids are walked as a (y, x) lattice where every coordinate wraps around on its own,
+    non-square grids as a ring of m * n states moving by -m, m, -n and n.
+
+    Args:
+        grid_size: A tuple representing the size of the torus grid (m, n).
+
+    Returns:
+        Lattice: The walk on the torus.
+    """
+    if (grid_size[0] == grid_size[1]):
+        return Lattice((grid_size[1], grid_size[0]), [(1, 0), (-1, 0), (0, -1), (0, 1)]) # Upper, Lower, Left, Right
+    return Lattice((grid_size[0] * grid_size[1],), [(-grid_size[0],), (grid_size[0],), (-grid_size[1],), (grid_size[1],)])
@@ -0,0 +1,77 @@
+import gc
+import importlib
+import sys
+import types
+from typing import Callable, Dict, List, Optional
+
+# Every module handed out by lazy_import, so that preload_modules can import them all at once
+LAZY_MODULES: Dict[str, 'LazyModule'] = {}
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module that is imported on first attribute access, so that importing the backend does not pay
+    for heavy dependencies a route never uses.
+
+    Attribute lookups are forwarded to the imported module, so names it rebinds later stay current.
+
+    Args:
+        name: The full name of the module, e.g. 'matplotlib.pyplot'.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._on_load: List[Callable[[types.ModuleType], None]] = []
+        self._module: Optional[types.ModuleType] = None
+
+    def _load(self) -> types.ModuleType:
+        if self._module is None:
+            module = importlib.import_module(self.__name__)
+            for callback in self._on_load:
+                callback(module)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str, on_load: Optional[Callable[[types.ModuleType], None]] = None) -> types.ModuleType:
+    """
+    Returns a module that is imported on first use, or the module itself if it was already imported.
+
+    Args:
+        name: The full name of the module.
+        on_load: Called with the module once it is imported, e.g. to configure it. Called right away if it
+                 already was.
+
+    Returns:
+        ModuleType: The module or its LazyModule.
+    """
+    if name in sys.modules:
+        module = sys.modules[name]
+        if on_load is not None:
+            on_load(module)
+        return module
+    if name not in LAZY_MODULES:
+        LAZY_MODULES[name] = LazyModule(name)
+    if on_load is not None:
+        LAZY_MODULES[name]._on_load.append(on_load)
+    return LAZY_MODULES[name]
+
+
+def preload_modules(freeze: bool = True):
+    """
+    Imports every lazily imported module, for pre-fork servers that load the app before forking its workers.
+
+    Args:
+        freeze: Bool to set if the objects allocated so far are moved out of the garbage collector's reach, so that
+                collections in the workers do not write to (and copy) the pages they share with the parent.
+    """
+    for module in list(LAZY_MODULES.values()):
+        module._load()
+    if freeze:
+        gc.freeze()
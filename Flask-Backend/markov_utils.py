@@ -0,0 +1,215 @@
+from typing import List, Optional
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse import linalg as sparse_linalg
+from shared_store_utils import csr_arrays, csr_from_arrays, shared_arrays
+
+
+class SparseMarkovChain:
+    """
+    A Markov chain backed by a scipy.sparse transition matrix.
+
+    It offers the parts of the pydtmc.MarkovChain interface that the backend relies on (next, walk, pi,
+    is_ergodic and mixing_time) without ever materializing a dense N x N matrix. An optional teleport
+    probability adds a uniform jump to every state, the rank-one term is kept implicit.
+
+    Args:
+        p: The sparse part of the transition matrix, its rows sum to 1 - teleport_prob.
+        states: List of the state names, the string indexes of the states by default.
+        teleport_prob: Probability of jumping to a uniformly chosen state in each step.
+        shared_key: Identifies the chain across processes, the arrays derived from p are then shared with
+                    shared_arrays. None to build them in this process only.
+    """
+
+    def __init__(self, p: sparse.spmatrix, states: Optional[List[str]] = None, teleport_prob: float = 0.0,
+                 shared_key: Optional[tuple] = None):
+        self.p = sparse.csr_matrix(p, dtype=float)
+        self.p.sum_duplicates()
+        self.size = self.p.shape[0]
+        self.states = [str(i) for i in range(self.size)] if states is None else list(states)
+        self.teleport_prob = teleport_prob
+        self._state_indexes = {state: i for i, state in enumerate(self.states)}
+        arrays = self._derived_arrays() if shared_key is None else shared_arrays(('markov_chain',) + tuple(shared_key), self._derived_arrays)
+        self._p_transposed = csr_from_arrays(arrays, 'p_transposed_')
+        self._sampling_keys = arrays['sampling_keys']
+        self._pi = None
+
+    def _derived_arrays(self) -> dict:
+        # Entry j of row r gets the key r + (probability of the entries up to j given that no teleport happened),
+        # so one searchsorted over all keys samples the next state of many walkers at once
+        rows = np.repeat(np.arange(self.size), np.diff(self.p.indptr))
+        row_sums = np.asarray(self.p.sum(axis=1)).ravel()
+        weights = self.p.data / np.where(row_sums > 0, row_sums, 1)[rows]
+        cumulative = np.cumsum(weights)
+        row_starts = np.concatenate(([0.0], cumulative))[self.p.indptr[:-1]]
+        return dict(csr_arrays(self.p.T.tocsr(), 'p_transposed_'), sampling_keys=cumulative - row_starts[rows] + rows)
+
+    def next_indices(self, positions: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Samples the next state index of every walker in positions at once.
+
+        Args:
+            positions: The current state indexes of the walkers.
+            rng: The random generator to draw from.
+
+        Returns:
+            np.ndarray: The next state indexes of the walkers.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        positions = np.asarray(positions)
+        keys = positions + rng.random(positions.shape)
+        entries = np.searchsorted(self._sampling_keys, keys, side='right')
+        entries = np.clip(entries, self.p.indptr[positions], self.p.indptr[positions + 1] - 1)
+        next_positions = self.p.indices[entries]
+        if self.teleport_prob > 0:
+            teleported = rng.random(positions.shape) < self.teleport_prob
+            next_positions[teleported] = rng.integers(0, self.size, size=np.count_nonzero(teleported))
+        return next_positions
+
+    def next(self, initial_state: str, seed: Optional[int] = None) -> str:
+        """
+        Samples the state following initial_state.
+
+        Args:
+            initial_state: The name of the current state.
+            seed: Seed of the random generator.
+
+        Returns:
+            str: The name of the next state.
+        """
+        position = self._state_indexes[str(initial_state)]
+        next_position = self.next_indices(np.array([position]), np.random.default_rng(seed))[0]
+        return self.states[next_position]
+
+    def walk(self, steps: int, initial_state: Optional[str] = None, seed: Optional[int] = None) -> List[str]:
+        """
+        Simulates a single walk of the given number of steps.
+
+        Args:
+            steps: The number of steps in the walk.
+            initial_state: The name of the state the walk starts from, a random state by default.
+            seed: Seed of the random generator.
+
+        Returns:
+            List[str]: The names of the visited states, initial state included.
+        """
+        rng = np.random.default_rng(seed)
+        position = rng.integers(0, self.size) if initial_state is None else self._state_indexes[str(initial_state)]
+        positions = np.empty(steps + 1, dtype=np.int64)
+        positions[0] = position
+        for i in range(steps):
+            positions[i + 1] = self.next_indices(positions[i:i + 1], rng)[0]
+        return [self.states[position] for position in positions]
+
+    def propagate(self, distribution: np.ndarray, steps: int = 1) -> np.ndarray:
+        """
+        Computes the distribution of the chain after the given number of steps.
+
+        Args:
+            distribution: The distribution of the states at the start.
+            steps: The number of steps to take.
+
+        Returns:
+            np.ndarray: The distribution of the states after the steps.
+        """
+        distribution = np.asarray(distribution, dtype=float)
+        for _ in range(steps):
+            total = distribution.sum()
+            distribution = self._p_transposed @ distribution
+            if self.teleport_prob > 0:
+                distribution += self.teleport_prob * total / self.size
+        return distribution
+
+    def stationary_distribution(self) -> np.ndarray:
+        """
+        Computes the stationary distribution of the chain, assuming that it is irreducible.
+
+        Returns:
+            np.ndarray: The stationary distribution.
+        """
+        if self._pi is not None:
+            return self._pi
+
+        identity = sparse.identity(self.size, format='csr')
+        if self.teleport_prob > 0:
+            pi = sparse_linalg.spsolve((identity - self.p).T.tocsc(),
+                                       np.full(self.size, self.teleport_prob / self.size))
+        elif np.allclose(np.asarray(self.p.sum(axis=0)).ravel(), 1.0):
+            # Doubly stochastic chains, like the walks on the torus and the circle, are uniform in the limit
+            pi = np.full(self.size, 1.0 / self.size)
+        else:
+            # Replace the last balance equation by the normalization to pin down the solution
+            balance = (self._p_transposed - identity).tolil()
+            balance[self.size - 1, :] = np.ones(self.size)
+            rhs = np.zeros(self.size)
+            rhs[-1] = 1.0
+            pi = sparse_linalg.spsolve(balance.tocsc(), rhs)
+
+        self._pi = pi / pi.sum()
+        return self._pi
+
+    @property
+    def pi(self) -> List[np.ndarray]:
+        return [self.stationary_distribution()]
+
+    @property
+    def is_irreducible(self) -> bool:
+        if self.teleport_prob > 0:
+            return True
+        n_components, _ = csgraph.connected_components(self.p, directed=True, connection='strong')
+        return n_components == 1
+
+    @property
+    def period(self) -> int:
+        if self.teleport_prob > 0 or np.any(self.p.diagonal() > 0):
+            return 1
+        # The period is the gcd of the level differences along the edges of a breadth first search tree
+        levels = csgraph.dijkstra(self.p, indices=0, unweighted=True)
+        edges = self.p.tocoo()
+        reachable = np.isfinite(levels[edges.row]) & np.isfinite(levels[edges.col])
+        differences = levels[edges.row[reachable]] + 1 - levels[edges.col[reachable]]
+        return int(np.gcd.reduce(np.abs(differences).astype(np.int64)))
+
+    @property
+    def is_aperiodic(self) -> bool:
+        return self.period == 1
+
+    @property
+    def is_ergodic(self) -> bool:
+        return self.is_irreducible and self.is_aperiodic
+
+    def mixing_time(self, initial_distribution: Optional[np.ndarray] = None, jump: int = 1,
+                    cutoff_type: str = 'natural') -> Optional[int]:
+        """
+        Computes the mixing time of the chain from the given initial distribution, following pydtmc.
+
+        Args:
+            initial_distribution: The distribution of the states at the start, uniform by default.
+            jump: The number of steps in each iteration.
+            cutoff_type: 'natural' for a cutoff of 1 / (2e) or 'traditional' for a cutoff of 1/4.
+
+        Returns:
+            Optional[int]: The mixing time, None if the chain is not ergodic or has not mixed within 100 iterations.
+        """
+        if not self.is_ergodic:
+            return None
+
+        if initial_distribution is None:
+            initial_distribution = np.full(self.size, 1.0 / self.size)
+        cutoff = 0.25 if cutoff_type == 'traditional' else 1.0 / (2.0 * np.exp(1.0))
+        pi = self.stationary_distribution()
+
+        iterations = 0
+        mixing_time = 0
+        tvd = 1.0
+        distribution = self.propagate(initial_distribution)
+        while iterations < 100 and tvd > cutoff:
+            iterations += 1
+            tvd = np.sum(np.abs(distribution - pi))
+            distribution = self.propagate(distribution)
+            mixing_time += jump
+
+        if iterations == 100:
+            return None
+        return mixing_time
@@ -0,0 +1,116 @@
+"""
+Measures the cold start of the backend in fresh interpreters: the time and memory to import the app, and the time and
+memory of the first request to every route in a worker forked from it, the way a pre-fork server runs it.
+
+    python measure_startup.py              # heavy libraries imported on first use
+    python measure_startup.py --preload    # imported with the app, see app.preload
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Optional
+
+# The first request measured per route, small enough for the import to dominate
+ROUTE_BODIES = {
+    '/process': {'n': 50, 'grid_x': 5, 'grid_y': 5, 'target_x': 2, 'target_y': 3},
+    '/classical_1d': {'n': 50, 'n_states': 21, 'n_sims': 200},
+    '/multiple_runs': {'n': 30, 'grid_x': 6, 'grid_y': 6, 'n_sims': 300},
+    '/theoretical_distribution': {'n': 10, 'grid_x': 5, 'grid_y': 5, 'n_sims': 200},
+    '/quantum': {'number_qubits': 4, 'iterator': 5, 'sample_number': 500},
+    '/quantum_2d': {'number_qubits': 2, 'iterator': 3, 'sample_number': 300},
+}
+
+
+def memory_mb() -> Dict[str, Optional[float]]:
+    """
+    Reads the memory of the current process: resident, and the part of it not shared with other processes.
+
+    Returns:
+        dict: 'rss' and 'private' in MB, private is None where /proc/self/smaps_rollup is not available.
+    """
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        pass
+    if 'Rss' in fields:
+        return {'rss': fields['Rss'], 'private': fields['Private_Clean'] + fields['Private_Dirty']}
+    # ru_maxrss is the peak, in kB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'rss': peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 'private': None}
+
+
+def measure_route(route: str) -> Dict[str, Any]:
+    """
+    Imports the app and forks a worker that serves one request to the route, run in a fresh interpreter.
+
+    Args:
+        route: The route to request, one of ROUTE_BODIES.
+
+    Returns:
+        dict: The import time and memory of the app, and the request time, status and memory of the worker.
+    """
+    start = time.perf_counter()
+    import app
+    measurement = {'route': route, 'import_s': time.perf_counter() - start, 'import_mb': memory_mb()}
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        start = time.perf_counter()
+        response = app.app.test_client().post(route, json=ROUTE_BODIES[route])
+        worker = {'request_s': time.perf_counter() - start, 'status': response.status_code, 'worker_mb': memory_mb()}
+        with os.fdopen(write_end, 'w') as pipe:
+            json.dump(worker, pipe)
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        measurement.update(json.load(pipe))
+    os.waitpid(pid, 0)
+    return measurement
+
+
+def run_fresh(route: str, preload: bool) -> Dict[str, Any]:
+    """
+    Runs measure_route in a new interpreter, so that nothing is imported yet.
+
+    Args:
+        route: The route to request.
+        preload: Bool to set if the app imports everything when it is loaded.
+
+    Returns:
+        dict: The measurement.
+    """
+    env = dict(os.environ, RANDOMWALK_PRELOAD='1' if preload else '0')
+    code = f"import json, measure_startup; print(json.dumps(measure_startup.measure_route({route!r})))"
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preload', action='store_true', help="import the heavy libraries with the app")
+    parser.add_argument('--route', action='append', choices=sorted(ROUTE_BODIES), help="measure only these routes")
+    args = parser.parse_args()
+
+    print(f"{'route':<26}{'import s':>9}{'import MB':>10}{'request s':>10}{'worker MB':>10}{'private MB':>11}")
+    for route in args.route or list(ROUTE_BODIES):
+        result = run_fresh(route, args.preload)
+        private = result['worker_mb']['private']
+        print(f"{route:<26}{result['import_s']:>9.2f}{result['import_mb']['rss']:>10.0f}{result['request_s']:>10.2f}"
+              f"{result['worker_mb']['rss']:>10.0f}{'-' if private is None else format(private, '.0f'):>11}"
+              f"{'' if result['status'] == 200 else '  HTTP ' + str(result['status'])}")
+
+
+if __name__ == '__main__':
+    main()
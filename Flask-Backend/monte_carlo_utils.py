@@ -0,0 +1,128 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+import numpy as np
+from accumulator_utils import WalkAccumulator
+from lattice_utils import Lattice
+from pool_utils import start_process_pool
+
+# Processes simulating the shards of large runs, set RANDOMWALK_SIMULATION_WORKERS to use them. Every web worker
+# gets its own pool, 0 simulates all shards in the process handling the request
+SIMULATION_WORKERS = int(os.environ.get('RANDOMWALK_SIMULATION_WORKERS', 0))
+
+# Walkers per shard. The shards do not depend on the number of workers, so a seed gives the same result on any pool
+SHARD_SIZE = 1 << 15
+
+
+class MonteCarloSummary(NamedTuple):
+    accumulator: WalkAccumulator
+    seed: int
+
+    @property
+    def occupancy(self) -> np.ndarray:
+        return self.accumulator.occupancy
+
+
+def shard_sizes(n_sims: int, shard_size: int = SHARD_SIZE) -> List[int]:
+    """
+    Splits n_sims walkers into full shards of shard_size and a last partial one.
+    """
+    sizes = [shard_size] * (n_sims // shard_size)
+    if n_sims % shard_size:
+        sizes.append(n_sims % shard_size)
+    return sizes
+
+
+def _simulate_shard(
+    lattice: Lattice,
+    n: int,
+    n_walkers: int,
+    start_index: int,
+    target_index: Optional[int],
+    seed_sequence: np.random.SeedSequence,
+    mode: str,
+    snapshot_steps: frozenset,
+) -> WalkAccumulator:
+    accumulator = WalkAccumulator(lattice.size, mode, snapshot_steps)
+    lattice.simulate(n, n_walkers, start_index, target_index, rng=np.random.default_rng(seed_sequence), accumulator=accumulator)
+    return accumulator
+
+
+# Lattices received by a worker process, so that their neighbor tables are built once per worker and not per shard
+_worker_lattices: Dict[tuple, Lattice] = {}
+
+
+def _simulate_shard_in_worker(lattice: Lattice, *args) -> WalkAccumulator:
+    if lattice.key not in _worker_lattices:
+        if len(_worker_lattices) >= 8:
+            _worker_lattices.clear()
+        _worker_lattices[lattice.key] = lattice
+    return _simulate_shard(_worker_lattices[lattice.key], *args)
+
+
+def start_simulation_pool(workers: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    """
+    Starts the pool of processes simulating the shards of large runs, see start_process_pool.
+
+    Args:
+        workers: Number of worker processes, SIMULATION_WORKERS if None.
+
+    Returns:
+        Optional[ProcessPoolExecutor]: The pool, None if the shards are simulated in the calling process.
+    """
+    workers = SIMULATION_WORKERS if workers is None else workers
+    return start_process_pool(('simulation', workers), workers if workers > 1 else 0, ['monte_carlo_utils'])
+
+
+def sharded_simulation(
+    lattice: Lattice,
+    n: int,
+    n_sims: int,
+    start_index: int = 0,
+    target_index: Optional[int] = None,
+    seed: Optional[Union[int, str]] = None,
+    workers: Optional[int] = None,
+    mode: str = 'final',
+    snapshot_steps: Iterable[int] = (),
+    progress: Optional[Callable[[float], None]] = None,
+) -> MonteCarloSummary:
+    """
+    Simulates n_sims walkers in shards, spread over the pool of start_simulation_pool if there is one, keeping only
+    the counts of a WalkAccumulator.
+
+    Every shard draws from its own child of a numpy SeedSequence, and the shards are laid out and reduced in
+    the same order whatever the number of workers, so a seed always gives the same result.
+
+    Args:
+        lattice: The walk.
+        n: number of the steps in the walk
+        n_sims: The number of walkers to simulate.
+        start_index: The index of the state every walker starts from.
+        target_index: The index of the state that we want to reach, None disables the search.
+        seed: The seed of the SeedSequence, an int or its decimal string, fresh entropy if None.
+        workers: Number of worker processes, SIMULATION_WORKERS if None, 0 or 1 to run in the calling process.
+        mode: 'final' to count the final states, 'all_steps' to count every state visited up to the hitting time.
+        snapshot_steps: The steps after which the occupancy of all walkers is also kept.
+        progress: Called with the fraction of the shards done.
+
+    Returns:
+        MonteCarloSummary: The accumulator of all shards and the entropy of the SeedSequence, that reproduces the
+                           run when passed as seed.
+    """
+    sizes = shard_sizes(n_sims)
+    snapshot_steps = frozenset(snapshot_steps)
+    seed_sequence = np.random.SeedSequence(None if seed is None else int(seed))
+    arguments = [(lattice, n, size, start_index, target_index, child, mode, snapshot_steps) for size, child in zip(sizes, seed_sequence.spawn(len(sizes)))]
+
+    pool = start_simulation_pool(workers) if len(sizes) > 1 else None
+    if pool is None:
+        shards = (_simulate_shard(*shard_arguments) for shard_arguments in arguments)
+    else:
+        shards = pool.map(_simulate_shard_in_worker, *zip(*arguments))
+
+    accumulator = WalkAccumulator(lattice.size, mode, snapshot_steps)
+    for index, shard in enumerate(shards):
+        accumulator.merge(shard)
+        if progress is not None:
+            progress((index + 1) / len(sizes))
+    return MonteCarloSummary(accumulator, seed_sequence.entropy)
@@ -0,0 +1,62 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Modules the forkserver imports before forking the workers of any pool. The forkserver is shared by all the
+# pools of a process, so its preload list is the union of theirs
+_preload: List[str] = []
+
+# The pools of the process, keyed by name, with the pid they were started in
+_pools: Dict[Hashable, Tuple[int, ProcessPoolExecutor]] = {}
+_pools_lock = threading.Lock()
+
+
+def start_process_pool(name: Hashable, workers: int, preload: Iterable[str] = ()) -> Optional[ProcessPoolExecutor]:
+    """
+    Starts a pool of worker processes once per process and name, None if there is none.
+
+    The workers come from a forkserver, a process started for this that has no request threads, so they do not
+    inherit locks held by other requests at the time they are started, and they are only started when work is
+    submitted. Processes of multiprocessing, e.g. job workers, get no pools and do the work themselves instead of
+    nesting pools.
+
+    Args:
+        name: The name of the pool.
+        workers: The largest number of worker processes, no pool if it is not positive.
+        preload: Modules the workers import when the forkserver starts, e.g. those of the tasks they run.
+
+    Returns:
+        Optional[ProcessPoolExecutor]: The pool, None in worker processes or without workers.
+    """
+    # Named before they import the main module, parent_process() is only set after that
+    if workers <= 0 or multiprocessing.current_process().name != 'MainProcess':
+        return None
+    with _pools_lock:
+        pid, pool = _pools.get(name, (None, None))
+        # A forked web worker does not inherit the pools of the server process, it starts its own
+        if pid != os.getpid():
+            context = multiprocessing.get_context('forkserver')
+            _preload.extend(module for module in preload if module not in _preload)
+            context.set_forkserver_preload(_preload)
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pools[name] = (os.getpid(), pool)
+        return pool
+
+
+@atexit.register
+def shutdown_process_pools(wait: bool = True):
+    """
+    Shuts down the pools started by this process, cancelling the work that has not started.
+
+    Args:
+        wait: Bool to set if the call returns once the running work is done and the workers exited.
+    """
+    with _pools_lock:
+        pools = [pool for pid, pool in _pools.values() if pid == os.getpid()]
+        for name in [name for name, (pid, _) in _pools.items() if pid == os.getpid()]:
+            del _pools[name]
+    for pool in pools:
+        pool.shutdown(wait=wait, cancel_futures=True)
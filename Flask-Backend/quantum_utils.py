@@ -1,13 +1,23 @@
-import cirq
-import seaborn as sns
-import pandas as pd
+from __future__ import annotations
 import numpy as np
-from matplotlib import pyplot as plt
-from matplotlib.ticker import PercentFormatter
-from scipy.stats import kde
 import base64
 import io
-import imageio
+from typing import NamedTuple
+from cache_utils import ARTIFACT_CACHE
+from kde_utils import binned_kde_2d
+from lazy_utils import lazy_import
+from render_utils import FAST_HEATMAP_CELLS, encode_gif_base64, encode_png_base64, fast_heatmap_base64, heatmap_grid, render_frames, report_frames
+from shared_store_utils import shared_arrays
+from results_utils import Histogram, coordinate_labels, histogram_arrays, marginal_probabilities, split_coordinates
+from coined_walk_utils import coin_matrix, coined_step_1d, coined_step_2d, from_state_vector, initial_state_1d, initial_state_2d, to_state_vector
+from validation_utils import InvalidParameter
+
+# Imported on first use, most routes never need them
+cirq = lazy_import('cirq')
+sns = lazy_import('seaborn')
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot')
+
 
 def initial_state(number_qubits: int, is_y=False):
     yield cirq.X.on(cirq.GridQubit(0, 0))
@@ -45,60 +55,97 @@ def walk_step(number_qubits: int):
             yield cirq.X.on(cirq.GridQubit(0, i))
 
 
-def generate_walk(number_qubits: int, iterator: int, sample_number: int, is_y=False):
-    qubits = cirq.GridQubit.rect(1, number_qubits)
-    circuit = cirq.Circuit()
-    circuit.append(initial_state(number_qubits, is_y))
-    for j in range(iterator):
-        circuit.append(walk_step(number_qubits))
-    state_vector = cirq.final_state_vector(circuit)
-    circuit.append(cirq.measure(*qubits, key='x'))
-    #print(circuit)
-    simulator = cirq.Simulator()
-    result = simulator.run(circuit, repetitions=sample_number)
-    final = result.histogram(key='x')
+def generate_walk(number_qubits: int, iterator: int, sample_number: int, is_y=False, engine='cirq', dtype=np.complex128):
+    check_engine(engine)
+    state_vector = walk_state_vector(1, number_qubits, iterator, is_y, engine, dtype)
+    final = sample_histogram_from_state_vector(state_vector, 1, sample_number)
     return final, state_vector
 
 
-def state_vector_2_probability(state_vector):
-    for index in range(0, state_vector.shape[0], 2):
-        state_vector[index] = np.abs(state_vector[index])**2 + np.abs(state_vector[index + 1])**2
-    state_vector = np.delete(state_vector, range(1, state_vector.shape[0], 2))
+PRECISIONS = {'complex64': np.complex64, 'complex128': np.complex128}
 
-    df_state_vector = pd.DataFrame(state_vector, columns=["Probabilites"])
-    #df_state_vector = df_state_vector.apply(lambda x: np.abs(x)**2)
-    df_state_vector["Position_Vectors"] = df_state_vector.index
 
-    for id, data in df_state_vector.iterrows():
-        if (data["Probabilites"] == 0+0j):
-            df_state_vector.drop(id, axis=0, inplace=True)
-    df_state_vector.reset_index(drop=True ,inplace=True)
+def precision_dtype(precision):
+    """
+    Returns the dtype of the state vectors for the precision of a request, 'complex64' or 'complex128'.
+    """
+    if precision not in PRECISIONS:
+        raise InvalidParameter(f"Unknown precision '{precision}', expected one of {sorted(PRECISIONS)}")
+    return PRECISIONS[precision]
 
-    return df_state_vector
 
+# Simulators of the walks, see walk_state_vector
+ENGINES = ('cirq', 'numpy')
 
-def results_2_df(final, sample_number):
 
-    x_arr = list(final.keys())
-    y_arr = [dict(final)[j] for j in dict(final).keys()]
+def check_engine(engine):
+    """
+    Raises ValueError if engine is not one of ENGINES.
+    """
+    if engine not in ENGINES:
+        raise InvalidParameter(f"Unknown engine '{engine}', expected one of {list(ENGINES)}")
+
 
-    x_arr_final = []
-    y_arr_final = []
+def norm_drift(state_vector):
+    """
+    Measures the error accumulated by a simulation as the deviation of the norm of its state vector from 1.
 
-    while (len(x_arr) > 0):
+    Args:
+        state_vector (np.ndarray): The state vector.
 
-        x_arr_final.append(min(x_arr))
-        y_arr_final.append(y_arr[x_arr.index(min(x_arr))])
-        holder = x_arr.index(min(x_arr))
-        del x_arr[holder]
-        del y_arr[holder]
+    Returns:
+        float: The absolute difference between the squared norm, summed in double precision, and 1.
+    """
+    return abs(float(np.square(np.abs(state_vector)).sum(dtype=np.float64)) - 1.0)
 
-    
-    dict_final = dict(Position_Vectors=x_arr_final,Occurances=y_arr_final)
-    data_final = pd.DataFrame.from_dict(dict_final, orient='columns')
-    data_final = data_final.assign(Probabilites = lambda x: (x["Occurances"] / sample_number))
-    #data_final = data_final.assign(Qubits = lambda x: (x['Qubits']%number_qubits))
-    data_final
+
+def position_probabilities(state_vector, number_coin_qubits):
+    """
+    Marginalizes the coin qubits out of a state vector ordered with the position qubits first.
+
+    Args:
+        state_vector (np.ndarray): The state vector, the coin qubits are the least significant ones.
+        number_coin_qubits (int): Number of coin qubits.
+
+    Returns:
+        np.ndarray: The probability of every position, indexed like a measurement of the position qubits.
+    """
+    probabilities = marginal_probabilities(state_vector, number_coin_qubits)
+    return probabilities / probabilities.sum()
+
+
+def sample_histogram_from_state_vector(state_vector, number_coin_qubits, sample_number, seed=None):
+    """
+    Draws measurements of the position qubits from a state vector with a single multinomial draw,
+    instead of simulating the circuit again with measurements appended.
+
+    Args:
+        state_vector (np.ndarray): The state vector, ordered with the position qubits first and the coin qubits last.
+        number_coin_qubits (int): Number of coin qubits.
+        sample_number (int): Number of measurements to draw.
+        seed: Seed of the random generator.
+
+    Returns:
+        Histogram: The number of times every position was measured, like cirq.Result.histogram.
+    """
+    counts = np.random.default_rng(seed).multinomial(sample_number, position_probabilities(state_vector, number_coin_qubits))
+    outcomes = np.flatnonzero(counts)
+    return Histogram(outcomes, counts[outcomes])
+
+
+def state_vector_2_probability(state_vector):
+    probabilities = marginal_probabilities(state_vector, 1)
+    positions = np.flatnonzero(probabilities)
+
+    df_state_vector = pd.DataFrame({"Probabilites": probabilities[positions], "Position_Vectors": positions})
+
+    return df_state_vector
+
+
+def results_2_df(final, sample_number):
+    positions, occurrences = histogram_arrays(final)
+
+    data_final = pd.DataFrame({"Position_Vectors": positions, "Occurances": occurrences, "Probabilites": occurrences / sample_number})
 
     return data_final
 
@@ -119,9 +166,7 @@ def bar_quantum(data_final):
 def heatmap_quantum(data_final):
     fig, ax = plt.subplots(figsize=(20,10))
     nbins=256
-    k = kde.gaussian_kde([data_final['Position_Vectors'],data_final['Occurances']])
-    xi, yi = np.mgrid[data_final['Position_Vectors'].min():data_final['Position_Vectors'].max():nbins*1j, data_final['Occurances'].min():data_final['Occurances'].max():nbins*1j]
-    zi = k(np.vstack([xi.flatten(), yi.flatten()]))
+    xi, yi, zi = binned_kde_2d(data_final['Position_Vectors'], data_final['Occurances'], nbins)
     plt.pcolormesh(xi, yi, zi.reshape(xi.shape), shading='auto')
     ax.set_title("Heatmap of the quantum walk")
     buffer = io.BytesIO()
@@ -182,24 +227,248 @@ def initialize_2D(circuit, n ,pos, qpos):
             circuit.append(cirq.X(qpos[n + j]))
     return circuit
 
-def run_2d_walk(n, steps, sample_number):
-    simulator = cirq.Simulator()
+def run_2d_walk(n, steps, sample_number, engine='cirq', dtype=np.complex128):
+    check_engine(engine)
+    state_vector = walk_state_vector(2, n, steps, engine=engine, dtype=dtype)
+    final = sample_histogram_from_state_vector(state_vector, 2, sample_number)
+    return final, state_vector
+
 
-    qpos = cirq.NamedQubit.range(2 * n, prefix='pos_')
-    qcoin = cirq.NamedQubit.range(2, prefix='coin_')
+class StepOperator(NamedTuple):
+    coin: np.ndarray
+    source: np.ndarray
 
-    circuit = cirq.Circuit()
-    circuit = initialize_2D(circuit, n, [2**(n-1), 2**(n-1)], qpos)
 
+def walk_circuits(dimension, number_qubits, is_y=False):
+    """
+    Builds the circuits of the 1D walk of generate_walk or the 2D walk of run_2d_walk.
+
+    Args:
+        dimension (int): 1 for the walk on the cycle, 2 for the walk on the torus.
+        number_qubits (int): Number of qubits per coordinate.
+        is_y (bool): Bool to set if the coin of the 1D walk starts in (|0> - i|1>) / sqrt(2).
+
+    Returns:
+        tuple: The circuit preparing the initial state, the circuit of one step, the qubit order
+               (position qubits first, coin qubits last) and the coin qubits.
+    """
+    if dimension == 1:
+        qpos = cirq.GridQubit.rect(1, number_qubits)
+        qcoin = [cirq.GridQubit(0, number_qubits)]
+        initial = cirq.Circuit(initial_state(number_qubits, is_y))
+        step_circuit = cirq.Circuit(walk_step(number_qubits))
+    elif dimension == 2:
+        qpos = cirq.NamedQubit.range(2 * number_qubits, prefix='pos_')
+        qcoin = cirq.NamedQubit.range(2, prefix='coin_')
+        initial = initialize_2D(cirq.Circuit(), number_qubits, [2**(number_qubits-1), 2**(number_qubits-1)], qpos)
+        step_circuit = cirq.Circuit()
+        step(step_circuit, qpos, qcoin)
+    else:
+        raise ValueError(f"Unsupported dimension {dimension}, expected 1 or 2")
+    return initial, step_circuit, qpos + qcoin, qcoin
+
+
+def _controlled_x(operation):
+    """Returns the controls and the target of an X gate with any number of |1> controls, None for other gates."""
+    gate = operation.gate
+    qubits = list(operation.qubits)
+    controls = []
+    while isinstance(gate, cirq.ControlledGate):
+        if set(gate.control_values.expand()) != {(1,) * gate.num_controls()}:
+            return None
+        controls += qubits[:gate.num_controls()]
+        qubits = qubits[gate.num_controls():]
+        gate = gate.sub_gate
+    if gate not in (cirq.X, cirq.CNOT, cirq.CCX):
+        return None
+    return controls + qubits[:-1], qubits[-1]
+
+
+def decompose_step(step_circuit, qubit_order, coin_qubits):
+    """
+    Splits the circuit of a walk step into the coin and the shift, a permutation of the basis states.
+
+    The shift only consists of X gates with controls, so it is evaluated on all basis indices at once with
+    bit operations instead of building the 2^q x 2^q unitary.
+
+    Args:
+        step_circuit (cirq.Circuit): The circuit of one step, coin gates first.
+        qubit_order (list): The qubit order of the state vectors, coin qubits last.
+        coin_qubits (list): The coin qubits.
+
+    Returns:
+        StepOperator: The coin unitary and, for every basis state, the basis state its amplitude comes from.
+    """
+    bits = {qubit: 1 << (len(qubit_order) - 1 - i) for i, qubit in enumerate(qubit_order)}
+    images = np.arange(2**len(qubit_order))
+    coin_operations = []
+    shifted = False
+    for operation in step_circuit.all_operations():
+        action = _controlled_x(operation)
+        if action is None:
+            if shifted or not set(operation.qubits) <= set(coin_qubits):
+                raise ValueError(f"Cannot decompose the step, {operation} is not a coin gate ahead of the shift")
+            coin_operations.append(operation)
+            continue
+        shifted = True
+        controls, target = action
+        mask = sum(bits[qubit] for qubit in controls)
+        images[(images & mask) == mask] ^= bits[target]
+
+    source = np.empty(images.size, dtype=np.int32 if images.size <= np.iinfo(np.int32).max else np.int64)
+    source[images] = np.arange(images.size)
+    coin = cirq.Circuit(coin_operations).unitary(qubit_order=coin_qubits)
+    return StepOperator(coin, source)
+
+
+def step_operator(dimension, number_qubits):
+    """
+    Returns the decomposed step of a walk, cached in ARTIFACT_CACHE per (dimension, qubits) and shared between workers.
+    """
+    def decompose():
+        _, step_circuit, qubit_order, coin_qubits = walk_circuits(dimension, number_qubits)
+        return decompose_step(step_circuit, qubit_order, coin_qubits)._asdict()
+
+    def build():
+        return StepOperator(**shared_arrays(('quantum_step', dimension, number_qubits), decompose))
+
+    return ARTIFACT_CACHE.get_or_build(('quantum_step', dimension, number_qubits), build)
+
+
+def apply_step(state_vector, operator):
+    """
+    Applies one decomposed walk step to a state vector ordered with the coin qubits last.
+    """
+    coin_states = operator.coin.shape[0]
+    state_vector = (state_vector.reshape(-1, coin_states) @ operator.coin.T.astype(state_vector.dtype)).ravel()
+    return state_vector[operator.source]
+
+
+def walk_state_vector(dimension, number_qubits, steps, is_y=False, engine='cirq', dtype=np.complex128):
+    """
+    Returns the state vector of a walk after the given number of steps, memoized in ARTIFACT_CACHE.
+
+    State vectors are deterministic, so they are cached per (dimension, qubits, initial state, engine, dtype, steps),
+    and shared between workers when SHARED_STORE is set. On a miss, the walk is continued from the cached state
+    vector with the most steps below the requested ones, or from the initial state if there is none.
+
+    Args:
+        dimension (int): 1 for the walk of generate_walk, 2 for the walk of run_2d_walk.
+        number_qubits (int): Number of qubits per coordinate.
+        steps (int): Number of steps.
+        is_y (bool): Bool to set if the coin of the 1D walk starts in (|0> - i|1>) / sqrt(2).
+        engine (str): 'cirq' to apply the decomposed circuit step, 'numpy' for the coined walk of coined_walk_utils.
+        dtype: np.complex128, or np.complex64 to halve the memory of the state vectors at the cost of precision.
+
+    Returns:
+        np.ndarray: The read-only state vector, ordered with the position qubits first and the coin qubits last.
+    """
+    check_engine(engine)
+    prefix = ('quantum_state', dimension, number_qubits, bool(is_y), engine, np.dtype(dtype).name)
+    key = prefix + (steps,)
+    state_vector = ARTIFACT_CACHE.get(key)
+    if state_vector is not None:
+        return state_vector
+
+    def build():
+        return {'state_vector': _evolve_state_vector(prefix, steps, dimension, number_qubits, is_y, engine, dtype)}
+
+    return _cache_state_vector(key, shared_arrays(key, build)['state_vector'])
+
+
+def _evolve_state_vector(prefix, steps, dimension, number_qubits, is_y, engine, dtype):
+    cached_steps = [cached[-1] for cached in ARTIFACT_CACHE.keys() if cached[:-1] == prefix and cached[-1] < steps]
+    start = max(cached_steps, default=0)
+    state_vector = ARTIFACT_CACHE.get(prefix + (start,)) if cached_steps else None
+    if state_vector is None:
+        start = 0
+        state_vector = _initial_state_vector(dimension, number_qubits, is_y, engine, dtype)
+
+    if engine == 'numpy':
+        shape = (2 * dimension,) + (2**number_qubits,) * dimension
+        coin = coin_matrix('hadamard', dimension).astype(state_vector.dtype)
+        coined_step = coined_step_1d if dimension == 1 else coined_step_2d
+        psi = from_state_vector(state_vector, shape)
+        for _ in range(steps - start):
+            psi = coined_step(psi, coin)
+        state_vector = to_state_vector(psi)
+    else:
+        operator = step_operator(dimension, number_qubits)
+        for _ in range(steps - start):
+            state_vector = apply_step(state_vector, operator)
+    return state_vector
+
+
+def _initial_state_vector(dimension, number_qubits, is_y, engine, dtype):
+    if engine == 'numpy':
+        if dimension == 1:
+            return to_state_vector(initial_state_1d(2**number_qubits, is_y, dtype))
+        return to_state_vector(initial_state_2d(2**number_qubits, dtype))
+    initial, _, qubit_order, _ = walk_circuits(dimension, number_qubits, is_y)
+    return cirq.final_state_vector(initial, qubit_order=qubit_order, dtype=dtype)
+
+
+def _cache_state_vector(key, state_vector):
+    # Shared state vectors are read-only mappings already, the others get a read-only copy of their own
+    if state_vector.flags.writeable:
+        state_vector = np.array(state_vector)
+        state_vector.flags.writeable = False
+    return ARTIFACT_CACHE.put(key, state_vector)
+
+
+def evolve_2d_walk(n, steps, sample_number=None, engine='cirq', dtype=np.complex128, progress=None):
+    """
+    Evolves the 2D walk one step at a time on a single running state vector, instead of re-simulating from step 0.
+
+    Args:
+        n (int): Number of qubits per coordinate.
+        steps (int): Number of steps to evolve.
+        sample_number (int): Number of measurements to draw after every step, None to skip sampling.
+        engine (str): 'cirq' to simulate the circuit of step, 'numpy' for the equivalent coined walk of coined_walk_utils.
+        dtype: The complex dtype of the state vector, np.complex128 or np.complex64.
+        progress: Called with the fraction of the steps done.
+
+    Returns:
+        tuple: The position probabilities after every step (indexed like the 'x' measurement key), the histograms
+               of the samples after every step (empty if sample_number is None) and the final state vector,
+               ordered with the position qubits first and the coin qubits last.
+    """
+    check_engine(engine)
+    advance, state_vector = _numpy_2d_stepper(n, dtype) if engine == 'numpy' else _cirq_2d_stepper(n, dtype)
+
+    probabilities = []
+    histograms = []
     for i in range(steps):
-        step(circuit, qpos, qcoin)
-    state_vector = cirq.final_state_vector(circuit)
+        state_vector = advance(state_vector)
+        probabilities.append(position_probabilities(state_vector, 2))
+        if sample_number is not None:
+            histograms.append(sample_histogram_from_state_vector(state_vector, 2, sample_number))
+        if progress is not None:
+            progress((i + 1) / steps)
+    key = ('quantum_state', 2, n, False, engine, np.dtype(dtype).name, steps)
+    final_state = state_vector
+    state_vector = _cache_state_vector(key, shared_arrays(key, lambda: {'state_vector': final_state})['state_vector'])
+    return probabilities, histograms, state_vector
+
+
+def _numpy_2d_stepper(n, dtype):
+    """Returns a function advancing a 2D walk state vector by one step with NumPy, and the initial state vector."""
+    psi = initial_state_2d(2**n, dtype)
+    coin = coin_matrix('hadamard', 2).astype(psi.dtype)
+
+    def advance(state):
+        return to_state_vector(coined_step_2d(from_state_vector(state, psi.shape), coin))
+    return advance, to_state_vector(psi)
+
+
+def _cirq_2d_stepper(n, dtype):
+    """Returns a function advancing a 2D walk state vector by one step of the decomposed circuit, and the initial state vector."""
+    operator = step_operator(2, n)
+
+    def advance(state):
+        return apply_step(state, operator)
+    return advance, _initial_state_vector(2, n, False, 'cirq', dtype)
 
-    circuit.append(cirq.measure(*qpos, key='x'))
-    result = simulator.run(circuit, repetitions=sample_number)
-    final = result.histogram(key='x')
-    return final, state_vector
-    
 
 def convert_2d_results_to_coordinates(final, n, sample_number):
     """
@@ -213,36 +482,18 @@ def convert_2d_results_to_coordinates(final, n, sample_number):
     Returns:
         pd.DataFrame: DataFrame with X Coordinate, Y Coordinate, Occurrences, Probabilities, and combined Coordinates.
     """
-    x_coords = []
-    y_coords = []
-    occurrences = []
-
-    for state, count in final.items():
-        # Convert the integer state to its binary representation, padded to 2n digits
-        binary_state = format(state, f'0{2 * n}b')
-        
-        # Split the binary string into x and y components
-        x_bin = binary_state[:n]
-        y_bin = binary_state[n:]
-        
-        # Convert binary strings to integer coordinates
-        x_coord = int(x_bin, 2)
-        y_coord = int(y_bin, 2)
-        
-        x_coords.append(x_coord)
-        y_coords.append(y_coord)
-        occurrences.append(count)
+    states, occurrences = histogram_arrays(final)
+    x_coords, y_coords = split_coordinates(states, n)
 
+    # States are sorted by x, then y, as the x qubits are the most significant ones
     data = pd.DataFrame({
         'X Coordinate': x_coords,
         'Y Coordinate': y_coords,
-        'Occurrences': occurrences
+        'Occurrences': occurrences,
+        'Probabilities': occurrences / sample_number,
+        'Coordinates': coordinate_labels(x_coords, y_coords),
     })
 
-    data['Probabilities'] = data['Occurrences'] / sample_number
-    data["Coordinates"] = data["X Coordinate"].astype(str) + ", " + data["Y Coordinate"].astype(str)
-    data = data.sort_values(by="Coordinates")
-
     return data
 
 
@@ -321,6 +572,11 @@ def heatmap_quantum_2d(data_final: pd.DataFrame) -> str:
     Returns:
         str: Path to the saved heatmap image.
     """
+    # Annotating every cell does not scale, large grids are drawn straight from a colormap lookup table
+    if (data_final["X Coordinate"].max() + 1) * (data_final["Y Coordinate"].max() + 1) > FAST_HEATMAP_CELLS:
+        heatmap_data = heatmap_grid(data_final["X Coordinate"], data_final["Y Coordinate"], data_final["Occurrences"])
+        return fast_heatmap_base64(heatmap_data, title="Heatmap of Occurrences", origin="lower")
+
     # Pivot the DataFrame to create a heatmap
     heatmap_data = data_final.pivot(index="Y Coordinate", columns="X Coordinate", values="Occurrences")
 
@@ -343,70 +599,49 @@ def heatmap_quantum_2d(data_final: pd.DataFrame) -> str:
     return image_base64
 
 
-def generate_heatmaps_base64(data_frames: list, number_qubits: int) -> list:
+def generate_heatmap_grids(data_frames: list, number_qubits: int) -> list:
     """
-    Generates a list of heatmaps from data frames, returning each image in base64 encoding.
+    Scatters the occurrences of every data frame into a 2**number_qubits x 2**number_qubits grid, indexed [y, x].
 
     Args:
         data_frames (list): A list of pandas DataFrames, each containing data for a heatmap.
 
     Returns:
-        list: A list of base64-encoded strings, each representing a heatmap image.
+        list: A list of np.ndarray grids.
     """
-    base64_images = []
-
-    for data_final in data_frames:
-        # Create a heatmap for each data frame and encode it in base64
-        grid_size = 2**number_qubits
-        heatmap_data = np.zeros((grid_size, grid_size))
-
-        for _, row in data_final.iterrows():
-            x = row['X Coordinate']
-            y = row['Y Coordinate']
-            heatmap_data[y, x] = row['Occurrences']
-        
-        plt.figure(figsize=(12, 12))
-        sns.heatmap(heatmap_data, annot=True, cmap="YlGnBu", fmt=".0f", cbar=True)
-        plt.title("Heatmap of Occurrences")
-        plt.xlabel("X Coordinates")
-        plt.ylabel("Y Coordinates")
+    grid_size = 2**number_qubits
+    return [
+        heatmap_grid(data_final['X Coordinate'], data_final['Y Coordinate'], data_final['Occurrences'], (grid_size, grid_size))
+        for data_final in data_frames
+    ]
 
-        # Save the plot to an in-memory buffer
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png')
-        buffer.seek(0)
 
-        # Encode the image data in base64
-        image_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-        base64_images.append(image_base64)
+def generate_heatmaps_base64(data_frames: list, number_qubits: int) -> list:
+    """
+    Generates a list of heatmaps from data frames, returning each image in base64 encoding.
 
-        plt.close()
+    Args:
+        data_frames (list): A list of pandas DataFrames, each containing data for a heatmap.
 
-    return base64_images
+    Returns:
+        list: A list of base64-encoded strings, each representing a heatmap image.
+    """
+    return [encode_png_base64(frame) for frame in render_frames(generate_heatmap_grids(data_frames, number_qubits))]
 
 
-def create_base64_gif_from_heatmaps(data_frames: list, number_qubits: int, duration=0.5) -> str:
+def create_base64_gif_from_heatmaps(data_frames: list, number_qubits: int, duration=0.5, progress=None) -> str:
     """
     Creates an animated GIF from a list of data frames representing heatmaps and returns it in base64 format.
 
+    The frames are rendered straight to RGB arrays and encoded into the GIF as they come, without going through PNG.
+
     Args:
         data_frames (list): A list of pandas DataFrames, each containing data for a heatmap.
-        duration (float): Duration of each frame in the GIF.
+        duration (float): Duration of each frame in the GIF, in seconds.
+        progress: Called with the fraction of the frames rendered.
 
     Returns:
         str: A base64-encoded string representing the animated GIF.
     """
-    # Generate the heatmap images in base64 format
-    images = generate_heatmaps_base64(data_frames, number_qubits)
-    image_objects = [imageio.imread(io.BytesIO(base64.b64decode(img))) for img in images]
-
-    # Create the animated GIF and save it to an in-memory buffer
-    gif_buffer = io.BytesIO()
-    imageio.mimsave(gif_buffer, image_objects, format='GIF', duration=duration, loop=0)
-    gif_buffer.seek(0)
-
-    # Encode the GIF data in base64
-    gif_base64 = base64.b64encode(gif_buffer.read()).decode('utf-8')
-
-    return gif_base64
-
+    grids = generate_heatmap_grids(data_frames, number_qubits)
+    return encode_gif_base64(report_frames(render_frames(grids), len(grids), progress), duration)
@@ -0,0 +1,284 @@
+import base64
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageDraw
+from lazy_utils import lazy_import
+from pool_utils import start_process_pool
+
+# Imported on first use, the fast renderers only need the colormaps
+matplotlib = lazy_import('matplotlib')
+sns = lazy_import('seaborn')
+plt = lazy_import('matplotlib.pyplot')
+
+# Grids with more cells than this skip the annotated seaborn heatmap, whose text artists dominate the render time
+FAST_HEATMAP_CELLS = 30 * 30
+
+# Animations with fewer frames are rendered in the calling process, starting workers would not pay off
+PARALLEL_FRAMES_MIN = 8
+
+# Processes rendering the frames of long animations, set RANDOMWALK_FRAME_WORKERS to use them. Every web worker
+# gets its own pool, 0 renders all frames in the process handling the request
+FRAME_WORKERS = int(os.environ.get('RANDOMWALK_FRAME_WORKERS', 0))
+
+# Frames of an animation over the steps of a walk when the request does not set the stride between them
+MAX_ANIMATION_FRAMES = 100
+
+# Side of the heatmap in pixels that nearest-neighbor upscaling aims for
+TARGET_HEATMAP_PIXELS = 720
+
+
+@lru_cache(maxsize=16)
+def colormap_lut(cmap: str = "YlGnBu", levels: int = 256) -> np.ndarray:
+    """
+    Samples a matplotlib colormap into a lookup table.
+
+    Args:
+        cmap: The name of the colormap.
+        levels: The number of colors in the table.
+
+    Returns:
+        np.ndarray: The levels x 3 table of uint8 RGB colors.
+    """
+    lut = matplotlib.colormaps[cmap](np.linspace(0, 1, levels))[:, :3]
+    lut = np.round(lut * 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def heatmap_grid(x: np.ndarray, y: np.ndarray, values: np.ndarray, shape: Optional[tuple] = None) -> np.ndarray:
+    """
+    Scatters values given per coordinate into a dense grid, indexed [y, x], cells without a value are 0.
+
+    Args:
+        x: The x coordinates.
+        y: The y coordinates.
+        values: The value of every coordinate.
+        shape: The (rows, columns) of the grid, by default just large enough for the coordinates.
+
+    Returns:
+        np.ndarray: The grid.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    if shape is None:
+        shape = (int(y.max(initial=-1)) + 1, int(x.max(initial=-1)) + 1)
+    grid = np.zeros(shape)
+    grid[y, x] = values
+    return grid
+
+
+def render_heatmap(
+    grid: np.ndarray,
+    title: str = "",
+    cmap: str = "YlGnBu",
+    origin: str = "upper",
+    scale: Optional[int] = None,
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    legend: bool = True,
+) -> np.ndarray:
+    """
+    Renders a grid as an RGB image by indexing a colormap lookup table, one block of pixels per cell.
+
+    Args:
+        grid: The values, indexed [row, column].
+        title: Text drawn above the heatmap.
+        cmap: The name of the colormap.
+        origin: 'upper' to draw row 0 at the top like sns.heatmap, 'lower' to draw it at the bottom.
+        scale: The side of every cell in pixels, by default the grid is upscaled to about TARGET_HEATMAP_PIXELS.
+        vmin: The value mapped to the first color, the minimum of the grid by default.
+        vmax: The value mapped to the last color, the maximum of the grid by default.
+        legend: Bool to set if a color bar with the value range is drawn to the right.
+
+    Returns:
+        np.ndarray: The height x width x 3 uint8 image.
+    """
+    grid = np.nan_to_num(np.asarray(grid, dtype=np.float64))
+    if origin == "lower":
+        grid = grid[::-1]
+    lut = colormap_lut(cmap)
+    vmin = grid.min(initial=0.0) if vmin is None else vmin
+    vmax = grid.max(initial=0.0) if vmax is None else vmax
+    span = vmax - vmin if vmax > vmin else 1.0
+    levels = np.clip((grid - vmin) * ((len(lut) - 1) / span), 0, len(lut) - 1).astype(np.intp)
+
+    if scale is None:
+        scale = max(1, TARGET_HEATMAP_PIXELS // max(grid.shape, default=1))
+    cells = lut[levels]
+    if scale > 1:
+        cells = np.repeat(np.repeat(cells, scale, axis=0), scale, axis=1)
+
+    margin = 24 if title else 4
+    legend_width = 70 if legend else 0
+    height, width = cells.shape[:2]
+    canvas = np.full((height + margin + 4, width + legend_width + 8, 3), 255, dtype=np.uint8)
+    canvas[margin:margin + height, 4:4 + width] = cells
+    if legend:
+        bar = lut[np.linspace(len(lut) - 1, 0, height).astype(np.intp)]
+        canvas[margin:margin + height, width + 12:width + 28] = bar[:, None]
+
+    image = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(image)
+    if title:
+        draw.text((4, 6), title, fill=(0, 0, 0))
+    if legend:
+        draw.text((width + 32, margin), f"{vmax:.4g}", fill=(0, 0, 0))
+        draw.text((width + 32, margin + height - 12), f"{vmin:.4g}", fill=(0, 0, 0))
+    return np.asarray(image)
+
+
+def encode_png_base64(image: np.ndarray) -> str:
+    """
+    Encodes an RGB image as a base64 PNG.
+
+    Args:
+        image: The height x width x 3 uint8 image.
+
+    Returns:
+        str: The base64-encoded PNG.
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="PNG", compress_level=1)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def fast_heatmap_base64(grid: np.ndarray, **kwargs) -> str:
+    """
+    Renders a grid with render_heatmap and returns it as a base64 PNG, see render_heatmap for the arguments.
+    """
+    return encode_png_base64(render_heatmap(grid, **kwargs))
+
+
+def figure_to_rgb(figure) -> np.ndarray:
+    """
+    Draws a matplotlib figure and returns its pixels, without encoding it to an image file.
+
+    Args:
+        figure: The figure, it is closed afterwards.
+
+    Returns:
+        np.ndarray: The height x width x 3 uint8 image.
+    """
+    figure.canvas.draw()
+    image = np.array(figure.canvas.buffer_rgba())[:, :, :3]
+    plt.close(figure)
+    return image
+
+
+def render_annotated_heatmap(grid: np.ndarray, title: str = "Heatmap of Occurrences") -> np.ndarray:
+    """
+    Renders a grid with sns.heatmap, annotating every cell with its value.
+
+    Args:
+        grid: The values, indexed [row, column], row 0 is drawn at the top.
+        title: The title of the figure.
+
+    Returns:
+        np.ndarray: The height x width x 3 uint8 image.
+    """
+    figure = plt.figure(figsize=(12, 12))
+    sns.heatmap(grid, annot=True, cmap="YlGnBu", fmt=".0f", cbar=True)
+    plt.title(title)
+    plt.xlabel("X Coordinates")
+    plt.ylabel("Y Coordinates")
+    return figure_to_rgb(figure)
+
+
+def render_heatmap_frame(grid: np.ndarray) -> np.ndarray:
+    """
+    Renders a grid as an animation frame, annotated with seaborn up to FAST_HEATMAP_CELLS cells and from the
+    colormap lookup table above.
+    """
+    if grid.size > FAST_HEATMAP_CELLS:
+        return render_heatmap(grid, title="Heatmap of Occurrences")
+    return render_annotated_heatmap(grid)
+
+
+def render_distribution_frame(frame: Tuple[int, np.ndarray]) -> np.ndarray:
+    """
+    Renders the distribution of a walk after a step as an animation frame, from the colormap lookup table.
+
+    Args:
+        frame: The step and the probability grid, indexed [y, x] and drawn with y increasing upwards.
+    """
+    step, grid = frame
+    return render_heatmap(grid, title=f"Step {step}", origin="lower", vmin=0.0)
+
+
+def start_frame_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Starts the pool of FRAME_WORKERS processes rendering animation frames, see start_process_pool.
+    """
+    return start_process_pool('frames', FRAME_WORKERS, ['render_utils'])
+
+
+def render_frames(grids: Iterable, render: Callable[..., np.ndarray] = render_heatmap_frame) -> Iterator[np.ndarray]:
+    """
+    Renders grids as animation frames, in order.
+
+    Long animations are spread over the pool of start_frame_pool if there is one, the frames are yielded as they
+    are done so that they can be encoded without holding all of them.
+
+    Args:
+        grids: The grids, one per frame.
+        render: The module-level function rendering a grid, so that it can be sent to the pool.
+
+    Returns:
+        Iterator[np.ndarray]: The RGB frames.
+    """
+    grids = list(grids)
+    pool = start_frame_pool() if len(grids) >= PARALLEL_FRAMES_MIN else None
+    if pool is None:
+        return map(render, grids)
+    return pool.map(render, grids, chunksize=max(1, len(grids) // (4 * FRAME_WORKERS)))
+
+
+def report_frames(frames: Iterable[np.ndarray], number_frames: int, progress: Optional[Callable[[float], None]]) -> Iterator[np.ndarray]:
+    """
+    Passes frames through, calling progress with the fraction of the frames that went through.
+    """
+    for index, frame in enumerate(frames):
+        if progress is not None:
+            progress((index + 1) / number_frames)
+        yield frame
+
+
+def encode_gif_base64(frames: Iterable[np.ndarray], duration: float = 0.5, palette_frames: int = 3) -> str:
+    """
+    Encodes RGB frames as an animated GIF with a palette shared by all frames.
+
+    The palette is computed once with a median cut over the first frames, every frame is then mapped to it
+    as soon as it arrives, so only the 8-bit frames are kept until the GIF is written.
+
+    Args:
+        frames: The RGB frames, all of the same size.
+        duration: Duration of each frame in seconds.
+        palette_frames: Number of frames, taken from the start, the palette is computed from.
+
+    Returns:
+        str: The base64-encoded GIF.
+    """
+    frames = iter(frames)
+    head = [Image.fromarray(frame) for _, frame in zip(range(palette_frames), frames)]
+    if not head:
+        raise ValueError("Cannot encode a GIF without frames")
+
+    width, height = head[0].size
+    sample = Image.new("RGB", (width, height * len(head)))
+    for index, image in enumerate(head):
+        sample.paste(image, (0, index * height))
+    palette = sample.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+
+    def to_palette(image: Image.Image) -> Image.Image:
+        return image.quantize(palette=palette, dither=Image.Dither.NONE)
+
+    indexed = [to_palette(image) for image in head]
+    indexed.extend(to_palette(Image.fromarray(frame)) for frame in frames)
+
+    buffer = io.BytesIO()
+    indexed[0].save(buffer, format="GIF", save_all=True, append_images=indexed[1:], duration=int(duration * 1000), loop=0)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
@@ -0,0 +1,84 @@
+import io
+from typing import Any, Dict, Optional, Union
+import numpy as np
+from flask import Response, request
+from validation_utils import InvalidParameter
+
+RAW_JSON_MEDIA_TYPE = 'application/vnd.randomwalk.raw+json'
+NPZ_MEDIA_TYPE = 'application/x-npz'
+
+# Values of the format query parameter and the raw format they select
+RAW_FORMATS = {'raw': 'json', 'json': 'json', 'npz': 'npz'}
+
+
+def requested_raw_format() -> Optional[str]:
+    """
+    Reads whether the client asked for the raw data instead of rendered images.
+
+    The format query parameter ('raw' or 'json' for JSON arrays, 'npz' for a NumPy archive) takes precedence over
+    the Accept header, where RAW_JSON_MEDIA_TYPE and NPZ_MEDIA_TYPE select the same formats.
+
+    Returns:
+        Optional[str]: 'json' or 'npz', None for the default response with base64 images.
+    """
+    query_format = request.args.get('format')
+    if query_format is not None:
+        if query_format not in RAW_FORMATS:
+            raise InvalidParameter(f"Unknown format '{query_format}', expected one of {sorted(RAW_FORMATS)}")
+        return RAW_FORMATS[query_format]
+
+    accepted = request.accept_mimetypes.best_match([RAW_JSON_MEDIA_TYPE, NPZ_MEDIA_TYPE])
+    if accepted and request.accept_mimetypes[accepted] > request.accept_mimetypes['application/json']:
+        return 'json' if accepted == RAW_JSON_MEDIA_TYPE else 'npz'
+    return None
+
+
+def _json_values(array: np.ndarray) -> list:
+    # JSON has no NaN or infinity, those values are sent as null
+    if array.dtype.kind == 'f' and not np.isfinite(array).all():
+        return np.where(np.isfinite(array), array, None).tolist()
+    return array.tolist()
+
+
+def encode_raw(raw_format: str, arrays: Dict[str, np.ndarray], **scalars: Any) -> Union[Dict[str, Any], bytes]:
+    """
+    Encodes the data of a route in raw format.
+
+    Args:
+        raw_format: 'json' for JSON with nested arrays (non-finite values as null), their dtypes and shapes, 'npz' for a compressed NumPy
+                    archive with one entry per array and per scalar.
+        arrays: The typed arrays of the response.
+        scalars: Parameters and summary values sent along the arrays, None values are left out of archives.
+
+    Returns:
+        Union[dict, bytes]: The dict that flask serializes to JSON, or the archive.
+    """
+    arrays = {name: np.asarray(array) for name, array in arrays.items()}
+    if raw_format == 'npz':
+        buffer = io.BytesIO()
+        entries = dict(arrays)
+        entries.update({name: np.asarray(value) for name, value in scalars.items() if value is not None})
+        np.savez_compressed(buffer, **entries)
+        return buffer.getvalue()
+
+    result = {name: _json_values(array) for name, array in arrays.items()}
+    result.update(scalars)
+    result['dtypes'] = {name: array.dtype.name for name, array in arrays.items()}
+    result['shapes'] = {name: list(array.shape) for name, array in arrays.items()}
+    return result
+
+
+def to_response(result: Union[Dict[str, Any], bytes]):
+    """
+    Turns the result of a route, a dict or an archive from encode_raw, into what the route returns.
+    """
+    if isinstance(result, bytes):
+        return Response(result, mimetype=NPZ_MEDIA_TYPE)
+    return result
+
+
+def raw_response(raw_format: str, arrays: Dict[str, np.ndarray], **scalars: Any):
+    """
+    Builds the response of a route in raw format, see encode_raw.
+    """
+    return to_response(encode_raw(raw_format, arrays, **scalars))
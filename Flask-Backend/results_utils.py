@@ -0,0 +1,98 @@
+from collections.abc import Mapping
+from typing import Iterator, Tuple
+import numpy as np
+
+
+class Histogram(Mapping):
+    """
+    A read-only mapping from measured outcomes to counts, like cirq.Result.histogram, backed by sorted arrays
+    so that it converts to arrays without going through a dict.
+
+    Args:
+        outcomes: The measured outcomes in increasing order.
+        counts: The number of times every outcome was measured.
+    """
+
+    def __init__(self, outcomes: np.ndarray, counts: np.ndarray):
+        self.outcomes = outcomes
+        self.counts = counts
+
+    def __getitem__(self, outcome: int) -> int:
+        index = np.searchsorted(self.outcomes, outcome)
+        if index == self.outcomes.size or self.outcomes[index] != outcome:
+            raise KeyError(outcome)
+        return int(self.counts[index])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.outcomes.tolist())
+
+    def __len__(self) -> int:
+        return self.outcomes.size
+
+    def __repr__(self) -> str:
+        return f"Histogram({dict(self)})"
+
+
+def histogram_arrays(histogram: Mapping) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts a measurement histogram into arrays sorted by outcome.
+
+    Args:
+        histogram: The number of times every outcome was measured, like cirq.Result.histogram.
+
+    Returns:
+        tuple: A tuple containing two elements:
+            - np.ndarray: The measured outcomes in increasing order.
+            - np.ndarray: The number of times every outcome was measured.
+    """
+    if isinstance(histogram, Histogram):
+        return histogram.outcomes, histogram.counts
+    outcomes = np.fromiter(histogram.keys(), dtype=np.int64, count=len(histogram))
+    counts = np.fromiter(histogram.values(), dtype=np.int64, count=len(histogram))
+    order = np.argsort(outcomes, kind='stable')
+    return outcomes[order], counts[order]
+
+
+def split_coordinates(outcomes: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Splits outcomes of the 2D walk into coordinates, the x qubits being the n most significant ones.
+
+    Args:
+        outcomes: The measured outcomes of the 2n position qubits.
+        n: Number of qubits per coordinate.
+
+    Returns:
+        tuple: The x and y coordinates.
+    """
+    return outcomes >> n, outcomes & ((1 << n) - 1)
+
+
+def coordinate_labels(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Formats coordinates as "x, y" labels, formatting every distinct value only once.
+
+    Args:
+        x: The x coordinates.
+        y: The y coordinates.
+
+    Returns:
+        np.ndarray: The labels as an object array.
+    """
+    size = int(max(x.max(initial=0), y.max(initial=0))) + 1
+    prefixes = np.array([f"{value}, " for value in range(size)], dtype=object)
+    suffixes = np.array([str(value) for value in range(size)], dtype=object)
+    return prefixes[x] + suffixes[y]
+
+
+def marginal_probabilities(state_vector: np.ndarray, number_coin_qubits: int) -> np.ndarray:
+    """
+    Computes the probability of every position of a state vector ordered with the coin qubits last.
+
+    Args:
+        state_vector: The state vector.
+        number_coin_qubits: Number of coin qubits.
+
+    Returns:
+        np.ndarray: The unnormalized probability of every position.
+    """
+    return np.square(np.abs(state_vector.reshape(-1, 2**number_coin_qubits))).sum(axis=1, dtype=np.float64)
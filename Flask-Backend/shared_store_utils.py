@@ -0,0 +1,366 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import threading
+import weakref
+from multiprocessing import util
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import numpy as np
+from scipy import sparse
+
+# Arrays start at multiples of this many bytes in the entry files, enough for any dtype
+ALIGNMENT = 64
+
+# An entry file starts with the length of its JSON header in this many little-endian bytes
+HEADER_LENGTH_BYTES = 8
+
+# Builds of different keys are serialized per stripe, keys are spread over this many build locks
+BUILD_LOCK_STRIPES = 16
+
+ENTRY_SUFFIX = '.arrays'
+ATTACHED_FILE = '.attached'
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _try_flock(fd: int, operation: int) -> bool:
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+class SharedArrayStore:
+    """
+    Shares read-only NumPy arrays between processes, e.g. the workers of a pre-fork server, through memory-mapped files.
+
+    An entry is a dict of named arrays under a hashable key, stored in one file of the directory. The first process
+    asking for a missing key builds it while the others wait, then every process maps the file read-only, so the
+    arrays are in memory once however many workers use them. On tmpfs (/dev/shm) the files never touch a disk.
+
+    References are counted with flock, which the kernel releases when a process dies: a process holds a shared lock
+    on an entry while it has arrays of the entry mapped, and on the store while it uses it. Entries no process
+    maps are evicted, least recently used first, when the store would outgrow max_bytes, and the last process to
+    leave the store removes it.
+
+    Args:
+        directory: The directory of the store, created on first use. Processes share the store by using the same one.
+        max_bytes: The total size of the entries, entries that do not fit are built but not shared.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked child shares the open file descriptions, and so the locks, of its parent. It drops its copies
+        # without unlocking them and attaches on its own, the arrays it inherited stay valid but uncounted
+        for fd in getattr(self, '_references', {}).values():
+            os.close(fd[0])
+        if getattr(self, '_attached_fd', None) is not None:
+            os.close(self._attached_fd)
+        # Reentrant, the garbage collector may release a reference while the lock is held
+        self._lock = threading.RLock()
+        self._attached_fd: Optional[int] = None
+        self._references: Dict[str, List[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _name(key: Hashable) -> str:
+        return hashlib.sha1(repr(key).encode()).hexdigest() + ENTRY_SUFFIX
+
+    def attach(self):
+        """
+        Starts using the store, which is kept until the last process using it closes it. Called on first use.
+        """
+        with self._lock:
+            self._attach()
+
+    def _attach(self):
+        while self._attached_fd is None:
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                fd = os.open(self._path(ATTACHED_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+            except FileNotFoundError:
+                continue
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            # The last process leaving removes the file after locking it, attach to the store it recreates then
+            if os.fstat(fd).st_nlink == 0:
+                os.close(fd)
+                continue
+            self._attached_fd = fd
+            # Run at exit by processes of multiprocessing as well, which skip the atexit handlers
+            util.Finalize(self, self.close, exitpriority=0)
+
+    def get(self, key: Hashable) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Maps the arrays of key, None on a miss.
+
+        Args:
+            key: The key of the entry, its repr identifies it across processes.
+
+        Returns:
+            dict: The read-only arrays, the entry stays referenced until all of them are garbage collected.
+        """
+        with self._lock:
+            self._attach()
+            arrays = self._open(self._name(key), key)
+            if arrays is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return arrays
+
+    def _open(self, name: str, key: Hashable) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(name)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # An evicting process unlinks the entry while holding the exclusive lock
+        if os.fstat(fd).st_nlink == 0:
+            os.close(fd)
+            return None
+        # The modification time orders the entries for eviction
+        os.utime(fd)
+
+        buffer = np.frombuffer(mmap.mmap(fd, 0, access=mmap.ACCESS_READ), dtype=np.uint8)
+        header_length = int.from_bytes(buffer[:HEADER_LENGTH_BYTES].tobytes(), 'little')
+        header = json.loads(buffer[HEADER_LENGTH_BYTES:HEADER_LENGTH_BYTES + header_length].tobytes())
+        if header['key'] != repr(key):
+            os.close(fd)
+            raise KeyError(f"The shared entry {name} holds {header['key']}, not {key!r}")
+
+        arrays = {}
+        data_start = _aligned(HEADER_LENGTH_BYTES + header_length)
+        for entry in header['arrays']:
+            dtype = np.dtype(entry['dtype'])
+            start = data_start + entry['offset']
+            nbytes = dtype.itemsize * int(np.prod(entry['shape'], dtype=np.int64))
+            arrays[entry['name']] = buffer[start:start + nbytes].view(dtype).reshape(entry['shape'])
+
+        # Keep one locked descriptor per referenced entry, counting the mappings it has in this process. The mmap
+        # holds a duplicate of the descriptor, so the lock is only released once the mapping is gone as well
+        if name in self._references:
+            os.close(fd)
+            self._references[name][1] += 1
+        else:
+            self._references[name] = [fd, 1]
+        weakref.finalize(buffer, self._release, name, os.getpid())
+        return arrays
+
+    def _release(self, name: str, pid: int):
+        with self._lock:
+            if pid != os.getpid() or name not in self._references:
+                return
+            self._references[name][1] -= 1
+            if self._references[name][1] == 0:
+                os.close(self._references.pop(name)[0])
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """
+        Maps the arrays of key, building and storing them on a miss. Only one process builds a key at a time.
+
+        Args:
+            key: The key of the entry.
+            builder: Builds the dict of arrays.
+
+        Returns:
+            dict: The read-only shared arrays, or the built ones if they do not fit into the store.
+        """
+        arrays = self.get(key)
+        if arrays is not None:
+            return arrays
+
+        name = self._name(key)
+        fd = os.open(self._path(f'.build-{int(name[:8], 16) % BUILD_LOCK_STRIPES}'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Another process may have built the key while this one waited
+            with self._lock:
+                arrays = self._open(name, key)
+            if arrays is not None:
+                return arrays
+            arrays = {array_name: np.ascontiguousarray(array) for array_name, array in builder().items()}
+            self.builds += 1
+            return self._write(name, key, arrays)
+        finally:
+            os.close(fd)
+
+    def _write(self, name: str, key: Hashable, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        # The offsets of the arrays count from the start of the data, the first aligned byte after the header
+        layout = []
+        offset = 0
+        for array_name, array in arrays.items():
+            offset = _aligned(offset)
+            layout.append({'name': array_name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+            offset += array.nbytes
+        header = json.dumps({'key': repr(key), 'arrays': layout}).encode()
+        data_start = _aligned(HEADER_LENGTH_BYTES + len(header))
+
+        with self._lock:
+            if not self._make_room(data_start + offset):
+                return arrays
+            temporary_path = self._path(f'{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                with open(temporary_path, 'wb') as file:
+                    file.write(len(header).to_bytes(HEADER_LENGTH_BYTES, 'little'))
+                    file.write(header)
+                    for entry, array in zip(layout, arrays.values()):
+                        file.seek(data_start + entry['offset'])
+                        file.write(array.data if array.size else b'')
+                    # Pad the file to its full size, in case the last arrays are empty
+                    file.truncate(data_start + offset)
+                os.replace(temporary_path, self._path(name))
+            finally:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+            return self._open(name, key)
+
+    def _entries(self) -> List[os.DirEntry]:
+        try:
+            return [entry for entry in os.scandir(self.directory) if entry.name.endswith(ENTRY_SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    def _evict(self, path: str) -> bool:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return True
+        try:
+            # Any process mapping the entry holds a shared lock on it
+            if not _try_flock(fd, fcntl.LOCK_EX):
+                return False
+            if os.fstat(fd).st_nlink > 0:
+                os.remove(path)
+                self.evictions += 1
+            return True
+        finally:
+            os.close(fd)
+
+    def _make_room(self, nbytes: int) -> bool:
+        if nbytes > self.max_bytes:
+            return False
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._entries())
+        current_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if current_bytes + nbytes <= self.max_bytes:
+                break
+            if self._evict(path):
+                current_bytes -= size
+        return current_bytes + nbytes <= self.max_bytes
+
+    def close(self):
+        """
+        Stops using the store, dropping the references of this process. The last process to close it removes it.
+        """
+        with self._lock:
+            if self._attached_fd is None:
+                return
+            for fd, _ in self._references.values():
+                os.close(fd)
+            self._references.clear()
+            os.close(self._attached_fd)
+            self._attached_fd = None
+
+            fd = os.open(self._path(ATTACHED_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if not _try_flock(fd, fcntl.LOCK_EX):
+                    return
+                # No other process uses the store, the mappings of this one stay valid after the files are removed
+                for entry in os.scandir(self.directory):
+                    if entry.name != ATTACHED_FILE:
+                        os.remove(entry.path)
+                os.remove(self._path(ATTACHED_FILE))
+                try:
+                    os.rmdir(self.directory)
+                except OSError:
+                    pass
+            finally:
+                os.close(fd)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries()
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'entries': len(entries),
+                'current_bytes': sum(entry.stat().st_size for entry in entries),
+                'max_bytes': self.max_bytes,
+                'referenced_entries': len(self._references),
+                'hits': self.hits,
+                'misses': self.misses,
+                'builds': self.builds,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+
+def shared_arrays(key: Hashable, builder: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    Returns the arrays of key from SHARED_STORE, built once for all the processes sharing it, or from builder without one.
+
+    Args:
+        key: The key of the arrays, (kind, parameters...).
+        builder: Builds the dict of arrays.
+
+    Returns:
+        dict: The arrays, read-only if they are shared.
+    """
+    if SHARED_STORE is None:
+        return builder()
+    return SHARED_STORE.get_or_build(key, builder)
+
+
+def csr_arrays(matrix: sparse.spmatrix, prefix: str = '') -> Dict[str, np.ndarray]:
+    """
+    Splits a sparse matrix into the arrays of its CSR form, named with the prefix, to store them with shared_arrays.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    return {prefix + 'data': matrix.data, prefix + 'indices': matrix.indices, prefix + 'indptr': matrix.indptr,
+            prefix + 'shape': np.array(matrix.shape)}
+
+
+def csr_from_arrays(arrays: Dict[str, np.ndarray], prefix: str = '') -> sparse.csr_matrix:
+    """
+    Puts the arrays of csr_arrays back together, without copying them.
+    """
+    return sparse.csr_matrix((arrays[prefix + 'data'], arrays[prefix + 'indices'], arrays[prefix + 'indptr']),
+                             shape=tuple(arrays[prefix + 'shape'].tolist()))
+
+
+def shared_csr_matrix(key: Hashable, builder: Callable[[], sparse.spmatrix]) -> sparse.csr_matrix:
+    """
+    Returns a sparse matrix whose arrays come from shared_arrays.
+
+    Args:
+        key: The key of the matrix, (kind, parameters...).
+        builder: Builds the matrix.
+
+    Returns:
+        sparse.csr_matrix: The matrix.
+    """
+    return csr_from_arrays(shared_arrays(key, lambda: csr_arrays(builder())))
+
+
+# Set RANDOMWALK_SHARED_DIR (e.g. to a directory in /dev/shm) to share the large artifacts between worker processes
+SHARED_STORE = (
+    SharedArrayStore(os.environ['RANDOMWALK_SHARED_DIR'], int(os.environ.get('RANDOMWALK_SHARED_BYTES', 2**30)))
+    if 'RANDOMWALK_SHARED_DIR' in os.environ else None
+)
@@ -0,0 +1,196 @@
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple, Union
+import numpy as np
+from scipy import sparse
+from scipy.sparse import linalg as sparse_linalg
+from classical_utils import grid_transition_matrix_sparse
+from distribution_utils import TransitionModel, convolution_power, lattice_kernel
+from lattice_utils import Lattice, ring_lattice, torus_lattice
+from markov_utils import SparseMarkovChain
+
+# Largest number of states for which the exact mixing time is searched for, larger chains only get bounds
+EXACT_MIXING_LIMIT = 1 << 18
+
+
+class SpectralSummary(NamedTuple):
+    ergodic: bool
+    spectral_gap: float
+    relaxation_time: float
+    mixing_time: Optional[int]
+    mixing_time_bounds: Tuple[float, float]
+
+
+def lattice_eigenvalues(lattice: Lattice) -> np.ndarray:
+    """
+    Evaluates the eigenvalues of a periodic lattice walk in closed form.
+
+    The Fourier modes of the lattice are the eigenvectors, the eigenvalue of the mode with wave vector theta
+    is the sum of weight * exp(-i theta . offset) over the moves.
+
+    Args:
+        lattice: The periodic lattice walk.
+
+    Returns:
+        np.ndarray: The complex eigenvalues in the lattice shape, the stationary mode first.
+    """
+    eigenvalues = np.zeros(lattice.shape, dtype=complex)
+    frequencies = np.meshgrid(*[2 * np.pi * np.arange(length) / length for length in lattice.shape], indexing='ij', sparse=True)
+    for weight, offset in zip(lattice.weights, lattice.stencil):
+        eigenvalues += weight * np.exp(-1j * sum(theta * delta for theta, delta in zip(frequencies, offset)))
+    return eigenvalues
+
+
+def mixing_time_bounds(relaxation_time: float, pi_min: float, epsilon: float = 0.25) -> Tuple[float, float]:
+    """
+    Bounds the mixing time of a reversible chain by its relaxation time (Levin, Peres and Wilmer, Theorems 12.4 and 12.5).
+
+    Args:
+        relaxation_time: The inverse of the absolute spectral gap.
+        pi_min: The smallest stationary probability.
+        epsilon: The total variation distance to reach.
+
+    Returns:
+        Tuple[float, float]: The lower and upper bound.
+    """
+    lower = (relaxation_time - 1) * np.log(1 / (2 * epsilon))
+    upper = relaxation_time * np.log(1 / (epsilon * pi_min))
+    return max(lower, 0.0), upper
+
+
+def lattice_mixing_time(lattice: Lattice, epsilon: float = 0.25, limit: Optional[int] = None) -> Optional[int]:
+    """
+    Finds the exact total variation mixing time of an ergodic periodic lattice walk.
+
+    Lattice walks look the same from every state, so the distance from the worst state is the distance from state 0,
+    which does not increase over time. The first step below epsilon is found by doubling and bisection, evaluating
+    the distribution at a given step with a single FFT power.
+
+    Args:
+        lattice: The periodic lattice walk.
+        epsilon: The total variation distance to reach.
+        limit: The largest mixing time to search for.
+
+    Returns:
+        Optional[int]: The mixing time, None if it exceeds limit.
+    """
+    kernel = lattice_kernel(lattice)
+    start = np.zeros(lattice.shape)
+    start[(0,) * len(lattice.shape)] = 1.0
+
+    def distance(steps: int) -> float:
+        return 0.5 * np.abs(convolution_power(kernel, start, steps) - 1 / lattice.size).sum()
+
+    upper = 1
+    while distance(upper) > epsilon:
+        if limit is not None and upper > limit:
+            return None
+        upper *= 2
+    lower = upper // 2
+    while upper - lower > 1:
+        middle = (lower + upper) // 2
+        if distance(middle) > epsilon:
+            lower = middle
+        else:
+            upper = middle
+    return upper
+
+
+def chain_spectral_gap(model: TransitionModel, tolerance: float = 1e-8) -> float:
+    """
+    Computes the absolute spectral gap of a chain with sparse eigensolvers.
+
+    Reversible chains are symmetrized with their stationary distribution and handed to Lanczos (eigsh),
+    other chains to Arnoldi (eigs).
+
+    Args:
+        model: A transition matrix or a SparseMarkovChain.
+        tolerance: The tolerance of the eigensolver.
+
+    Returns:
+        float: One minus the largest modulus among the non-trivial eigenvalues.
+    """
+    chain = model if isinstance(model, SparseMarkovChain) else SparseMarkovChain(model)
+    if chain.size <= 3:
+        eigenvalues = np.linalg.eigvals(chain.p.toarray() + chain.teleport_prob / chain.size)
+        return max(1 - np.sort(np.abs(eigenvalues))[-2], 0.0)
+
+    pi = chain.stationary_distribution()
+    flows = sparse.diags(pi) @ chain.p
+    if chain.teleport_prob == 0 and abs(flows - flows.T).max() < tolerance:
+        root_pi = np.sqrt(pi)
+        symmetric = sparse.diags(root_pi) @ chain.p @ sparse.diags(1 / root_pi)
+        largest = sparse_linalg.eigsh(symmetric, k=2, which='LA', tol=tolerance, return_eigenvectors=False)
+        smallest = sparse_linalg.eigsh(symmetric, k=1, which='SA', tol=tolerance, return_eigenvectors=False)
+        return max(1 - max(np.sort(largest)[0], abs(smallest[0])), 0.0)
+
+    operator = sparse_linalg.LinearOperator(
+        (chain.size, chain.size),
+        matvec=lambda x: chain.p @ x + chain.teleport_prob * np.sum(x) / chain.size,
+        dtype=float,
+    )
+    eigenvalues = sparse_linalg.eigs(operator, k=2, which='LM', tol=tolerance, return_eigenvectors=False)
+    return max(1 - np.sort(np.abs(eigenvalues))[0], 0.0)
+
+
+@lru_cache(maxsize=128)
+def spectral_analysis(topology: str, size: Tuple[int, ...]) -> SpectralSummary:
+    """
+    Computes the spectral gap, relaxation time and mixing time of one of the walks served by the backend.
+
+    Results are memoized per (topology, size). Tori and rings get closed form eigenvalues and, up to
+    EXACT_MIXING_LIMIT states, the exact mixing time, the teleporting grid goes through chain_spectral_gap
+    (its bounds are only indicative, the teleporting grid is not reversible).
+    The mixing time is the first step where the total variation distance to the stationary distribution
+    is at most 1/4 from every start state.
+
+    Args:
+        topology: 'torus' with size (m, n), 'ring' with size (n_states,) or 'grid' with size (m, n).
+        size: The grid size or number of states.
+
+    Returns:
+        SpectralSummary: The summary, the mixing time is None if it was not computed or the chain is not ergodic.
+    """
+    if topology == 'grid':
+        chain = SparseMarkovChain(grid_transition_matrix_sparse(size), teleport_prob=0.15)
+        gap = chain_spectral_gap(chain)
+        relaxation_time = 1 / gap if gap > 0 else np.inf
+        bounds = mixing_time_bounds(relaxation_time, chain.stationary_distribution().min())
+        return SpectralSummary(gap > 0, gap, relaxation_time, None, bounds)
+
+    if topology == 'torus':
+        lattice = torus_lattice(size)
+    elif topology == 'ring':
+        lattice = ring_lattice(size[0])
+    else:
+        raise ValueError(f"Unknown topology '{topology}'")
+
+    moduli = np.abs(lattice_eigenvalues(lattice)).ravel()
+    gap = 1 - np.max(moduli[1:], initial=0.0)
+    if gap <= 1e-12:
+        return SpectralSummary(False, 0.0, np.inf, None, (np.inf, np.inf))
+
+    relaxation_time = 1 / gap
+    bounds = mixing_time_bounds(relaxation_time, 1 / lattice.size)
+    mixing_time = None
+    if lattice.size <= EXACT_MIXING_LIMIT:
+        mixing_time = lattice_mixing_time(lattice, limit=int(np.ceil(bounds[1])) + 1)
+    return SpectralSummary(True, gap, relaxation_time, mixing_time, bounds)
+
+
+def assign_mixing_time(grid_size: Tuple[int, int]) -> Union[int, str]:
+    """
+    Reports the mixing time of the walk on the torus, or bounds on it for grids too large for the exact search.
+
+    Args:
+        grid_size: A tuple representing the size of the torus grid (m, n).
+
+    Returns:
+        Union[int, str]: The mixing time, or a description of why it is not known exactly.
+    """
+    summary = spectral_analysis('torus', tuple(grid_size))
+    if not summary.ergodic:
+        return "The Markov chain is not ergodic"
+    if summary.mixing_time is None:
+        lower, upper = summary.mixing_time_bounds
+        return f"between {int(np.floor(lower))} and {int(np.ceil(upper))}"
+    return summary.mixing_time
@@ -0,0 +1,161 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from accumulator_utils import WalkAccumulator
+from classical_utils import load_walk_artifacts
+from distribution_utils import exact_distribution
+from lattice_utils import Lattice
+from spectral_utils import spectral_analysis
+from trajectory_utils import encode_coordinates
+from validation_utils import InvalidParameter
+
+# Columns of the sweep table, in order
+SWEEP_COLUMNS = ('grid_x', 'grid_y', 'n', 'target_x', 'target_y', 'n_sims', 'hit_fraction', 'mean_hitting_time',
+                 'empirical_tv', 'exact_tv', 'spectral_gap', 'mixing_time')
+
+
+class SweepWalks(NamedTuple):
+    occupancy: Dict[int, np.ndarray]
+    first_hits: np.ndarray
+
+
+def sweep_walks(
+    lattice: Lattice,
+    steps: Sequence[int],
+    n_sims: int,
+    target_indexes: Sequence[int],
+    start_index: int = 0,
+    rng: Optional[np.random.Generator] = None,
+    progress: Optional[Callable[[float], None]] = None,
+) -> SweepWalks:
+    """
+    Walks n_sims walkers once for the largest number of steps, collecting the results of every shorter walk and target.
+
+    The walks of fewer steps are the prefixes of the longest ones, so their final occupancy is a snapshot of it.
+    Walkers are not absorbed, the first passage through every target is recorded on the way with a lookup
+    from state to target, so all targets cost one pass over the walkers per step.
+
+    Args:
+        lattice: The walk.
+        steps: The numbers of steps to report on.
+        n_sims: The number of walkers to simulate.
+        target_indexes: The indexes of the target states.
+        start_index: The index of the state every walker starts from.
+        rng: The random generator to draw the moves from.
+        progress: Called with the fraction of the steps done.
+
+    Returns:
+        SweepWalks: The occupancy after every number of steps and the (targets, max steps + 1) counts of walkers
+                    first reaching every target at every step.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    max_steps = max(steps)
+    accumulator = WalkAccumulator(lattice.size, snapshot_steps=steps)
+
+    lookup = np.full(lattice.size, -1, dtype=np.int64)
+    lookup[np.asarray(target_indexes, dtype=np.int64)] = np.arange(len(target_indexes))
+    reached = np.zeros((len(target_indexes), n_sims), dtype=bool)
+    first_hits = np.zeros((len(target_indexes), max_steps + 1), dtype=np.int64)
+
+    positions = np.full(n_sims, start_index, dtype=np.int64)
+    for step in range(max_steps + 1):
+        accumulator.add_snapshot(step, positions)
+        if len(target_indexes):
+            walkers = np.flatnonzero(lookup[positions] >= 0)
+            slots = lookup[positions[walkers]]
+            first = ~reached[slots, walkers]
+            reached[slots[first], walkers[first]] = True
+            first_hits[:, step] = np.bincount(slots[first], minlength=len(target_indexes))
+        if step < max_steps:
+            positions = lattice.next_indices(positions, rng)
+        if progress is not None:
+            progress((step + 1) / (max_steps + 1))
+    return SweepWalks(accumulator.snapshots, first_hits)
+
+
+def sweep_table(
+    grid_sizes: Sequence[Tuple[int, int]],
+    steps: Sequence[int],
+    n_sims: int,
+    targets: Sequence[Tuple[int, int]] = (),
+    seed: Optional[int] = None,
+    progress: Optional[Callable[[float], None]] = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Runs a parameter sweep of torus walks from state 0, the results of /multiple_runs and /process for every point.
+
+    Every grid size is set up and walked once, the step counts reuse the prefixes of the longest walks and the
+    targets are all checked in the same pass. Hitting times follow walk_step_by_step: a target is hit within n
+    steps if it is visited before the last step.
+
+    Args:
+        grid_sizes: The (m, n) sizes of the torus grids.
+        steps: The numbers of steps of the walks.
+        n_sims: The number of walkers per grid size.
+        targets: The (x, y) target states, every grid gets those that lie on it.
+        seed: The seed of the SeedSequence the grids draw their walks from, fresh entropy if None.
+        progress: Called with the fraction of the sweep done.
+
+    Returns:
+        tuple: The rows of the table as dicts with the SWEEP_COLUMNS, one per grid, steps and target (or one per grid
+               and steps without targets), and the entropy of the SeedSequence, that reproduces the sweep.
+    """
+    steps = sorted(set(int(n) for n in steps))
+    grid_sizes = list(dict.fromkeys(tuple(int(length) for length in grid_size) for grid_size in grid_sizes))
+    if not steps or not grid_sizes or min(steps) < 0:
+        raise InvalidParameter("A sweep needs at least one grid size and non-negative step counts")
+
+    seed_sequence = np.random.SeedSequence(None if seed is None else int(seed))
+    rows = []
+    for grid_index, (grid_size, child) in enumerate(zip(grid_sizes, seed_sequence.spawn(len(grid_sizes)))):
+        artifacts = load_walk_artifacts('torus', grid_size)
+        lattice = artifacts.lattice
+        spectrum = spectral_analysis('torus', grid_size)
+
+        # Targets outside of the grid are skipped, targets naming the same state are walked once
+        grid_targets = [(x, y) for x, y in dict.fromkeys(map(tuple, targets)) if 0 <= x < grid_size[0] and 0 <= y < grid_size[1]]
+        target_indexes = [int(encode_coordinates(x, y, grid_size)) for x, y in grid_targets]
+        unique_indexes = list(dict.fromkeys(target_indexes))
+
+        grid_progress = None
+        if progress is not None:
+            grid_progress = lambda fraction, done=grid_index: progress((done + fraction) / len(grid_sizes))
+        walks = sweep_walks(lattice, steps, n_sims, unique_indexes, 0, np.random.default_rng(child), grid_progress)
+        cumulative_hits = np.cumsum(walks.first_hits, axis=1)
+        cumulative_times = np.cumsum(walks.first_hits * np.arange(walks.first_hits.shape[1]), axis=1)
+
+        start = np.zeros(lattice.size)
+        start[0] = 1.0
+        for n in steps:
+            empirical_tv = 0.5 * np.abs(walks.occupancy[n] / n_sims - 1 / lattice.size).sum()
+            exact_tv = 0.5 * np.abs(exact_distribution(lattice, start, n) - 1 / lattice.size).sum()
+            row = {'grid_x': grid_size[0], 'grid_y': grid_size[1], 'n': n, 'target_x': None, 'target_y': None,
+                   'n_sims': n_sims, 'hit_fraction': None, 'mean_hitting_time': None, 'empirical_tv': float(empirical_tv),
+                   'exact_tv': float(exact_tv), 'spectral_gap': float(spectrum.spectral_gap), 'mixing_time': spectrum.mixing_time}
+            if not grid_targets:
+                rows.append(row)
+            for (x, y), target_index in zip(grid_targets, target_indexes):
+                slot = unique_indexes.index(target_index)
+                hits = int(cumulative_hits[slot, n - 1]) if n > 0 else 0
+                mean = float(cumulative_times[slot, n - 1] / hits) if hits else None
+                rows.append(dict(row, target_x=x, target_y=y, hit_fraction=hits / n_sims, mean_hitting_time=mean))
+    return rows, seed_sequence.entropy
+
+
+def table_columns(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Turns the rows of a sweep table into one array per column, missing values become NaN (-1 for the integer columns).
+
+    Args:
+        rows: The rows from sweep_table.
+
+    Returns:
+        dict: The column arrays, in SWEEP_COLUMNS order.
+    """
+    columns = {}
+    for column in SWEEP_COLUMNS:
+        values = [row[column] for row in rows]
+        if column in ('grid_x', 'grid_y', 'n', 'target_x', 'target_y', 'n_sims', 'mixing_time'):
+            columns[column] = np.array([-1 if value is None else value for value in values], dtype=np.int64)
+        else:
+            columns[column] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return columns
@@ -0,0 +1,191 @@
+from typing import Any, Dict, Optional, Union
+import numpy as np
+from classical_utils import (
+    analyze_state_counts,
+    bar_plot_combined_x_y_occurrences,
+    check_drawable_grid,
+    create_base64_gif_from_distributions,
+    distribution_grids,
+    heatmap_occurrences,
+    load_walk_artifacts,
+    tv_distance_plot,
+)
+from distribution_utils import occupancy_series
+from job_utils import ProgressReporter, stage
+from monte_carlo_utils import sharded_simulation
+from quantum_utils import (
+    check_engine,
+    combined_bar_plot_quantum_2d,
+    convert_2d_results_to_coordinates,
+    create_base64_gif_from_heatmaps,
+    evolve_2d_walk,
+    generate_heatmap_grids,
+    heatmap_quantum_2d,
+    norm_drift,
+    position_probabilities,
+    precision_dtype,
+)
+from render_utils import MAX_ANIMATION_FRAMES, heatmap_grid
+from response_utils import encode_raw
+from sweep_utils import SWEEP_COLUMNS, sweep_table, table_columns
+from trajectory_utils import decode_states
+from validation_utils import InvalidParameter
+
+# The bodies of the routes that can also run as jobs. They take the JSON body of the request and the raw format it
+# asked for, and return a dict or an npz archive, so that their results can be sent back from worker processes.
+
+
+def check_multiple_runs_parameters(data: Dict[str, Any]):
+    """
+    Raises InvalidParameter for the parameters multiple_runs_task cannot run with, also checked before a job is queued.
+    """
+    check_drawable_grid((data.get('grid_x'), data.get('grid_y')))
+
+
+def multiple_runs_task(data: Dict[str, Any], raw_format: Optional[str] = None, progress: Optional[ProgressReporter] = None) -> Union[Dict[str, Any], bytes]:
+    n = data.get('n')
+    grid_size = (data.get('grid_x'), data.get('grid_y'))
+    target_state = (data.get('target_x'), data.get('target_y'))
+    n_sims = data.get('n_sims')
+    check_multiple_runs_parameters(data)
+
+    artifacts = load_walk_artifacts('torus', grid_size)
+
+    # Simulate multiple walks, only the histogram of their final states is kept
+    summary = sharded_simulation(artifacts.lattice, n, n_sims, seed=data.get('seed'), progress=stage(progress, 0.0, 0.7))
+
+    if raw_format:
+        # Indexed [y, x], like the heatmap, straight from the histogram so the raw format does not need pandas
+        visited = np.flatnonzero(summary.occupancy)
+        x_coords, y_coords = decode_states(visited, grid_size)
+        occupancy = heatmap_grid(x_coords, y_coords, summary.occupancy[visited], (grid_size[1], grid_size[0]))
+        return encode_raw(raw_format, {'occupancy': occupancy.astype(np.int32)}, n=n, grid_x=grid_size[0], grid_y=grid_size[1], n_sims=n_sims,
+                          seed=str(summary.seed))
+
+    # Analyze walk data
+    df_state_analysis = analyze_state_counts(summary.occupancy, grid_size)
+
+    # Create a plots of occurrences
+    #bar_plot_base64 = bar_plot_occurrences(df_state_analysis)
+    bar_plot_base64 = bar_plot_combined_x_y_occurrences(df_state_analysis)
+    heatmap_base64 = heatmap_occurrences(df_state_analysis)
+
+    result = {"bar_plot": bar_plot_base64, "heat_map": heatmap_base64, "seed": str(summary.seed)}
+    return result
+
+
+def check_quantum_2d_parameters(data: Dict[str, Any]):
+    """
+    Raises InvalidParameter for the parameters quantum_2d_task cannot run with, also checked before a job is queued.
+    """
+    iterator = data.get('iterator')
+    if not isinstance(iterator, int) or iterator < 1:
+        raise InvalidParameter(f"The number of steps must be at least 1, got {iterator}")
+    check_engine(data.get('engine', 'cirq'))
+    precision_dtype(data.get('precision', 'complex128'))
+
+
+def quantum_2d_task(data: Dict[str, Any], raw_format: Optional[str] = None, progress: Optional[ProgressReporter] = None) -> Union[Dict[str, Any], bytes]:
+    number_qubits = data.get('number_qubits')
+    iterator = data.get('iterator')
+    sample_number = data.get('sample_number')
+    engine = data.get('engine', 'cirq')
+    check_quantum_2d_parameters(data)
+    dtype = precision_dtype(data.get('precision', 'complex128'))
+
+    # One pass over the steps yields the GIF frames, the last one is the final result
+    probabilities, histograms, state_vector = evolve_2d_walk(number_qubits, iterator, sample_number, engine=engine, dtype=dtype,
+                                                             progress=stage(progress, 0.0, 0.4))
+    list_for_gif_heatmap = [convert_2d_results_to_coordinates(histogram, number_qubits, sample_number) for histogram in histograms]
+
+    data_final = list_for_gif_heatmap[-1]
+
+    if raw_format:
+        # Grids are indexed [y, x], the probabilities are the exact ones of the final state
+        frames = np.array(generate_heatmap_grids(list_for_gif_heatmap, number_qubits), dtype=np.int32)
+        grid_size = 2**number_qubits
+        probability = position_probabilities(state_vector, 2).reshape(grid_size, grid_size).T
+        return encode_raw(raw_format, {'occupancy': frames[-1], 'frames': frames, 'probability': probability},
+                          number_qubits=number_qubits, iterator=iterator, sample_number=sample_number, norm_drift=norm_drift(state_vector))
+
+    #barplot_base64 = bar_quantum_2d(data_final)
+    barplot_base64 = combined_bar_plot_quantum_2d(data_final)
+
+    heatmap_base64 = heatmap_quantum_2d(data_final)
+
+    heatmap_gif_base64 = create_base64_gif_from_heatmaps(list_for_gif_heatmap, number_qubits, progress=stage(progress, 0.45, 1.0))
+
+    # Convert the x and y arrays to lists and return as a JSON object
+    result = {'bar_plot_q_2d': barplot_base64, 'heatmap_q_2d': heatmap_base64, 'heatmap_q_2d_gif': heatmap_gif_base64, 'norm_drift': norm_drift(state_vector)}
+    return result
+
+
+def check_classical_animation_parameters(data: Dict[str, Any]):
+    """
+    Raises InvalidParameter for the parameters classical_animation_task cannot run with, also checked before a job
+    is queued.
+    """
+    stride = data.get('stride')
+    if stride is not None and stride < 1:
+        raise InvalidParameter(f"The stride must be at least 1, got {stride}")
+    if data.get('n_states') is None:
+        check_drawable_grid((data.get('grid_x'), data.get('grid_y')))
+
+
+def classical_animation_task(data: Dict[str, Any], raw_format: Optional[str] = None, progress: Optional[ProgressReporter] = None) -> Union[Dict[str, Any], bytes]:
+    n = data.get('n')
+    n_states = data.get('n_states')
+    check_classical_animation_parameters(data)
+    stride = data.get('stride')
+    # Strides are raised so that at most MAX_ANIMATION_FRAMES frames are recorded and rendered
+    stride = max(stride or 1, -(-n // MAX_ANIMATION_FRAMES))
+
+    # Walks start where walk_step_by_step and walk_step_by_step_1d start them
+    if n_states is not None:
+        grid_size = (n_states,)
+        artifacts = load_walk_artifacts('ring', grid_size)
+        start = n_states // 2
+    else:
+        grid_size = (data.get('grid_x'), data.get('grid_y'))
+        artifacts = load_walk_artifacts('torus', grid_size)
+        start = 0
+
+    initial_dist = np.zeros(artifacts.lattice.size)
+    initial_dist[start] = 1.0
+    series = occupancy_series(artifacts.lattice, initial_dist, n, stride, progress=stage(progress, 0.0, 0.3))
+    grids = distribution_grids(series.distributions, grid_size)
+
+    if raw_format:
+        return encode_raw(raw_format, {'frame_steps': series.steps, 'frames': grids, 'tv_to_uniform': series.tv_to_uniform},
+                          n=n, stride=stride, start=start)
+
+    heatmap_gif_base64 = create_base64_gif_from_distributions(series.steps, grids, progress=stage(progress, 0.35, 1.0))
+    tv_plot_base64 = tv_distance_plot(series.tv_to_uniform)
+
+    result = {'heatmap_gif': heatmap_gif_base64, 'tv_plot': tv_plot_base64, 'tv_to_uniform': series.tv_to_uniform.tolist(),
+              'frame_steps': series.steps.tolist(), 'stride': stride}
+    return result
+
+
+def sweep_task(data: Dict[str, Any], raw_format: Optional[str] = None, progress: Optional[ProgressReporter] = None) -> Union[Dict[str, Any], bytes]:
+    grid_sizes = data.get('grid_sizes') or [(data.get('grid_x'), data.get('grid_y'))]
+    steps = data.get('steps') or [data.get('n')]
+    targets = data.get('targets', [])
+    n_sims = data.get('n_sims')
+
+    rows, seed = sweep_table(grid_sizes, steps, n_sims, targets, data.get('seed'), progress=stage(progress, 0.0, 1.0))
+
+    if raw_format:
+        return encode_raw(raw_format, table_columns(rows), seed=str(seed))
+
+    result = {'columns': list(SWEEP_COLUMNS), 'results': rows, 'seed': str(seed)}
+    return result
+
+
+# The routes that can be submitted to /jobs/<kind>
+JOB_TASKS = {'multiple_runs': multiple_runs_task, 'quantum_2d': quantum_2d_task, 'classical_animation': classical_animation_task,
+             'sweep': sweep_task}
+
+# Checks run on the parameters of a job before it is queued, so that invalid ones are answered with 400 and not a failed job
+JOB_PARAMETER_CHECKS = {'multiple_runs': check_multiple_runs_parameters, 'quantum_2d': check_quantum_2d_parameters,
+                        'classical_animation': check_classical_animation_parameters}
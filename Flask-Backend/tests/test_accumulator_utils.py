@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from accumulator_utils import WalkAccumulator
+
+
+def assert_same_accumulators(first: WalkAccumulator, second: WalkAccumulator):
+    assert (first.n_states, first.mode, first.walkers) == (second.n_states, second.mode, second.walkers)
+    np.testing.assert_array_equal(first.occupancy, second.occupancy)
+    np.testing.assert_array_equal(first.hitting_time_counts, second.hitting_time_counts)
+    assert sorted(first.snapshots) == sorted(second.snapshots)
+    for step in first.snapshots:
+        np.testing.assert_array_equal(first.snapshots[step], second.snapshots[step])
+
+
+def test_merge_adds_the_counts_of_both_batches():
+    walks = np.array([[0, 1, 2, 3], [0, 3, 3, 3], [0, 1, 0, 1]])
+    hitting_times = np.array([3, 1, -1])
+    whole = WalkAccumulator(4, 'all_steps', snapshot_steps=(1, 3))
+    whole.add_walks(walks, hitting_times)
+
+    first = WalkAccumulator(4, 'all_steps', snapshot_steps=(1, 3))
+    first.add_walks(walks[:1], hitting_times[:1])
+    second = WalkAccumulator(4, 'all_steps', snapshot_steps=(1, 3))
+    second.add_walks(walks[1:], hitting_times[1:])
+
+    assert first.merge(second) is first
+    assert_same_accumulators(first, whole)
+    assert first.hitting_time_summary() == whole.hitting_time_summary()
+    np.testing.assert_array_equal(first.hitting_time_counts, [0, 1, 0, 1])
+
+
+def test_merge_into_an_empty_accumulator_copies_the_snapshots():
+    batch = WalkAccumulator(3, snapshot_steps=(1,))
+    batch.add_walks(np.array([[0, 1], [0, 2]]), np.array([-1, -1]))
+    merged = WalkAccumulator(3, snapshot_steps=(1,)).merge(batch)
+    merged.merge(batch)
+    np.testing.assert_array_equal(batch.snapshots[1], [0, 1, 1])
+    np.testing.assert_array_equal(merged.snapshots[1], [0, 2, 2])
+
+
+@pytest.mark.parametrize('other', [WalkAccumulator(5), WalkAccumulator(4, 'all_steps')])
+def test_merge_rejects_other_walks_and_modes(other):
+    with pytest.raises(ValueError):
+        WalkAccumulator(4).merge(other)
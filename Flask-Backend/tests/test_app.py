@@ -0,0 +1,47 @@
+import pytest
+import app as backend
+
+
+@pytest.fixture
+def client():
+    return backend.app.test_client()
+
+
+@pytest.mark.parametrize('route, body', [
+    ('/quantum', {'number_qubits': 2, 'iterator': 2, 'sample_number': 10, 'precision': 'complex32'}),
+    ('/quantum', {'number_qubits': 2, 'iterator': 2, 'sample_number': 10, 'engine': 'bogus'}),
+    ('/classical_animation', {'n': 10, 'grid_x': 4, 'grid_y': 4, 'stride': 0}),
+    ('/multiple_runs', {'n': 10, 'grid_x': 4, 'grid_y': 6, 'n_sims': 100}),
+    ('/quantum_2d', {'number_qubits': 2, 'iterator': 0, 'sample_number': 10}),
+    ('/jobs/quantum_2d', {'number_qubits': 2, 'iterator': 0, 'sample_number': 10}),
+    ('/jobs/quantum_2d', {'number_qubits': 2, 'iterator': 2, 'sample_number': 10, 'precision': 'complex32'}),
+    ('/jobs/classical_animation', {'n': 10, 'grid_x': 4, 'grid_y': 4, 'stride': -1}),
+])
+def test_invalid_parameters_are_answered_with_400(client, route, body):
+    response = client.post(route, json=body)
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+
+def test_unknown_format_is_answered_with_400(client):
+    response = client.post('/jobs/multiple_runs?format=xml', json={'n': 10, 'grid_x': 4, 'grid_y': 4, 'n_sims': 100})
+    assert response.status_code == 400
+    assert 'xml' in response.get_json()['error']
+
+
+def test_internal_value_errors_are_answered_with_500(client, monkeypatch):
+    def broken(*args, **kwargs):
+        raise ValueError("internal detail")
+
+    monkeypatch.setattr(backend, 'expected_hitting_times', broken)
+    response = client.post('/hitting_times', json={'grid_x': 4, 'grid_y': 4, 'target_x': 1, 'target_y': 1})
+    assert response.status_code == 500
+    assert b'internal detail' not in response.data
+
+
+def test_coprime_non_square_grids_are_drawn(client):
+    response = client.post('/multiple_runs?format=json', json={'n': 10, 'grid_x': 3, 'grid_y': 5, 'n_sims': 100})
+    assert response.status_code == 200
+    occupancy = response.get_json()['occupancy']
+    assert len(occupancy) == 5 and len(occupancy[0]) == 3
+    assert sum(map(sum, occupancy)) == 100
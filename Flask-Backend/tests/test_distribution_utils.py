@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from classical_utils import compute_theoretical_distribution, generate_markov_chain_matrix
+from distribution_utils import circulant_kernel, exact_distribution, lattice_kernel
+from lattice_utils import ring_lattice, torus_lattice
+
+STEPS = [0, 1, 2, 7, 30]
+
+
+def ring_matrix(num_states: int) -> np.ndarray:
+    matrix = np.zeros((num_states, num_states))
+    for i in range(num_states):
+        matrix[i, (i - 1) % num_states] += 0.5
+        matrix[i, (i + 1) % num_states] += 0.5
+    return matrix
+
+
+def torus_matrix(grid_size) -> np.ndarray:
+    # Built move by move, as the walks on the torus are defined
+    m, n = grid_size
+    size = m * n
+    matrix = np.zeros((size, size))
+    for i in range(size):
+        if m == n:
+            x, y = i % m, i // n
+            neighbors = [(i + m) % size, (i - m) % size, y * m + (x - 1) % m, y * m + (x + 1) % m]
+        else:
+            neighbors = [(i - m) % size, (i + m) % size, (i - n) % size, (i + n) % size]
+        for neighbor in neighbors:
+            matrix[i, neighbor] += 0.25
+    return matrix
+
+
+def random_distribution(size: int, seed: int = 0) -> np.ndarray:
+    weights = np.random.default_rng(seed).random(size)
+    return weights / weights.sum()
+
+
+@pytest.mark.parametrize('steps', STEPS)
+@pytest.mark.parametrize('num_states', [2, 3, 8, 11])
+def test_ring_matches_matrix_power(num_states, steps):
+    initial = random_distribution(num_states)
+    expected = initial @ np.linalg.matrix_power(ring_matrix(num_states), steps)
+
+    lattice = ring_lattice(num_states)
+    assert lattice_kernel(lattice) is not None
+    np.testing.assert_allclose(exact_distribution(lattice, initial, steps), expected, atol=1e-12)
+    np.testing.assert_allclose(exact_distribution(ring_matrix(num_states), initial, steps), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('steps', STEPS)
+@pytest.mark.parametrize('grid_size', [(4, 4), (5, 5), (3, 5), (5, 3), (4, 6), (2, 7)])
+def test_torus_matches_matrix_power(grid_size, steps):
+    size = grid_size[0] * grid_size[1]
+    initial = random_distribution(size, seed=steps)
+    matrix = torus_matrix(grid_size)
+    expected = initial @ np.linalg.matrix_power(matrix, steps)
+
+    lattice = torus_lattice(grid_size)
+    np.testing.assert_allclose(lattice.transition_matrix().toarray(), matrix)
+    np.testing.assert_allclose(exact_distribution(lattice, initial, steps), expected, atol=1e-12)
+    for model in (matrix, sparse.csr_matrix(matrix)):
+        np.testing.assert_allclose(exact_distribution(model, initial, steps, shapes=[(grid_size[1], grid_size[0])]),
+                                   expected, atol=1e-12)
+
+
+def test_square_torus_matrix_is_block_circulant():
+    assert circulant_kernel(torus_matrix((4, 4)), (4, 4)) is not None
+    assert circulant_kernel(torus_matrix((4, 4)), (16,)) is None
+
+
+def test_non_circulant_chain_falls_back_to_matrix_products():
+    matrix = generate_markov_chain_matrix((3, 4))
+    assert circulant_kernel(matrix, (12,)) is None and circulant_kernel(matrix, (4, 3)) is None
+    initial = random_distribution(12)
+    for steps in STEPS:
+        np.testing.assert_allclose(exact_distribution(matrix, initial, steps, shapes=[(4, 3)]),
+                                   initial @ np.linalg.matrix_power(matrix, steps), atol=1e-12)
+
+
+def test_theoretical_distribution_starts_from_state_zero():
+    grid_size = (3, 5)
+    initial = np.zeros(15)
+    initial[0] = 1.0
+    df = compute_theoretical_distribution(np.arange(15), torus_lattice(grid_size), grid_size, 9, initial)
+    expected = initial @ np.linalg.matrix_power(torus_matrix(grid_size), 9)
+    np.testing.assert_allclose(df['Probability'].to_numpy(), expected, atol=1e-12)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from classical_utils import grid_transition_matrix_sparse
+from hitting_utils import expected_hitting_times, surely_hitting_states
+from lattice_utils import ring_lattice, torus_lattice
+from markov_utils import SparseMarkovChain
+
+
+def dense_hitting_times(matrix: np.ndarray, target_index: int):
+    # Every other state of an irreducible chain hits the target, straight from (I - Q) h = 1
+    others = np.flatnonzero(np.arange(len(matrix)) != target_index)
+    system = np.eye(len(others)) - matrix[np.ix_(others, others)]
+    expected = np.linalg.solve(system, np.ones(len(others)))
+    second = np.linalg.solve(system, 2 * expected - 1)
+    hitting_times, variances = np.zeros(len(matrix)), np.zeros(len(matrix))
+    hitting_times[others] = expected
+    variances[others] = second - expected ** 2
+    return hitting_times, variances
+
+
+@pytest.mark.parametrize('grid_size, target_index', [((4, 4), 5), ((5, 5), 0), ((3, 5), 7)])
+def test_torus_matches_dense_solve(grid_size, target_index):
+    lattice = torus_lattice(grid_size)
+    expected, variances = expected_hitting_times(lattice, target_index, second_moment=True)
+    dense_expected, dense_variances = dense_hitting_times(lattice.transition_matrix().toarray(), target_index)
+    np.testing.assert_allclose(expected, dense_expected, rtol=1e-9)
+    np.testing.assert_allclose(variances, dense_variances, rtol=1e-8)
+
+
+@pytest.mark.parametrize('teleport_prob', [0.0, 0.15])
+def test_grid_matches_dense_solve(teleport_prob):
+    chain = SparseMarkovChain(grid_transition_matrix_sparse((3, 4), teleport_prob), teleport_prob=teleport_prob)
+    expected, variances = expected_hitting_times(chain, 6, second_moment=True)
+    dense = chain.p.toarray() + teleport_prob / chain.size
+    dense_expected, dense_variances = dense_hitting_times(dense, 6)
+    np.testing.assert_allclose(expected, dense_expected, rtol=1e-9)
+    np.testing.assert_allclose(variances, dense_variances, rtol=1e-8)
+
+
+def test_teleport_reaches_the_target_of_a_reducible_chain():
+    # Two disconnected rings, the teleports alone connect them
+    ring = ring_lattice(4).transition_matrix()
+    chain = SparseMarkovChain(sparse.block_diag([ring, ring]) * 0.8, teleport_prob=0.2)
+    expected, _ = expected_hitting_times(chain, 1)
+    dense_expected, _ = dense_hitting_times(chain.p.toarray() + 0.2 / chain.size, 1)
+    assert np.isfinite(expected).all()
+    np.testing.assert_allclose(expected, dense_expected, rtol=1e-9)
+
+
+def test_states_that_can_miss_the_target_never_hit_it_in_expectation():
+    # State 1 reaches the target 0 or the absorbing state 2 with probability 1/2 each, state 3 only goes to 1,
+    # state 4 alternates with the target
+    matrix = np.array([[0.0, 1.0, 0.0, 0.0, 0.0],
+                       [0.5, 0.0, 0.5, 0.0, 0.0],
+                       [0.0, 0.0, 1.0, 0.0, 0.0],
+                       [0.0, 1.0, 0.0, 0.0, 0.0],
+                       [1.0, 0.0, 0.0, 0.0, 0.0]])
+    np.testing.assert_array_equal(surely_hitting_states(sparse.csr_matrix(matrix), 0), [True, False, False, False, True])
+    expected, variances = expected_hitting_times(matrix, 0, second_moment=True)
+    np.testing.assert_array_equal(expected, [0.0, np.inf, np.inf, np.inf, 1.0])
+    np.testing.assert_array_equal(variances, [0.0, np.inf, np.inf, np.inf, 0.0])
+
+
+def test_reducible_torus_hits_only_within_its_class():
+    # A 4x6 torus is a ring of 24 states moving by 4 or 6, the odd states never meet the even ones
+    lattice = torus_lattice((4, 6))
+    expected, _ = expected_hitting_times(lattice, 2)
+    assert np.isinf(expected[1::2]).all()
+    assert np.isfinite(expected[0::2]).all()
+
+    even = np.arange(0, 24, 2)
+    dense_expected, _ = dense_hitting_times(lattice.transition_matrix().toarray()[np.ix_(even, even)], 1)
+    np.testing.assert_allclose(expected[even], dense_expected, rtol=1e-9)
@@ -0,0 +1,74 @@
+import time
+import pytest
+from job_utils import JobQueue, JobStore
+
+
+def add_task(a, b, progress=None):
+    progress(0.5)
+    return {'sum': a + b}
+
+
+def failing_task(progress=None):
+    raise ValueError("bad parameter")
+
+
+def wait_until_finished(queue: JobQueue, job_id: str, timeout: float = 60.0) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status['state'] not in ('queued', 'running'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish in {timeout} seconds")
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs'), max_workers=1, ttl=3600)
+
+
+def test_job_lifecycle(queue, tmp_path):
+    job_id = queue.submit('add', add_task, 2, 3)
+    assert queue.status(job_id)['state'] in ('queued', 'running')
+
+    status = wait_until_finished(queue, job_id)
+    assert status['state'] == 'done' and status['kind'] == 'add' and status['error'] is None
+    assert status['progress'] == 1.0 and status['finished_at'] >= status['submitted_at']
+    assert queue.result(job_id) == {'sum': 5}
+    # A second web worker sharing the directory sees the same job
+    assert JobStore(str(tmp_path / 'jobs')).result(job_id) == {'sum': 5}
+
+    assert not queue.cancel(job_id)
+    queue.store.expire(-1)
+    assert queue.status(job_id) is None
+    with pytest.raises(FileNotFoundError):
+        queue.result(job_id)
+
+
+def test_failed_job_reports_its_error(queue):
+    job_id = queue.submit('fail', failing_task)
+    status = wait_until_finished(queue, job_id)
+    assert status['state'] == 'failed'
+    assert status['error'] == "ValueError: bad parameter"
+    with pytest.raises(FileNotFoundError):
+        queue.result(job_id)
+
+
+def test_cancelled_job_does_not_start(tmp_path):
+    store = JobStore(str(tmp_path))
+    store.create('queued', 'add')
+    assert store.status('queued')['state'] == 'queued'
+    assert store.cancel('queued')
+    assert not store.start('queued')
+    assert store.status('queued')['state'] == 'cancelled'
+
+    store.create('running', 'add')
+    assert store.start('running')
+    assert not store.cancel('running')
+    assert store.status('running')['state'] == 'running'
+
+
+def test_unknown_jobs(queue):
+    assert queue.status('0123abcd') is None
+    assert queue.status('../etc') is None
+    assert not queue.cancel('0123abcd')
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from scipy.stats import gaussian_kde
+from kde_utils import bandwidth_factor, binned_kde_2d, linear_binning
+
+
+def correlated_samples(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=n)
+    y = 0.6 * x + rng.normal(scale=0.8, size=n)
+    return x, y
+
+
+@pytest.mark.parametrize('bw_method', ['scott', 'silverman', 0.4])
+def test_bandwidth_factor_matches_gaussian_kde(bw_method):
+    x, y = correlated_samples(300)
+    assert bandwidth_factor(300, 2, bw_method) == pytest.approx(gaussian_kde(np.vstack([x, y]), bw_method=bw_method).factor)
+
+
+def test_bandwidth_factor_rejects_unknown_methods():
+    with pytest.raises(ValueError):
+        bandwidth_factor(300, 2, 'wide')
+
+
+def test_linear_binning_keeps_the_mass_and_the_mean():
+    x, y = correlated_samples(1000)
+    x_range, y_range = (x.min(), x.max()), (y.min(), y.max())
+    grid = linear_binning(x, y, x_range, y_range, 32)
+    assert grid.sum() == pytest.approx(1000)
+    # Linear weights put the centre of mass of every sample where the sample is
+    grid_x = np.linspace(*x_range, 32)
+    assert (grid.sum(axis=1) @ grid_x) / 1000 == pytest.approx(x.mean())
+
+
+@pytest.mark.parametrize('n, bw_method', [(500, 'scott'), (2000, 'silverman'), (1000, 0.3)])
+def test_binned_kde_matches_gaussian_kde(n, bw_method):
+    x, y = correlated_samples(n, seed=n)
+    xi, yi, density = binned_kde_2d(x, y, gridsize=128, bw_method=bw_method)
+
+    expected_x, expected_y = np.mgrid[x.min():x.max():128j, y.min():y.max():128j]
+    np.testing.assert_allclose(xi, expected_x)
+    np.testing.assert_allclose(yi, expected_y)
+    expected = gaussian_kde(np.vstack([x, y]), bw_method=bw_method)(np.vstack([xi.ravel(), yi.ravel()])).reshape(xi.shape)
+    # Binning moves every sample by at most one grid step, far less than the bandwidth
+    assert np.abs(density - expected).max() <= 0.01 * expected.max()
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from lattice_utils import torus_lattice
+from monte_carlo_utils import SHARD_SIZE, shard_sizes, sharded_simulation
+from test_accumulator_utils import assert_same_accumulators
+
+
+def test_shard_sizes():
+    assert shard_sizes(2 * SHARD_SIZE + 5) == [SHARD_SIZE, SHARD_SIZE, 5]
+    assert shard_sizes(SHARD_SIZE) == [SHARD_SIZE]
+    assert shard_sizes(0) == []
+
+
+@pytest.mark.parametrize('mode', ['final', 'all_steps'])
+def test_sharded_simulation_does_not_depend_on_workers(mode):
+    lattice = torus_lattice((5, 5))
+    n_sims = 2 * SHARD_SIZE + 100
+    runs = [sharded_simulation(lattice, 12, n_sims, target_index=7, seed=1234, workers=workers, mode=mode, snapshot_steps=(3, 12))
+            for workers in (1, 2)]
+
+    assert runs[0].seed == runs[1].seed == 1234
+    assert_same_accumulators(runs[0].accumulator, runs[1].accumulator)
+    assert runs[0].accumulator.walkers == n_sims
+    if mode == 'final':
+        assert runs[0].occupancy.sum() == n_sims
+    assert runs[0].accumulator.snapshots[3].sum() == n_sims
+
+
+def test_sharded_simulation_reproduces_its_seed():
+    lattice = torus_lattice((4, 4))
+    first = sharded_simulation(lattice, 8, 500, workers=1)
+    second = sharded_simulation(lattice, 8, 500, seed=str(first.seed), workers=1)
+    np.testing.assert_array_equal(first.occupancy, second.occupancy)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from quantum_utils import cirq, evolve_2d_walk, norm_drift, walk_circuits, walk_state_vector
+
+# Single precision state vectors drift by a few ulps per step
+TOLERANCES = {np.complex64: 1e-5, np.complex128: 1e-12}
+
+
+@pytest.mark.parametrize('dtype', [np.complex64, np.complex128])
+@pytest.mark.parametrize('steps', [0, 1, 5, 12])
+@pytest.mark.parametrize('dimension, number_qubits, is_y', [(1, 3, False), (1, 3, True), (1, 4, False), (2, 2, False), (2, 3, False)])
+def test_numpy_engine_matches_cirq(dimension, number_qubits, is_y, steps, dtype):
+    numpy_state = walk_state_vector(dimension, number_qubits, steps, is_y, engine='numpy', dtype=dtype)
+    cirq_state = walk_state_vector(dimension, number_qubits, steps, is_y, engine='cirq', dtype=dtype)
+    assert numpy_state.dtype == cirq_state.dtype == dtype
+    np.testing.assert_allclose(numpy_state, cirq_state, atol=TOLERANCES[dtype])
+    assert norm_drift(numpy_state) < 10 * TOLERANCES[dtype]
+
+
+@pytest.mark.parametrize('dimension, number_qubits, is_y', [(1, 3, False), (1, 3, True), (2, 2, False)])
+def test_engines_match_the_simulated_circuit(dimension, number_qubits, is_y):
+    initial, step_circuit, qubit_order, _ = walk_circuits(dimension, number_qubits, is_y)
+    circuit = initial + step_circuit * 4
+    expected = cirq.final_state_vector(circuit, qubit_order=qubit_order, dtype=np.complex128)
+    for engine in ('cirq', 'numpy'):
+        np.testing.assert_allclose(walk_state_vector(dimension, number_qubits, 4, is_y, engine=engine), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('dtype', [np.complex64, np.complex128])
+def test_2d_evolution_matches_between_engines(dtype):
+    numpy_run = evolve_2d_walk(2, 6, engine='numpy', dtype=dtype)
+    cirq_run = evolve_2d_walk(2, 6, engine='cirq', dtype=dtype)
+    np.testing.assert_allclose(np.array(numpy_run[0]), np.array(cirq_run[0]), atol=TOLERANCES[dtype])
+    np.testing.assert_allclose(numpy_run[2], cirq_run[2], atol=TOLERANCES[dtype])
+    np.testing.assert_allclose(numpy_run[2], walk_state_vector(2, 2, 6, engine='cirq', dtype=dtype), atol=TOLERANCES[dtype])
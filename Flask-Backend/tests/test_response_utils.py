@@ -0,0 +1,94 @@
+import io
+import numpy as np
+import pytest
+import app as backend
+from response_utils import NPZ_MEDIA_TYPE, RAW_JSON_MEDIA_TYPE, encode_raw, requested_raw_format
+from validation_utils import InvalidParameter
+
+ROUTES = {
+    '/classical_1d': ({'n': 20, 'n_states': 11, 'n_sims': 200}, {'occupancy': ('int32', [11])}),
+    '/multiple_runs': ({'n': 12, 'grid_x': 5, 'grid_y': 5, 'target_x': 1, 'target_y': 2, 'n_sims': 300}, {'occupancy': ('int32', [5, 5])}),
+    '/quantum': ({'number_qubits': 3, 'iterator': 4, 'sample_number': 100},
+                 {'position': ('int32', None), 'occurrences': ('int32', None), 'probability': ('float64', [8])}),
+    '/quantum_2d': ({'number_qubits': 2, 'iterator': 3, 'sample_number': 100},
+                    {'occupancy': ('int32', [4, 4]), 'frames': ('int32', [3, 4, 4]), 'probability': ('float64', [4, 4])}),
+    '/classical_animation': ({'n': 6, 'grid_x': 3, 'grid_y': 3, 'stride': 2},
+                             {'frame_steps': (None, [4]), 'frames': ('float64', [4, 3, 3]), 'tv_to_uniform': ('float64', [7])}),
+}
+
+
+@pytest.fixture
+def client():
+    return backend.app.test_client()
+
+
+@pytest.mark.parametrize('query, headers, expected', [
+    ('', {}, None),
+    ('?format=raw', {}, 'json'),
+    ('?format=json', {}, 'json'),
+    ('?format=npz', {'Accept': RAW_JSON_MEDIA_TYPE}, 'npz'),
+    ('', {'Accept': RAW_JSON_MEDIA_TYPE}, 'json'),
+    ('', {'Accept': NPZ_MEDIA_TYPE}, 'npz'),
+    ('', {'Accept': 'application/json, text/plain, */*'}, None),
+])
+def test_requested_raw_format(query, headers, expected):
+    with backend.app.test_request_context('/quantum' + query, headers=headers):
+        assert requested_raw_format() == expected
+
+
+def test_unknown_formats_are_invalid_parameters():
+    with backend.app.test_request_context('/quantum?format=xml'):
+        with pytest.raises(InvalidParameter):
+            requested_raw_format()
+
+
+def test_encode_raw_json():
+    result = encode_raw('json', {'counts': np.array([[1, 2], [3, 4]], dtype=np.int32), 'times': np.array([1.5, np.inf])}, n=3)
+    assert result['counts'] == [[1, 2], [3, 4]] and result['times'] == [1.5, None]
+    assert result['n'] == 3
+    assert result['dtypes'] == {'counts': 'int32', 'times': 'float64'}
+    assert result['shapes'] == {'counts': [2, 2], 'times': [2]}
+
+
+def test_encode_raw_npz():
+    archive = np.load(io.BytesIO(encode_raw('npz', {'counts': np.arange(6, dtype=np.int16).reshape(2, 3)}, n=3, seed=None)))
+    assert sorted(archive.files) == ['counts', 'n']
+    assert archive['counts'].dtype == np.int16 and archive['counts'].shape == (2, 3)
+    assert archive['n'] == 3
+
+
+@pytest.mark.parametrize('route', sorted(ROUTES))
+def test_raw_json_responses(client, route):
+    body, arrays = ROUTES[route]
+    response = client.post(route + '?format=raw', json=body)
+    assert response.status_code == 200
+    result = response.get_json()
+    for name, (dtype, shape) in arrays.items():
+        assert np.array(result[name]).shape == tuple(result['shapes'][name])
+        if dtype is not None:
+            assert result['dtypes'][name] == dtype
+        if shape is not None:
+            assert result['shapes'][name] == shape
+
+
+@pytest.mark.parametrize('route', sorted(ROUTES))
+def test_npz_responses(client, route):
+    body, arrays = ROUTES[route]
+    response = client.post(route, json=body, headers={'Accept': NPZ_MEDIA_TYPE})
+    assert response.status_code == 200 and response.mimetype == NPZ_MEDIA_TYPE
+    archive = np.load(io.BytesIO(response.data))
+    assert set(arrays) <= set(archive.files)
+    for name, (dtype, shape) in arrays.items():
+        if dtype is not None:
+            assert archive[name].dtype == np.dtype(dtype)
+        if shape is not None:
+            assert list(archive[name].shape) == shape
+
+
+def test_raw_occupancies_count_every_walker(client):
+    body, _ = ROUTES['/multiple_runs']
+    archive = np.load(io.BytesIO(client.post('/multiple_runs?format=npz', json=body).data))
+    assert archive['occupancy'].sum() == archive['n_sims'] == body['n_sims']
+    result = client.post('/quantum_2d?format=raw', json=ROUTES['/quantum_2d'][0]).get_json()
+    assert np.sum(result['probability']) == pytest.approx(1.0)
+    assert np.sum(result['occupancy']) == ROUTES['/quantum_2d'][0]['sample_number']
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import numpy as np
+import pytest
+from scipy import sparse
+import shared_store_utils
+from shared_store_utils import SharedArrayStore, csr_arrays, csr_from_arrays, shared_arrays, shared_csr_matrix
+
+
+def sample_arrays():
+    return {'values': np.linspace(0, 1, 11), 'counts': np.arange(7, dtype=np.int16).reshape(7, 1), 'empty': np.zeros(0, dtype=np.int64)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SharedArrayStore(str(tmp_path / 'store'), 2**20)
+    yield store
+    store.close()
+
+
+def test_round_trip(store):
+    built = sample_arrays()
+    first = store.get_or_build(('sample', 1), lambda: built)
+    second = store.get_or_build(('sample', 1), lambda: pytest.fail("The entry was built twice"))
+
+    for arrays in (first, second):
+        assert list(arrays) == list(built)
+        for name, array in built.items():
+            assert arrays[name].dtype == array.dtype and arrays[name].shape == array.shape
+            np.testing.assert_array_equal(arrays[name], array)
+            assert not arrays[name].flags.writeable
+            assert arrays[name].ctypes.data % 64 == 0 or not arrays[name].size
+    assert (store.builds, store.hits, store.misses) == (1, 1, 1)
+    assert store.get(('sample', 2)) is None
+    assert store.stats()['entries'] == 1
+
+
+def test_entries_too_large_for_the_store_are_not_shared(tmp_path):
+    store = SharedArrayStore(str(tmp_path / 'store'), 1024)
+    try:
+        arrays = store.get_or_build('large', lambda: {'values': np.ones(1000)})
+        assert arrays['values'].flags.writeable
+        assert store.get('large') is None
+    finally:
+        store.close()
+
+
+def test_unreferenced_entries_are_evicted(tmp_path):
+    store = SharedArrayStore(str(tmp_path / 'store'), 4000)
+    try:
+        kept = store.get_or_build('first', lambda: {'values': np.ones(200)})
+        store.get_or_build('second', lambda: {'values': np.ones(200)})
+        # 'second' is not referenced any more, 'first' is and survives
+        store.get_or_build('third', lambda: {'values': np.ones(200)})
+        assert store.evictions == 1
+        assert store.get('second') is None
+        np.testing.assert_array_equal(store.get('first')['values'], kept['values'])
+    finally:
+        store.close()
+
+
+def test_the_last_process_to_close_removes_the_store(tmp_path):
+    directory = tmp_path / 'store'
+    store = SharedArrayStore(str(directory), 2**20)
+    arrays = store.get_or_build('kept', sample_arrays)
+    store.close()
+    assert not directory.exists()
+    # The mappings stay valid after the files are gone
+    np.testing.assert_array_equal(arrays['values'], sample_arrays()['values'])
+
+
+def build_in_child(directory: str, queue):
+    store = SharedArrayStore(directory, 2**20)
+    arrays = store.get_or_build('shared', lambda: {'values': np.full(5, -1.0)})
+    queue.put((arrays['values'].tolist(), store.builds))
+    store.close()
+
+
+def test_entries_are_shared_between_processes(store):
+    store.get_or_build('shared', lambda: {'values': np.arange(5.0)})
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=build_in_child, args=(store.directory, queue))
+    process.start()
+    values, builds = queue.get(timeout=60)
+    process.join()
+    assert values == [0.0, 1.0, 2.0, 3.0, 4.0] and builds == 0
+    assert os.path.isdir(store.directory)
+
+
+def test_csr_round_trip(store, monkeypatch):
+    matrix = sparse.random(30, 20, density=0.2, format='csr', random_state=0)
+    np.testing.assert_array_equal(csr_from_arrays(csr_arrays(matrix, 'p_'), 'p_').toarray(), matrix.toarray())
+
+    monkeypatch.setattr(shared_store_utils, 'SHARED_STORE', store)
+    shared = shared_csr_matrix(('matrix', 30), lambda: matrix)
+    assert shared.shape == (30, 20)
+    np.testing.assert_array_equal(shared.toarray(), matrix.toarray())
+    assert shared_csr_matrix(('matrix', 30), lambda: pytest.fail("The matrix was built twice")).nnz == matrix.nnz
+
+
+def test_shared_arrays_without_a_store_builds_every_time(monkeypatch):
+    monkeypatch.setattr(shared_store_utils, 'SHARED_STORE', None)
+    built = []
+    shared_arrays('key', lambda: built.append(1) or {'values': np.ones(2)})
+    shared_arrays('key', lambda: built.append(1) or {'values': np.ones(2)})
+    assert len(built) == 2
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from classical_utils import generate_markov_chain_matrix, grid_transition_matrix_sparse
+from lattice_utils import ring_lattice, torus_lattice
+from markov_utils import SparseMarkovChain
+from spectral_utils import assign_mixing_time, chain_spectral_gap, lattice_eigenvalues, lattice_mixing_time, spectral_analysis
+
+
+def lattice_of(topology, size):
+    return torus_lattice(size) if topology == 'torus' else ring_lattice(size[0])
+
+
+def brute_force_gap(matrix: np.ndarray) -> float:
+    moduli = np.sort(np.abs(np.linalg.eigvals(matrix)))
+    return max(1 - moduli[-2], 0.0)
+
+
+def brute_force_mixing_time(matrix: np.ndarray, epsilon: float = 0.25, limit: int = 10000) -> int:
+    # The first step at which the walk from every start is within epsilon of uniform in total variation
+    power = np.eye(len(matrix))
+    for step in range(1, limit):
+        power = power @ matrix
+        if 0.5 * np.abs(power - 1 / len(matrix)).sum(axis=1).max() <= epsilon:
+            return step
+    raise AssertionError("The chain did not mix")
+
+
+@pytest.mark.parametrize('topology, size', [('ring', (5,)), ('ring', (6,)), ('torus', (4, 4)), ('torus', (5, 5)), ('torus', (3, 5))])
+def test_lattice_eigenvalues_match_dense_eigenvalues(topology, size):
+    lattice = lattice_of(topology, size)
+    dense = np.linalg.eigvals(lattice.transition_matrix().toarray())
+    closed_form = lattice_eigenvalues(lattice).ravel()
+    assert closed_form[0] == pytest.approx(1.0)
+    np.testing.assert_allclose(np.sort_complex(np.round(closed_form, 10)), np.sort_complex(np.round(dense, 10)), atol=1e-9)
+
+
+@pytest.mark.parametrize('topology, size', [('ring', (5,)), ('ring', (9,)), ('torus', (3, 3)), ('torus', (5, 5)), ('torus', (3, 5)), ('torus', (5, 7))])
+def test_ergodic_walks_match_brute_force(topology, size):
+    matrix = lattice_of(topology, size).transition_matrix().toarray()
+    summary = spectral_analysis(topology, size)
+    mixing_time = brute_force_mixing_time(matrix)
+
+    assert summary.ergodic
+    assert summary.spectral_gap == pytest.approx(brute_force_gap(matrix), abs=1e-9)
+    assert summary.relaxation_time == pytest.approx(1 / brute_force_gap(matrix))
+    assert summary.mixing_time == mixing_time
+    lower, upper = summary.mixing_time_bounds
+    assert lower <= mixing_time <= upper
+
+
+@pytest.mark.parametrize('topology, size', [('ring', (6,)), ('torus', (4, 4)), ('torus', (4, 6))])
+def test_periodic_or_reducible_walks_are_not_ergodic(topology, size):
+    summary = spectral_analysis(topology, size)
+    assert not summary.ergodic and summary.mixing_time is None
+    assert brute_force_gap(lattice_of(topology, size).transition_matrix().toarray()) == pytest.approx(0.0, abs=1e-9)
+
+
+def test_mixing_time_search_gives_up_past_its_limit():
+    lattice = ring_lattice(9)
+    mixing_time = brute_force_mixing_time(lattice.transition_matrix().toarray())
+    assert lattice_mixing_time(lattice, limit=mixing_time) == mixing_time
+    assert lattice_mixing_time(lattice, limit=1) is None
+
+
+def test_assign_mixing_time():
+    assert assign_mixing_time((5, 5)) == brute_force_mixing_time(torus_lattice((5, 5)).transition_matrix().toarray())
+    assert assign_mixing_time((4, 4)) == "The Markov chain is not ergodic"
+
+
+def test_teleporting_grid_gap_matches_dense_eigenvalues():
+    chain = SparseMarkovChain(grid_transition_matrix_sparse((4, 5)), teleport_prob=0.15)
+    assert chain_spectral_gap(chain) == pytest.approx(brute_force_gap(generate_markov_chain_matrix((4, 5))), abs=1e-7)
+    assert spectral_analysis('grid', (4, 5)).spectral_gap == pytest.approx(chain_spectral_gap(chain), abs=1e-7)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from classical_utils import get_target_coordinate
+from trajectory_utils import Trajectory, decode_states, encode_coordinates, split_trajectories, state_dtype
+
+
+def scalar_target_index(target_state, grid_size):
+    # The index get_target_index computed one target at a time before the codec
+    m, n = grid_size
+    x, y = target_state
+    if m == n:
+        return y * n + x
+    if m < n:
+        return (x * n - y * m) % (m * n)
+    return (y * m - x * n) % (m * n)
+
+
+@pytest.mark.parametrize('grid_size', [(1, 1), (4, 4), (7, 7)])
+def test_encode_coordinates_inverts_decode_states(grid_size):
+    states = np.arange(grid_size[0] * grid_size[1])
+    x, y = decode_states(states, grid_size)
+    assert x.min() >= 0 and x.max() < grid_size[0] and y.min() >= 0 and y.max() < grid_size[1]
+    np.testing.assert_array_equal(encode_coordinates(x, y, grid_size), states)
+
+
+@pytest.mark.parametrize('grid_size', [(4, 4), (3, 5), (5, 3), (4, 7)])
+def test_encode_coordinates_matches_the_scalar_index(grid_size):
+    x, y = np.meshgrid(np.arange(grid_size[0]), np.arange(grid_size[1]), indexing='ij')
+    expected = [scalar_target_index((i, j), grid_size) for i, j in zip(x.ravel(), y.ravel())]
+    np.testing.assert_array_equal(encode_coordinates(x.ravel(), y.ravel(), grid_size), expected)
+
+
+@pytest.mark.parametrize('grid_size', [(4, 4), (3, 5), (5, 3)])
+def test_decode_states_matches_get_target_coordinate(grid_size):
+    states = np.arange(grid_size[0] * grid_size[1])
+    x, y = decode_states(states, grid_size)
+    assert [f"{i}, {j}" for i, j in zip(x, y)] == [get_target_coordinate(int(state), grid_size) for state in states]
+
+
+def test_decode_states_on_a_ring():
+    states = np.array([[0, 3], [5, 1]])
+    (positions,) = decode_states(states, (6,))
+    np.testing.assert_array_equal(positions, states)
+
+
+def test_state_dtype():
+    assert state_dtype(65536) == np.uint16
+    assert state_dtype(65537) == np.uint32
+    assert state_dtype(2**32 + 1) == np.uint64
+
+
+def test_split_trajectories_stops_at_the_hitting_time():
+    walks = np.array([[0, 1, 2, 3], [0, 3, 0, 3]])
+    trajectories = split_trajectories(walks, np.array([2, -1]), (2, 2))
+
+    assert [len(trajectory) for trajectory in trajectories] == [3, 4]
+    assert [trajectory.hitting_time for trajectory in trajectories] == [2, None]
+    assert trajectories[0].states.dtype == np.uint16
+    assert list(trajectories[0]) == [0, 1, 2] and trajectories[1].labels() == ['0', '3', '0', '3']
+    np.testing.assert_array_equal(np.asarray(trajectories[1]), walks[1])
+
+
+def test_trajectory_coordinates_and_slices():
+    trajectory = Trajectory([0, 5, 10, 15], (4, 4))
+    x, y = trajectory.coordinates()
+    np.testing.assert_array_equal(x, [0, 1, 2, 3])
+    np.testing.assert_array_equal(y, [0, 1, 2, 3])
+    assert trajectory[1] == 5
+    assert isinstance(trajectory[1:3], Trajectory) and list(trajectory[1:3]) == [5, 10]
@@ -0,0 +1,130 @@
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+
+def state_dtype(n_states: int) -> np.dtype:
+    """
+    Picks the smallest unsigned integer type that holds the index of every state.
+
+    Args:
+        n_states: The number of states of the walk.
+
+    Returns:
+        np.dtype: uint16, uint32 or uint64.
+    """
+    for dtype in (np.uint16, np.uint32):
+        if n_states <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def decode_states(states: np.ndarray, grid_size: Sequence[int]) -> Tuple[np.ndarray, ...]:
+    """
+    Converts state indexes into coordinates, the array version of get_target_coordinate.
+
+    Args:
+        states: The state indexes, any shape.
+        grid_size: (m, n) for a torus, (n_states,) for a ring.
+
+    Returns:
+        tuple: The x and y coordinates on a torus, the positions on a ring.
+    """
+    states = np.asarray(states).astype(np.int64, copy=False)
+    if len(grid_size) == 1:
+        return (states,)
+    m, n = grid_size
+    if m == n:
+        return states % m, states // n
+    return states % m, states % n
+
+
+def encode_coordinates(x: np.ndarray, y: np.ndarray, grid_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Converts torus coordinates into state indexes, the array version of get_target_index.
+
+    Args:
+        x: The x coordinates.
+        y: The y coordinates.
+        grid_size: A tuple representing the size of the torus grid (m, n).
+
+    Returns:
+        np.ndarray: The state indexes.
+    """
+    x = np.asarray(x).astype(np.int64, copy=False)
+    y = np.asarray(y).astype(np.int64, copy=False)
+    m, n = grid_size
+    if m == n:
+        return y * n + x
+    if m < n:
+        return (x * n - y * m) % (m * n)
+    return (y * m - x * n) % (m * n)
+
+
+class Trajectory:
+    """
+    A walk stored as a compact array of state indexes, with the size of the grid it was walked on.
+
+    The states take 2 bytes per step on grids of up to 65536 states and 4 bytes beyond, and convert to
+    coordinates with decode_states for the whole walk at once.
+
+    Args:
+        states: The state indexes in the order they were visited.
+        grid_size: (m, n) for a torus, (n_states,) for a ring.
+        hitting_time: The step the target was reached at, None if it was not searched for or not reached.
+    """
+
+    def __init__(self, states: np.ndarray, grid_size: Sequence[int], hitting_time: Optional[int] = None):
+        self.grid_size = tuple(int(length) for length in grid_size)
+        self.states = np.asarray(states).astype(state_dtype(int(np.prod(self.grid_size))), copy=False)
+        self.hitting_time = hitting_time
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.states.tolist())
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, 'Trajectory']:
+        if isinstance(index, slice):
+            return Trajectory(self.states[index], self.grid_size)
+        return int(self.states[index])
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        return self.states if dtype is None else self.states.astype(dtype)
+
+    def __repr__(self) -> str:
+        return f"Trajectory({self.states.tolist()}, grid_size={self.grid_size})"
+
+    def coordinates(self) -> Tuple[np.ndarray, ...]:
+        """
+        Returns the coordinates of every step, x and y on a torus and the positions on a ring.
+        """
+        return decode_states(self.states, self.grid_size)
+
+    def labels(self) -> List[str]:
+        """
+        Returns the states as strings, the form walks are sent to the frontend in.
+        """
+        return [str(state) for state in self.states.tolist()]
+
+
+def split_trajectories(walks: np.ndarray, hitting_times: np.ndarray, grid_size: Sequence[int]) -> List[Trajectory]:
+    """
+    Turns the walks recorded by Lattice.simulate into trajectories ending at their hitting time.
+
+    The walks are converted to the compact state type once and every trajectory is a view of them.
+
+    Args:
+        walks: The (n_sims, n + 1) array of state indexes.
+        hitting_times: The hitting time of every walk, -1 if the target was not reached.
+        grid_size: (m, n) for a torus, (n_states,) for a ring.
+
+    Returns:
+        List[Trajectory]: One trajectory per walk.
+    """
+    walks = np.asarray(walks).astype(state_dtype(int(np.prod(grid_size))), copy=False)
+    trajectories = []
+    for walk, hitting_time in zip(walks, np.asarray(hitting_times).tolist()):
+        length = hitting_time + 1 if hitting_time >= 0 else len(walk)
+        trajectories.append(Trajectory(walk[:length], grid_size, hitting_time if hitting_time >= 0 else None))
+    return trajectories
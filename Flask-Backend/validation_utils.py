@@ -0,0 +1,6 @@
+class InvalidParameter(ValueError):
+    """
+    Raised for a request parameter that is unknown or out of range, the routes answer it with 400 and its message.
+
+    Other exceptions, ValueError included, are errors of the backend and answered with 500.
+    """